@@ -0,0 +1,136 @@
+"""
+Benchmarks `vingd.util` time utilities against their previous (reference)
+implementations, checking that results are identical.
+
+Usage::
+
+    python benchmarks/bench_util.py [-n ROUNDS]
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import timeit
+from datetime import datetime, timedelta, tzinfo
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from vingd import util
+from vingd.util import tzutc, tzoffset
+
+
+# reference implementations (as of vingd 0.1.x)
+
+class ref_tzutc(tzinfo):
+    def utcoffset(self, dt):
+        return timedelta(0)
+    def dst(self, dt):
+        return timedelta(0)
+    def tzname(self, dt):
+        return "UTC"
+
+def ref_now():
+    return datetime.now(ref_tzutc())
+
+def ref_parse_duration(string):
+    string = string.replace(' ', '').upper()
+    match = re.match(
+        "^P(?:(?:(?P<years>\\d+)Y)?(?:(?P<months>\\d+)M)?(?:(?P<days>\\d+)D)?)?" \
+        "(?:T(?:(?P<hours>\\d+)H)?(?:(?P<minutes>\\d+)M)?(?:(?P<seconds>\\d+)S)?)?$",
+        string
+    )
+    if match:
+        d = match.groupdict(0)
+        return dict(zip(d.keys(), map(int, d.values())))
+    match = re.match("^P(?P<weeks>\\d+)W$", string)
+    if match:
+        d = match.groupdict(0)
+        return dict(zip(d.keys(), map(int, d.values())))
+    match = re.match(
+        "^P(?P<years>\\d{4})(-)?(?P<months>\\d{2})(?(2)-)(?P<days>\\d{2})T(?P<hours>\\d{2})(?(2):)(?P<minutes>\\d{2})(?(2):)(?P<seconds>\\d{2})$",
+        string
+    )
+    if match:
+        d = match.groupdict(0)
+        return dict(zip(d.keys(), map(int, d.values())))
+    return {}
+
+def ref_isobasic(x):
+    return x.strftime("%Y%m%dT%H%M%S%z")
+
+def ref_parse_isotime(string):
+    match = re.match(
+        "^(\\d{4})-?(\\d{2})-?(\\d{2})[T ](\\d{2}):?(\\d{2}):?(\\d{2})(?:\\.(\\d{1,6})\\d*)?" \
+        "(Z|[-+]\\d{2}(?::?\\d{2})?)?$",
+        string.strip()
+    )
+    if not match:
+        raise ValueError("Invalid ISO8601 timestamp: '%s'." % string)
+    parts = match.groups()
+    fields = [int(x) for x in parts[:6]]
+    micro = int((parts[6] or '0').ljust(6, '0'))
+    zone = parts[7]
+    if not zone or zone == 'Z':
+        tz = ref_tzutc()
+    else:
+        minutes = int(zone[1:3]) * 60 + int(zone[3:].lstrip(':') or 0)
+        tz = tzoffset(-minutes if zone[0] == '-' else minutes)
+    return datetime(*fields, microsecond=micro, tzinfo=tz)
+
+
+def data(size):
+    rnd = random.Random(42)
+    zones = [tzutc(), tzoffset(120), tzoffset(-330), None]
+    start = datetime(2012, 1, 1)
+    dts = [(start + timedelta(seconds=rnd.randint(0, 10**8))).replace(
+        tzinfo=rnd.choice(zones)) for _ in range(size)]
+    # history normalization: few distinct durations, repeated many times
+    durations = [rnd.choice(['P1D', 'P 1y 1m T 2m 1s', 'P12W', 'PT15M', 'P7D',
+                             'P00010203T030201', 'P 0001-02-03 T 03:02:01', 'bogus'])
+                 for _ in range(size)]
+    stamps = [util.format_isobasic(dt) if dt.tzinfo else dt.isoformat() + 'Z'
+              for dt in dts]
+    return dts, durations, stamps
+
+
+def bench(name, reference, optimized, rounds):
+    ref = min(timeit.repeat(reference, number=1, repeat=rounds))
+    opt = min(timeit.repeat(optimized, number=1, repeat=rounds))
+    print("%-28s %10.1f ms %10.1f ms %7.1fx" % (name, ref * 1e3, opt * 1e3, ref / opt))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('-n', '--rounds', type=int, default=5)
+    parser.add_argument('--size', type=int, default=100000)
+    args = parser.parse_args(argv)
+
+    dts, durations, stamps = data(args.size)
+
+    # identical results
+    assert [ref_parse_duration(d) for d in durations] == util.parse_durations(durations)
+    assert [ref_parse_duration(d) for d in durations] == [util.parse_duration(d) for d in durations]
+    assert [ref_isobasic(dt) for dt in dts] == util.format_isobasic_many(dts)
+    assert [ref_isobasic(dt) for dt in dts] == [util.format_isobasic(dt) for dt in dts]
+    assert [ref_parse_isotime(s) for s in stamps] == [util.parse_isotime(s) for s in stamps]
+    assert util.safeformat("{:isobasic}", dts[0]) == ref_isobasic(dts[0])
+    print("results identical (%d items)\n" % args.size)
+
+    print("%-28s %13s %13s %8s" % ('', 'reference', 'optimized', 'speedup'))
+    bench('now', lambda: [ref_now() for _ in range(args.size)],
+          lambda: [util.now() for _ in range(args.size)], args.rounds)
+    bench('parse_duration', lambda: [ref_parse_duration(d) for d in durations],
+          lambda: [util.parse_duration(d) for d in durations], args.rounds)
+    bench('parse_durations', lambda: [ref_parse_duration(d) for d in durations],
+          lambda: util.parse_durations(durations), args.rounds)
+    bench('format_isobasic', lambda: [ref_isobasic(dt) for dt in dts],
+          lambda: [util.format_isobasic(dt) for dt in dts], args.rounds)
+    bench('format_isobasic_many', lambda: [ref_isobasic(dt) for dt in dts],
+          lambda: util.format_isobasic_many(dts), args.rounds)
+    bench('parse_isotime', lambda: [ref_parse_isotime(s) for s in stamps],
+          lambda: [util.parse_isotime(s) for s in stamps], args.rounds)
+
+
+if __name__ == '__main__':
+    main()
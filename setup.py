@@ -14,6 +14,7 @@ setup(
     url=vingd.__url__,
     packages=[vingd.__name__],
     package_dir={vingd.__name__: vingd.__name__},
+    scripts=['bin/vingd'],
     license=vingd.__license__,
     classifiers=[
         'Development Status :: 5 - Production/Stable',
@@ -0,0 +1,23 @@
+import asyncio
+import sys
+import warnings
+
+import pytest
+
+from .util import client, ok
+
+pytestmark = pytest.mark.skipif(sys.version_info < (3, 7), reason="requires asyncio.run")
+
+
+def test_async_calls():
+    from vingd.aio import AsyncVingd
+    v = AsyncVingd(client(lambda *request: ok({'name': 'user'})), max_workers=4)
+
+    async def run():
+        return await asyncio.gather(*[v.get_user_profile() for _ in range(8)])
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('error', DeprecationWarning)
+        assert asyncio.run(run()) == [{'name': 'user'}] * 8
+    assert v.api_key == 'user'
+    v.close()
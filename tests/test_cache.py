@@ -0,0 +1,21 @@
+import json
+
+from .util import client
+
+
+def test_conditional_get_revalidation():
+    requests = []
+    def handler(verb, path, headers, body):
+        requests.append(headers.get('If-None-Match'))
+        if headers.get('If-None-Match') == '"v1"':
+            return 304, b'', {'ETag': '"v1"'}
+        return 200, json.dumps({'data': {'name': 'user'}}), {'ETag': '"v1"'}
+    v = client(handler, cache=True)
+    assert v.get_user_profile() == {'name': 'user'} and not v.revalidated
+    assert v.get_user_profile() == {'name': 'user'} and v.revalidated
+    assert requests == [None, '"v1"']
+    assert v.cache.stats['revalidated'] == 1
+    # evicted in the meantime: fetched again, unconditionally
+    v.cache.invalidate()
+    assert v.get_user_profile() == {'name': 'user'}
+    assert requests[-2:] == ['"v1"', None]
@@ -0,0 +1,52 @@
+import io
+import json
+from datetime import datetime
+
+from vingd.campaign import Campaign
+from vingd.records import Voucher
+
+from .util import client
+
+
+def test_write_non_json_results():
+    out, err = io.StringIO(), io.StringIO()
+    stats = {'succeeded': 0, 'failed': 0}
+    batch = [
+        (1, {'ts': datetime(2020, 1, 2, 3, 4, 5)}, None),
+        (2, Voucher({'vid': 3, 'gid': 'g'}), None),
+        (3, None, {'type': 'InternalError', 'message': 'down'})
+    ]
+    Campaign._write(batch, out, err, stats, None)
+    results = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert results == [
+        {'id': 1, 'result': {'ts': '2020-01-02 03:04:05'}},
+        {'id': 2, 'result': {'vid': 3, 'gid': 'g'}}
+    ]
+    assert json.loads(err.getvalue())['id'] == 3
+    assert stats == {'succeeded': 2, 'failed': 1}
+
+
+def test_reward_not_resent_on_resume(tmp_path):
+    from vingd import campaign
+    sent = []
+    def handler(verb, path, headers, body):
+        sent.append(headers.get('Idempotency-Key'))
+        if len(sent) == 2:
+            return 500, json.dumps({'message': 'lost', 'context': 'Internal error'})
+        return 200, json.dumps({'data': {'transfer_id': len(sent)}})
+    v = client(handler)
+    ledger = str(tmp_path / 'ledger.db')
+    rows = [{'id': 1, 'huid': 'a1', 'amount': '10'}, {'id': 2, 'huid': 'b2', 'amount': '20'}]
+
+    campaign._init_worker(v, 'reward', None, 1, 'spring', ledger)
+    first = campaign._run_batch(rows)
+    assert first[0] == (1, {'transfer_id': 1}, None)
+    assert first[1][2]['type'] == 'InternalError'
+    assert sent == ['spring:1', 'spring:2']
+
+    # crashed before `results` were written: run again
+    campaign._init_worker(v, 'reward', None, 1, 'spring', ledger)
+    second = campaign._run_batch(rows)
+    assert second[0] == (1, {'transfer_id': 1}, None)
+    assert second[1][2]['context'] == 'Uncertain reward'
+    assert len(sent) == 2
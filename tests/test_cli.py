@@ -0,0 +1,57 @@
+import io
+import json
+
+from vingd import cli
+
+from .util import client, ok
+
+
+def test_revoke_rejects_empty_voucher_ids():
+    requests = []
+    def handler(verb, path, headers, body):
+        requests.append((verb, path))
+        return ok({'abc': 1})
+    rows = ['"abc"', 'null', '""', '{"vid_encoded": null}', '{}', '7']
+    args = cli.parser().parse_args(['revoke'])
+    args.input, args.output = io.StringIO('\n'.join(rows)), io.StringIO()
+    failed = cli.cmd_revoke(client(handler), args)
+    output = [json.loads(line) for line in args.output.getvalue().splitlines()]
+    assert failed == 5
+    assert requests == [('DELETE', '/broker/v1/vouchers/abc')]
+    assert sorted(row['error']['type'] for row in output if 'error' in row) == ['InvalidData'] * 5
+
+
+def test_malformed_lines_reported_as_failed_rows():
+    args = cli.parser().parse_args(['create-vouchers'])
+    args.input = io.StringIO('{"amount": 100}\n{"amount": \n\n{"amount": 200}\n')
+    args.output = io.StringIO()
+    failed = cli.cmd_create_vouchers(client(lambda *a: ok({'vid_encoded': 'abc'})), args)
+    output = [json.loads(line) for line in args.output.getvalue().splitlines()]
+    assert failed == 1 and len(output) == 3
+    error, = [row for row in output if 'error' in row]
+    assert error['input'] == '{"amount": '
+    assert error['error']['type'] == 'InvalidData' and 'line 2' in error['error']['message']
+
+
+def test_balances_looked_up_in_bulk():
+    requests = []
+    def handler(verb, path, headers, body):
+        requests.append(path)
+        if path.endswith('/bad'):
+            return 404, json.dumps({'message': 'No such user.', 'context': 'Not found'})
+        return ok({'balance': 100})
+    rows = ['"a1"', '{"huid": "a1"}', '"bad"', '{"huid": null}', '{"huid": ', '7']
+    args = cli.parser().parse_args(['balances'])
+    args.input, args.output = io.StringIO('\n'.join(rows)), io.StringIO()
+    failed = cli.cmd_balances(client(handler), args)
+    output = [json.loads(line) for line in args.output.getvalue().splitlines()]
+    assert failed == 4
+    assert sorted(requests) == ['/broker/v1/fort/accounts/a1', '/broker/v1/fort/accounts/bad']
+    assert [row.get('result') for row in output] == [100, 100, None, None, None, None]
+    assert [row['error']['type'] for row in output[2:]] == ['NotFound'] + ['InvalidData'] * 3
+
+
+def test_input_only_for_commands_reading_it():
+    for command in ('history', 'campaign reward file.csv'):
+        assert not hasattr(cli.parser().parse_args(command.split()), 'input')
+    assert hasattr(cli.parser().parse_args(['balances']), 'input')
@@ -0,0 +1,86 @@
+import json
+import os
+import pickle
+import select
+import signal
+
+import pytest
+
+from vingd import Vingd
+from vingd.exceptions import NotFound
+from vingd.limiter import AdaptiveLimit
+from vingd.profiling import Profiler
+from vingd.scheduler import BULK
+from vingd.tracing import Tracer
+
+from .util import client, ok
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason="fork() not available")
+def test_fork_rebuilds_policies():
+    v = client(limiter=AdaptiveLimit(initial=1), scheduler=True, cache=True)
+    limiter, scheduler, cache = v.limiter, v.scheduler, v.cache
+    # a request in flight (and the limiter's lock held) at fork time
+    limiter.acquire()
+    scheduler.acquire()
+    held = limiter._cond.acquire()
+    read, write = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        try:
+            fresh = (v.limiter is not limiter and v.limiter.inflight == 0
+                     and v.limiter.initial == 1
+                     and v.scheduler is not scheduler and v.scheduler._inflight == 0
+                     and v.cache is not cache)
+            if fresh:
+                v.get_user_profile()
+            os.write(write, b'1' if fresh else b'0')
+        finally:
+            os._exit(0)
+    limiter._cond.release()
+    os.close(write)
+    ready, _, _ = select.select([read], [], [], 10)
+    result = os.read(read, 1) if ready else None
+    if result is None:
+        os.kill(pid, signal.SIGKILL)
+    os.waitpid(pid, 0)
+    assert held and result == b'1'
+
+
+def test_pickle_keeps_configuration():
+    v = Vingd(key='key', secret='secret', endpoint=['https://a/broker/v1', 'https://b/broker/v1'],
+              frontend='https://www.example.com', compress_min_size=100, cache=True,
+              pool_size=4, timeout=5, health_interval=30, hedging=True,
+              limiter=AdaptiveLimit(initial=2), scheduler=True, records=True,
+              profiler=Profiler(), tracer=Tracer(), default_priority=BULK,
+              dns_ttl=60, balance_ttl=1)
+    v.profiler.start('x')
+    v.profiler.stop()
+    copy = pickle.loads(pickle.dumps(v))
+    state = copy.__getstate__()
+    assert sorted(state) == sorted(v.__getstate__())
+    for name in ('key', 'secret', 'endpoint', 'frontend', 'compress_min_size',
+                 'pool_size', 'timeout', 'health_interval', 'records',
+                 'default_priority', 'dns_ttl', 'balance_ttl'):
+        assert state[name] == v.__getstate__()[name], name
+    assert copy.limiter.initial == 2 and copy.limiter is not v.limiter
+    assert copy.scheduler.capacity == v.scheduler.capacity
+    assert copy.cache is not None and copy.hedging is not None
+    assert copy.profiler.enabled and copy.profiler.stats() == {}
+    assert isinstance(copy.tracer, Tracer)
+    assert copy.resolver.cache.ttl == 60 and copy.balances.ttl == 1
+    copy.close()
+    v.close()
+
+
+def test_bulk_balances_report_failed_huids():
+    def handler(verb, path, headers, body):
+        if path.endswith('/bad'):
+            return 404, json.dumps({'message': 'No such user.', 'context': 'Not found'})
+        return ok({'balance': len(path)})
+    v = client(handler)
+    result = v.authorized_get_account_balances(['a1', 'bad', 'b2', 'a1'])
+    assert result['balances'] == {'a1': len('/broker/v1/fort/accounts/a1'),
+                                  'b2': len('/broker/v1/fort/accounts/b2')}
+    assert list(result['errors']) == ['bad']
+    assert isinstance(result['errors']['bad'], NotFound)
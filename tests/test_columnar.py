@@ -0,0 +1,87 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+numpy = pytest.importorskip('numpy')
+
+from vingd.columnar import (Categorical, MISSING, history_table, objects_table,
+                            _timestamps)
+from vingd.util import parse_isotime, timestamp
+
+
+def us(value):
+    return int(round(timestamp(parse_isotime(value)) * 1e6))
+
+
+def test_categorical():
+    column = Categorical.encode(['a', None, 'b', 'a'])
+    assert column.codes.tolist() == [0, -1, 1, 0]
+    assert column.values().tolist() == ['a', None, 'b', 'a']
+    assert column[1] is None and column[2] == 'b'
+    assert (column == 'a').tolist() == [True, False, False, True]
+    assert (column != 'a').tolist() == [False, True, True, False]
+    assert (column == 'x').tolist() == [False] * 4
+    assert column.isin(['b', 'x']).tolist() == [False, False, True, False]
+    assert column.counts() == {'a': 2, 'b': 1}
+    assert column[numpy.array([2, 3])].values().tolist() == ['b', 'a']
+
+
+def test_timestamps_bulk_and_fallback():
+    values = ['2013-01-01T10:00:00Z', '2013-01-01T10:00:00.5+00:00',
+              '2013-01-01T10:00:00', None, '',
+              '2013-01-01T12:00:00+02:00', '2013-01-01T10:00:00.123456-0130',
+              '20130101T100000+0000']
+    out = _timestamps(values)
+    assert out.dtype == numpy.dtype('datetime64[us]')
+    assert numpy.isnat(out[3]) and numpy.isnat(out[4])
+    expected = [v for i, v in enumerate(values) if i not in (3, 4)]
+    parsed = out[[0, 1, 2, 5, 6, 7]].astype(numpy.int64).tolist()
+    # the same as parsing them one by one (non-UTC offsets converted to UTC)
+    assert parsed == [us(v) for v in expected]
+    assert parsed[3] == parsed[0]
+
+
+def test_invalid_timestamps_rejected():
+    # month 13 is matched by the bulk pattern, but rejected by NumPy (and
+    # then by the one by one fallback)
+    with pytest.raises(ValueError):
+        _timestamps(['2013-01-01T10:00:00Z', '2013-13-01T10:00:00Z'])
+
+
+def entry(gid, amount, day, action='use'):
+    return {'id': 1, 'gid': gid, 'action': action, 'amount_vouched': amount,
+            'ts_created': '2013-01-%02dT10:00:00Z' % day}
+
+
+def test_group_sum():
+    table = history_table([entry('a', 10, 1), entry('a', 20, 1), entry('b', 5, 1),
+                           entry(None, 7, 2), entry('a', 1, 2)])
+    daily = table.group_sum(['gid', table.day('ts_created')], 'amount_vouched')
+    rows = dict(((gid, day), (total, count)) for gid, day, total, count in zip(
+        daily['gid'].values(), daily['day'].astype(str), daily['sum'].tolist(),
+        daily['count'].tolist()))
+    assert rows == {('a', '2013-01-01'): (30, 2), ('b', '2013-01-01'): (5, 1),
+                    (None, '2013-01-02'): (7, 1), ('a', '2013-01-02'): (1, 1)}
+    assert daily['sum'].dtype == numpy.int64
+
+
+def test_group_sum_leaves_out_missing_values():
+    table = history_table([entry('a', 10, 1), entry('a', None, 1), entry('b', None, 1)])
+    assert table['amount_vouched'].tolist() == [10, MISSING, MISSING]
+    sums = table.group_sum(['gid'], 'amount_vouched')
+    result = dict(zip(sums['gid'].values(), zip(sums['sum'].tolist(), sums['count'].tolist())))
+    assert result == {'a': (10, 2), 'b': (0, 1)}
+
+
+def test_group_sum_empty():
+    table = history_table([])
+    sums = table.group_sum(['gid', table.day('ts_created')], 'amount_vouched')
+    assert len(sums) == 0 and sums.keys()
+
+
+def test_objects_table():
+    table = objects_table({'oid': 1, 'uid': 2, 'description': {'name': 'n', 'url': 'u'},
+                           'timestamp_created': '2013-01-01T10:00:00+00:00',
+                           'timestamp_modified': None})
+    assert table['oid'].tolist() == [1] and table['name'][0] == 'n'
+    assert numpy.isnat(table['timestamp_modified'][0])
@@ -0,0 +1,17 @@
+import gzip
+import json
+
+import pytest
+
+from vingd.exceptions import InternalError
+
+from .util import client
+
+
+def test_compressed_responses():
+    body = gzip.compress(json.dumps({'data': {'name': 'user'}}).encode())
+    v = client(lambda *request: (200, body, {'Content-Encoding': 'gzip'}))
+    assert v.get_user_profile() == {'name': 'user'}
+    v = client(lambda *request: (200, b'?', {'Content-Encoding': 'br'}))
+    with pytest.raises(InternalError):
+        v.get_user_profile()
@@ -0,0 +1,41 @@
+try:
+    import httplib
+except ImportError:
+    import http.client as httplib
+
+import pytest
+
+from vingd.exceptions import InternalError
+from vingd.pool import ConnectError
+
+from .util import Hosts, hosts_client, ok
+
+
+def refuse(verb, path, headers, body):
+    raise ConnectError("Connection refused.")
+
+
+def drop(verb, path, headers, body):
+    raise httplib.BadStatusLine('')
+
+
+def test_failover_on_connect_error():
+    transport = Hosts(a=refuse, b=lambda *request: ok({'transfer_id': 1}))
+    v = hosts_client(transport)
+    assert v.reward_user('abcd', 100) == {'transfer_id': 1}
+    assert [host for host, verb, path in transport.requests] == ['a', 'b']
+    assert not v.endpoints.primary.healthy
+    # failed endpoint is skipped afterwards
+    v.get_user_profile()
+    assert transport.requests[-1][0] == 'b'
+
+
+def test_failover_after_send_only_idempotent():
+    transport = Hosts(a=drop, b=lambda *request: ok({'transfer_id': 1}))
+    with pytest.raises(InternalError):
+        hosts_client(transport).reward_user('abcd', 100)
+    assert [host for host, verb, path in transport.requests] == ['a']
+
+    transport = Hosts(a=drop, b=lambda *request: ok({'name': 'user'}))
+    assert hosts_client(transport).get_user_profile() == {'name': 'user'}
+    assert [host for host, verb, path in transport.requests] == ['a', 'b']
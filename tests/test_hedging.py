@@ -0,0 +1,21 @@
+import time
+
+from vingd.hedging import HedgePolicy
+
+from .util import Hosts, hosts_client, ok
+
+
+def test_hedged_request():
+    def slow(verb, path, headers, body):
+        time.sleep(0.5)
+        return ok({'endpoint': 'a'})
+    transport = Hosts(a=slow, b=lambda *request: ok({'endpoint': 'b'}))
+    v = hosts_client(transport, hedging=HedgePolicy(max_delay=0.05))
+    started = time.time()
+    assert v.get_user_profile() == {'endpoint': 'b'}
+    assert time.time() - started < 0.4
+    assert v.hedging.stats['hedged'] == v.hedging.stats['hedge_wins'] == 1
+    # not hedged: non read-only calls
+    started = time.time()
+    v.reward_user('abcd', 100)
+    assert time.time() - started >= 0.5 and v.hedging.stats['hedged'] == 1
@@ -0,0 +1,82 @@
+from datetime import datetime, timedelta
+
+try:
+    from urllib import unquote
+except ImportError:
+    from urllib.parse import unquote
+
+from vingd.history import VoucherHistory
+from vingd.util import parse_isotime, tzutc
+
+from .util import client, ok
+
+
+BASE = datetime(2013, 1, 1, tzinfo=tzutc())
+
+
+def entry(id, seconds):
+    return {'id': id, 'vid': id, 'vid_encoded': 'v%d' % id, 'action': 'add',
+            'gid': None, 'uid_from': 1, 'uid_to': None, 'amount_vouched': 100,
+            'ts_created': (BASE + timedelta(seconds=seconds)).isoformat(),
+            'ts_valid_until': (BASE + timedelta(days=7)).isoformat()}
+
+
+class Log(object):
+    """Voucher log API (``vouchers/history/<filters>``) handler: entries
+    oldest first, timestamp filters with one second resolution."""
+
+    def __init__(self, entries):
+        self.entries = entries
+        self.requests = []
+
+    def __call__(self, verb, path, headers, body):
+        filters = dict(unquote(part).split('=') for part in
+                       path.split('/vouchers/history')[1].split('/') if part)
+        self.requests.append(filters)
+        after, before = filters.get('create_after'), filters.get('create_before')
+        after = after and datetime.strptime(after, '%Y%m%dT%H%M%S%z')
+        before = before and datetime.strptime(before, '%Y%m%dT%H%M%S%z')
+        result = []
+        for e in sorted(self.entries, key=lambda e: (e['ts_created'], e['id'])):
+            ts = parse_isotime(e['ts_created'])
+            if (after is None or ts > after) and (before is None or ts < before):
+                result.append(e)
+        if 'first' in filters:
+            result = result[:int(filters['first'])]
+        return ok(result)
+
+
+def ids(history):
+    return [e['id'] for e in history.query()]
+
+
+def test_sync_resumes_from_high_water_mark():
+    log = Log([entry(1, 0), entry(2, 5), entry(3, 10)])
+    v, history = client(log), VoucherHistory()
+    history.sync(v, page_size=10)
+    assert ids(history) == [1, 2, 3]
+    assert history.high_water_mark() == BASE + timedelta(seconds=10)
+
+    # more entries, one created in the same second as the newest stored
+    log.entries += [entry(4, 10), entry(5, 20)]
+    del log.requests[:]
+    history.sync(v, page_size=10)
+    assert ids(history) == [1, 2, 3, 4, 5]
+    assert log.requests == [{'create_after': '20130101T000009+0000', 'first': '10'}]
+
+    # nothing new: only the last second is fetched again
+    assert history.sync(v, page_size=10) == 1
+    assert len(history) == 5
+
+
+def test_sync_full_page_of_same_second_entries():
+    log = Log([entry(1, 0)] + [entry(id, 10) for id in range(2, 8)] + [entry(8, 11), entry(9, 30)])
+    v, history = client(log), VoucherHistory()
+    history.sync(v, page_size=3)
+    assert ids(history) == list(range(1, 10))
+    # the second with more entries than a page is fetched whole, in one go
+    assert {'create_after': '20130101T000009+0000',
+            'create_before': '20130101T000012+0000'} in log.requests
+
+    history.sync(v, page_size=3)
+    assert ids(history) == list(range(1, 10))
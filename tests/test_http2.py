@@ -0,0 +1,144 @@
+import json
+import socket
+import threading
+import time
+
+import pytest
+
+h2 = pytest.importorskip('h2')
+import h2.config
+import h2.connection
+import h2.events
+
+from vingd.http2 import HTTP2Connection, StreamReset, StreamTimeout
+
+
+class H2Server(object):
+    """Local HTTP/2 stand-in server, over plain TCP ("prior knowledge" h2c).
+    Responds (after `delay` seconds) with the request path and body length;
+    never responds to ``/hang``, and drops the connection on ``/drop``."""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.connections = 0
+        self.sock = socket.socket()
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.listen(8)
+        self.port = self.sock.getsockname()[1]
+        self._start(self._serve)
+
+    @staticmethod
+    def _start(target, *args):
+        thread = threading.Thread(target=target, args=args)
+        thread.daemon = True
+        thread.start()
+
+    def _serve(self):
+        while True:
+            sock, _ = self.sock.accept()
+            self.connections += 1
+            self._start(self._handle, sock)
+
+    def _handle(self, sock):
+        conn = h2.connection.H2Connection(config=h2.config.H2Configuration(
+            client_side=False, header_encoding='utf-8'))
+        lock = threading.Lock()
+        requests = {}
+
+        def respond(stream_id, headers, body):
+            time.sleep(self.delay)
+            data = json.dumps({'path': headers[':path'], 'length': len(body)}).encode()
+            with lock:
+                conn.send_headers(stream_id, [(':status', '200'), ('content-length', str(len(data)))])
+                conn.send_data(stream_id, data, end_stream=True)
+                sock.sendall(conn.data_to_send())
+
+        with lock:
+            conn.initiate_connection()
+            sock.sendall(conn.data_to_send())
+        while True:
+            data = sock.recv(65536)
+            if not data:
+                break
+            with lock:
+                for event in conn.receive_data(data):
+                    if isinstance(event, h2.events.RequestReceived):
+                        requests[event.stream_id] = [dict(event.headers), b'']
+                    elif isinstance(event, h2.events.DataReceived):
+                        requests[event.stream_id][1] += event.data
+                        conn.acknowledge_received_data(event.flow_controlled_length, event.stream_id)
+                    elif isinstance(event, h2.events.StreamEnded):
+                        headers, body = requests.pop(event.stream_id)
+                        if headers[':path'] == '/drop':
+                            sock.close()
+                            return
+                        if headers[':path'] != '/hang':
+                            self._start(respond, event.stream_id, headers, body)
+                sock.sendall(conn.data_to_send())
+
+
+@pytest.fixture
+def server():
+    return H2Server(delay=0.2)
+
+
+@pytest.fixture
+def connection(server):
+    conn = HTTP2Connection('127.0.0.1', server.port, timeout=5, secure=False)
+    conn.connect()
+    yield conn
+    conn.close()
+
+
+def fetch(conn, path, body=None, timeout=5):
+    response = conn.request('POST' if body else 'GET', path, body, {'accept': '*/*'}, timeout=timeout)
+    return response.status, json.loads(response.read().decode('ascii'))
+
+
+def test_concurrent_requests_multiplexed(server, connection):
+    results = {}
+    def get(n):
+        results[n] = fetch(connection, '/items/%d' % n)
+    threads = [threading.Thread(target=get, args=(n,)) for n in range(8)]
+    started = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # responses are delayed 0.2s each, but requests run concurrently
+    assert time.time() - started < 1.0
+    assert results == dict((n, (200, {'path': '/items/%d' % n, 'length': 0})) for n in range(8))
+    assert server.connections == 1 and connection.stats['streams'] == 8
+    assert connection.active == 0
+
+
+def test_request_body_flow_control(connection):
+    body = b'x' * 200000
+    assert fetch(connection, '/upload', body) == (200, {'path': '/upload', 'length': len(body)})
+    assert connection.stats['flow_control_stalls'] >= 1
+
+
+def test_stream_timeout(connection):
+    with pytest.raises(StreamTimeout):
+        fetch(connection, '/hang', timeout=0.3)
+    assert connection.stats['streams_reset'] == 1 and connection.active == 0
+    # the connection is still usable
+    assert fetch(connection, '/after')[0] == 200
+
+
+def test_connection_lost(connection):
+    errors = []
+    def hang():
+        try:
+            fetch(connection, '/hang')
+        except StreamReset as e:
+            errors.append(e)
+    thread = threading.Thread(target=hang)
+    thread.start()
+    while not connection.active:
+        time.sleep(0.01)
+    with pytest.raises(StreamReset):
+        fetch(connection, '/drop')
+    thread.join(5)
+    # all streams in flight fail
+    assert len(errors) == 1 and connection.closed
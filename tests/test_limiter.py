@@ -0,0 +1,103 @@
+import threading
+
+from vingd.limiter import AdaptiveLimit, batch_workers
+
+from .util import client
+
+
+class Clock(object):
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def run(limiter, clock, requests, latency, overload=False, concurrency=None):
+    """Runs `requests` rounds of `concurrency` (`limit`, by default)
+    concurrent requests, each taking `latency` seconds."""
+    for _ in range(requests):
+        n = concurrency or limiter.limit
+        for _ in range(n):
+            limiter.acquire(wait=False)
+        clock.now += latency
+        for _ in range(n):
+            limiter.release(latency, overload)
+
+
+def test_limit_grows_on_success():
+    clock = Clock()
+    limiter = AdaptiveLimit(initial=4, max_limit=8, clock=clock)
+    run(limiter, clock, 1, 0.1)
+    assert limiter._limit > 4
+    run(limiter, clock, 2, 0.1)
+    assert limiter.limit == 5
+    run(limiter, clock, 20, 0.1)
+    assert limiter.limit == 8 and limiter.stats['decreases'] == 0
+    assert limiter.stats['requests'] > 20 and limiter.inflight == 0
+
+
+def test_limit_not_grown_while_unused():
+    clock = Clock()
+    limiter = AdaptiveLimit(initial=10, clock=clock)
+    run(limiter, clock, 50, 0.1, concurrency=4)
+    assert limiter.limit == 10
+
+
+def test_limit_shrinks_on_latency():
+    clock = Clock()
+    limiter = AdaptiveLimit(initial=10, backoff=0.5, tolerance=2.0, clock=clock)
+    run(limiter, clock, 1, 0.1)
+    assert limiter.baseline == 0.1
+    limit = limiter.limit
+    # latency within tolerance: still fine
+    run(limiter, clock, 1, 0.19)
+    assert limiter.limit >= limit and limiter.stats['overloads'] == 0
+    limit = limiter.limit
+    run(limiter, clock, 1, 0.5)
+    assert limiter.limit == int(limit * 0.5)
+    assert limiter.stats['decreases'] == 1 and limiter.stats['overloads'] == limit
+
+
+def test_limit_shrinks_on_overload_once_per_round_trip():
+    clock = Clock()
+    limiter = AdaptiveLimit(initial=16, backoff=0.5, min_limit=3, clock=clock)
+    for _ in range(3):
+        limiter.acquire()
+    clock.now += 1
+    limiter.release(1.0, overload=True)
+    assert limiter.limit == 8
+    # started before the decrease: no further decrease
+    clock.now += 0.5
+    limiter.release(1.0, overload=True)
+    assert limiter.limit == 8 and limiter.stats['decreases'] == 1
+    # started after it
+    clock.now += 2
+    limiter.release(1.0, overload=True)
+    assert limiter.limit == 4 and limiter.stats['overloads'] == 3
+    run(limiter, clock, 5, 1.0, overload=True, concurrency=1)
+    assert limiter.limit == 3 and limiter.stats['limit'] == 3
+
+
+def test_acquire_waits_for_limit():
+    limiter = AdaptiveLimit(initial=2, clock=Clock())
+    limiter.acquire()
+    limiter.acquire()
+    acquired = threading.Event()
+    def acquire():
+        limiter.acquire()
+        acquired.set()
+    thread = threading.Thread(target=acquire)
+    thread.daemon = True
+    thread.start()
+    assert not acquired.wait(0.1)
+    limiter.release(0.1)
+    assert acquired.wait(5)
+    assert limiter.stats['waited'] == 1 and limiter.inflight == 2
+
+
+def test_batch_workers():
+    assert batch_workers(client(), 3) == 3
+    assert batch_workers(client()) == 8
+    assert batch_workers(client(limiter=AdaptiveLimit(max_limit=20))) == 20
+    assert batch_workers(client(limiter=AdaptiveLimit(max_limit=20)), 5) == 5
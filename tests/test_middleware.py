@@ -0,0 +1,120 @@
+import asyncio
+import json
+import sys
+
+import pytest
+
+from vingd.middleware import PurchaseMiddleware, PurchaseSessions
+
+from .util import client, ok
+
+
+TOKEN = {'object': 'x', 'huid': 'h', 'context': None, 'purchaseid': 7, 'transferid': 8}
+
+
+@pytest.fixture
+def backend():
+    requests = []
+    def handler(verb, path, headers, body):
+        requests.append((verb, path))
+        if '/tokens/' in path:
+            return ok(TOKEN)
+        return ok()
+    handler.requests = requests
+    return handler
+
+
+def app(environ, start_response):
+    start_response('200 OK', [('Content-Type', 'text/plain')])
+    return [b'content']
+
+
+def get(middleware, query='', cookie=None):
+    response = {}
+    def start_response(status, headers, exc_info=None):
+        response.update(status=status, headers=dict(headers))
+    environ = {'QUERY_STRING': query, 'wsgi.url_scheme': 'https'}
+    if cookie:
+        environ['HTTP_COOKIE'] = cookie
+    result = middleware(environ, start_response)
+    body = b''.join(result)
+    if hasattr(result, 'close'):
+        result.close()
+    cookie = response['headers'].get('Set-Cookie')
+    return response['status'], body, cookie and cookie.split(';')[0]
+
+
+def test_purchase_callback(backend):
+    middleware = PurchaseMiddleware(app, client(backend), oid=5, required=True)
+    assert get(middleware)[:2] == ('403 Forbidden', b'Purchase required.')
+
+    status, body, cookie = get(middleware, 'oid=5&tid=abcdef')
+    assert (status, body) == ('200 OK', b'content') and cookie
+    # reloads and other requests of the buyer's session aren't verified again
+    assert get(middleware, 'oid=5&tid=abcdef', cookie) == ('200 OK', b'content', None)
+    assert get(middleware, '', cookie) == ('200 OK', b'content', None)
+
+    middleware.sessions.join()
+    assert backend.requests == [
+        ('GET', '/broker/v1/objects/5/tokens/abcdef'),
+        ('PUT', '/broker/v1/purchases/7')
+    ]
+    assert middleware.sessions.stats['committed'] == 1
+
+
+def test_replayed_callback_rejected(backend):
+    middleware = PurchaseMiddleware(app, client(backend), oid=5, required=True)
+    assert get(middleware, 'oid=5&tid=abcdef')[0] == '200 OK'
+    # someone else, with the callback URL
+    status, body, cookie = get(middleware, 'oid=5&tid=abcdef')
+    assert (status, body, cookie) == ('403 Forbidden', b'Purchase required.', None)
+    status, body, cookie = get(middleware, 'oid=5&tid=abcdef', 'vingd_session=planted')
+    assert status == '403 Forbidden'
+    assert len([r for r in backend.requests if r[0] == 'GET']) == 1
+
+
+@pytest.mark.skipif(sys.version_info < (3, 7), reason="requires asyncio.run")
+def test_asgi_purchase_callback(backend):
+    from vingd.asgi import AsyncPurchaseMiddleware
+
+    async def app(scope, receive, send):
+        await send({'type': 'http.response.start', 'status': 200, 'headers': []})
+        await send({'type': 'http.response.body', 'body': json.dumps(scope['vingd.purchase']).encode()})
+
+    middleware = AsyncPurchaseMiddleware(app, client(backend), oid=5, required=True)
+
+    async def get(query, cookie=None):
+        messages = []
+        async def send(message):
+            messages.append(message)
+        headers = [(b'cookie', cookie.encode())] if cookie else []
+        scope = {'type': 'http', 'query_string': query.encode(), 'headers': headers, 'scheme': 'https'}
+        await middleware(scope, None, send)
+        cookie = dict(messages[0]['headers']).get(b'set-cookie')
+        return messages[0]['status'], messages[1]['body'], cookie and cookie.decode().split(';')[0]
+
+    async def run():
+        status, body, cookie = await get('oid=5&tid=abcdef')
+        assert status == 200 and json.loads(body) == TOKEN and cookie
+        assert (await get('', cookie))[:2] == (200, body)
+        assert (await get('oid=5&tid=abcdef'))[0] == 403
+
+    asyncio.run(run())
+    middleware.sessions.join()
+    assert middleware.sessions.stats == {'verified': 1, 'failed': 1, 'committed': 1, 'commit_errors': 0}
+
+
+@pytest.mark.parametrize('error', [KeyError('purchaseid'), KeyboardInterrupt()])
+def test_failed_verification_releases_token(backend, error):
+    v = client(backend)
+    sessions = PurchaseSessions(v)
+    verify = v.verify_purchase
+    def failing(oid, tid):
+        v.verify_purchase = verify
+        raise error
+    v.verify_purchase = failing
+    with pytest.raises(type(error)):
+        sessions.verify(5, 'abcdef', 's1')
+    # not claimed by the failed attempt
+    assert sessions.verify(5, 'abcdef', 's1') == TOKEN
+    assert sessions.stats['failed'] == 1 and sessions.stats['verified'] == 1
@@ -0,0 +1,134 @@
+try:
+    import httplib
+except ImportError:
+    import http.client as httplib
+
+import socket
+import threading
+
+import pytest
+
+from vingd.pool import ConnectionPool, ConnectError
+from vingd.tls import TLSContext
+
+from .util import CERT, TLSServer
+
+
+class StaleServer(object):
+    """HTTP/1.1 server answering only the first request on each connection
+    (with keep-alive), and dropping the connection after reading the next one,
+    as a server closing an idle connection would."""
+
+    def __init__(self):
+        self.requests = []
+        self.sock = socket.socket()
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.listen(8)
+        self.port = self.sock.getsockname()[1]
+        thread = threading.Thread(target=self.serve)
+        thread.daemon = True
+        thread.start()
+
+    def serve(self):
+        while True:
+            conn, _ = self.sock.accept()
+            thread = threading.Thread(target=self.handle, args=(conn,))
+            thread.daemon = True
+            thread.start()
+
+    def handle(self, conn):
+        fp = conn.makefile('rb')
+        for count in (1, 2):
+            line = fp.readline()
+            if not line:
+                break
+            length = 0
+            for header in iter(fp.readline, b'\r\n'):
+                name, _, value = header.decode('latin-1').partition(':')
+                if name.lower() == 'content-length':
+                    length = int(value)
+            fp.read(length)
+            self.requests.append(line.split()[0].decode('ascii'))
+            if count == 1:
+                conn.sendall(b'HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nok')
+        fp.close()
+        conn.close()
+
+
+class PlainPool(ConnectionPool):
+    def _new_connection(self):
+        with self._lock:
+            self.stats['connections'] += 1
+        return httplib.HTTPConnection(self.host, self.port)
+
+
+@pytest.fixture
+def server():
+    return StaleServer()
+
+
+def test_reuses_connections(server):
+    pool = PlainPool('127.0.0.1', server.port)
+    assert pool.request('GET', '/').read() == b'ok'
+    assert pool.stats['connections'] == 1 and len(pool._idle) == 1
+
+
+def test_idempotent_request_retried_on_stale_connection(server):
+    pool = PlainPool('127.0.0.1', server.port)
+    pool.request('GET', '/').read()
+    assert pool.request('GET', '/').read() == b'ok'
+    assert pool.stats['retried'] == 1
+    assert server.requests == ['GET', 'GET', 'GET']
+
+
+def test_sent_post_not_retried_on_stale_connection(server):
+    pool = PlainPool('127.0.0.1', server.port)
+    pool.request('GET', '/').read()
+    with pytest.raises((httplib.HTTPException, socket.error)):
+        pool.request('POST', '/', b'{}', {'Content-Length': '2'})
+    assert pool.stats['retried'] == 0
+    assert server.requests == ['GET', 'POST']
+
+
+@pytest.fixture
+def tls_server():
+    server = TLSServer()
+    yield server
+    server.close()
+
+
+def tls_pool(server, **kwargs):
+    return ConnectionPool('127.0.0.1', server.port, tls=TLSContext(cafile=CERT), **kwargs)
+
+
+def test_warmup_opens_idle_connections(tls_server):
+    pool = tls_pool(tls_server)
+    assert pool.warmup(3) >= 0
+    assert pool.stats['connections'] == 3 and len(pool._idle) == 3
+    # warmed up connections are used by requests
+    assert b'"/x"' in pool.request('GET', '/x').read()
+    assert pool.stats['connections'] == 3 and pool.stats['reused'] == 1
+    assert tls_server.requests == [('GET', '/x')]
+    pool.close()
+
+
+def test_warmup_tops_up_to_maxsize(tls_server):
+    pool = tls_pool(tls_server, maxsize=2)
+    pool.warmup(1)
+    pool.warmup(5)
+    assert pool.stats['connections'] == 2 and len(pool._idle) == 2
+    pool.close()
+
+
+def test_probe_returns_latency_and_keeps_connection(tls_server):
+    pool = tls_pool(tls_server)
+    assert pool.probe() >= 0
+    assert pool.stats['connections'] == 1 and len(pool._idle) == 1
+    pool.close()
+
+
+def test_probe_fails_on_untrusted_certificate(tls_server):
+    pool = ConnectionPool('127.0.0.1', tls_server.port, tls=TLSContext())
+    with pytest.raises(ConnectError):
+        pool.probe()
+    assert pool._idle == []
@@ -0,0 +1,75 @@
+import json
+import re
+
+from vingd.pool import ConnectionPool
+from vingd.profiling import PHASES, Profiler
+from vingd.tls import TLSContext
+
+from .util import CERT, TLSServer, client, ok
+
+
+def test_phase_totals():
+    profiler = Profiler()
+    def handler(verb, path, headers, body):
+        if path.endswith('/7'):
+            return 404, json.dumps({'message': 'No such order.', 'context': 'Not found'})
+        return ok({'id': 1})
+    v = client(handler, profiler=profiler)
+    v.get_user_profile()
+    v.get_user_profile()
+    try:
+        v.get_order(7)
+    except Exception:
+        pass
+    stats = profiler.stats()
+    assert stats['get_user_profile']['calls'] == 2 and stats['get_order']['calls'] == 1
+    for method in stats.values():
+        phases = set(method) - set(['calls'])
+        assert phases <= set(PHASES)
+        assert set(['build', 'wait', 'decode']) <= phases
+        for totals in (method[phase] for phase in phases):
+            assert totals['wall'] >= 0 and totals['cpu'] >= 0
+    assert 'raise' in stats['get_order'] and 'raise' not in stats['get_user_profile']
+
+    # nothing is recorded once disabled
+    profiler.enabled = False
+    v.get_user_profile()
+    assert profiler.stats()['get_user_profile']['calls'] == 2
+    profiler.reset()
+    assert profiler.stats() == {} and profiler.collapsed() == ''
+
+
+def test_collapsed(tmp_path):
+    profiler = Profiler()
+    v = client(profiler=profiler)
+    v.get_user_profile()
+    lines = profiler.collapsed().splitlines()
+    assert lines and all(re.match(r'^vingd;get_user_profile;[a-z]+ \d+$', l) for l in lines)
+    phases = [line.split(';')[2].split()[0] for line in lines]
+    assert phases == sorted(phases) and set(phases) == set(profiler.stats()['get_user_profile']) - set(['calls'])
+    total = sum(int(line.split()[1]) for line in profiler.collapsed('wall').splitlines())
+    wall = sum(t['wall'] for p, t in profiler.stats()['get_user_profile'].items() if p != 'calls')
+    assert abs(total - wall * 1e6) <= len(lines)
+    path = str(tmp_path / 'vingd.folded')
+    profiler.dump(path)
+    with open(path) as fp:
+        assert fp.read() == profiler.collapsed()
+
+
+def test_tls_handshake_phase():
+    server = TLSServer()
+    pool = ConnectionPool('127.0.0.1', server.port, tls=TLSContext(cafile=CERT))
+    profiler = Profiler()
+    try:
+        for _ in range(2):
+            profiler.start('request')
+            pool.request('GET', '/').read()
+            profiler.stop()
+    finally:
+        pool.close()
+        server.close()
+    stats = profiler.stats()['request']
+    assert stats['calls'] == 2
+    # one handshake (the connection is reused), charged to `tls`, not `pool`
+    assert stats['tls']['wall'] > 0
+    assert pool.stats['connections'] == 1
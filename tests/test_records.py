@@ -0,0 +1,84 @@
+import datetime
+import pickle
+import tracemalloc
+
+import pytest
+
+from vingd.records import Order, Voucher, VoucherLogEntry
+
+from .util import client, ok
+
+
+VOUCHER = {'vid': 1, 'vid_encoded': 'abc', 'amount_allocated': 100,
+           'amount_vouched': 100, 'id_fort_transfer': 2, 'fee': 0, 'uid_from': 3,
+           'uid_proxy': 4, 'uid_to': None, 'gid': 'g', 'description': None,
+           'ts_valid_until': '2030-01-01T00:00:00+00:00', 'message': 'hi'}
+
+
+def test_dict_compatibility():
+    voucher = Voucher(dict(VOUCHER, extra=1), 'https://www.vingd.com/')
+    data = dict(VOUCHER, extra=1)
+    assert voucher['vid'] == 1 and voucher['extra'] == 1
+    assert voucher.get('gid') == 'g' and voucher.get('state') is None
+    assert voucher.get('missing', 0) == 0
+    with pytest.raises(KeyError):
+        voucher['state']
+    assert sorted(voucher.keys()) == sorted(data) == sorted(voucher)
+    assert voucher.to_dict() == dict(voucher) == data and voucher == data
+    assert len(voucher) == len(data) and 'uid_to' in voucher and 'state' not in voucher
+    voucher['state'] = 'revoked'
+    assert voucher['state'] == 'revoked' and len(voucher) == len(data) + 1
+    assert voucher.valid_until == datetime.datetime(2030, 1, 1, tzinfo=voucher.valid_until.tzinfo)
+
+
+def test_derived_values_are_not_keys():
+    voucher = Voucher(VOUCHER, 'https://www.vingd.com/')
+    assert voucher['raw'] is voucher
+    assert voucher['urls']['popup'] == 'https://www.vingd.com/popup/vouchers/abc'
+    assert 'raw' not in voucher.keys() and 'urls' not in voucher.to_dict()
+
+    order = Order(frontend='https://www.vingd.com/', id=5, expires=None,
+                  context='c', object={'id': 7, 'price': 100})
+    assert order['urls']['redirect'] == 'https://www.vingd.com/orders/5/add/'
+    assert order['object'] == {'id': 7, 'price': 100}
+    assert order.to_dict() == {'id': 5, 'expires': None, 'context': 'c',
+                               'object': {'id': 7, 'price': 100}}
+    assert sorted(order) == ['context', 'expires', 'id', 'object']
+
+
+def test_pickle():
+    voucher = Voucher(VOUCHER, 'https://www.vingd.com/')
+    copy = pickle.loads(pickle.dumps(voucher))
+    assert copy == voucher and copy['urls'] == voucher['urls']
+    order = Order(frontend='https://www.vingd.com/', id=5, expires=None,
+                  context='c', object={'id': 7, 'price': 100})
+    copy = pickle.loads(pickle.dumps(order))
+    assert copy == order and copy['urls'] == order['urls']
+
+
+def test_client_results():
+    v = client(lambda *a: ok(VOUCHER), records=True)
+    voucher = v.create_voucher(100)
+    assert isinstance(voucher, Voucher) and voucher['raw']['vid_encoded'] == 'abc'
+    v = client(lambda *a: ok({'id': 5}), records=True)
+    order = v.create_order(7, 100)
+    plain = client(lambda *a: ok({'id': 5})).create_order(7, 100)
+    assert order['urls'] == plain['urls'] and order['object'] == plain['object']
+
+
+def size(make, n=1000):
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        items = [make(i) for i in range(n)]
+        return tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+
+
+def test_smaller_than_dicts():
+    entry = {'id': 1, 'vid': 2, 'vid_encoded': 'abc', 'action': 'use', 'gid': None,
+             'uid_from': 3, 'uid_to': 4, 'amount_vouched': 100,
+             'ts_created': '2030-01-01T00:00:00', 'ts_valid_until': '2030-01-01T00:00:00'}
+    assert size(lambda i: VoucherLogEntry(entry)) < size(lambda i: dict(entry)) * 0.7
+    assert size(lambda i: Voucher(VOUCHER)) < size(lambda i: dict(VOUCHER)) * 0.7
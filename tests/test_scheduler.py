@@ -0,0 +1,56 @@
+import threading
+import time
+
+from vingd.limiter import AdaptiveLimit
+from vingd.scheduler import BULK, INTERACTIVE, PriorityScheduler, priority_class
+
+from .util import client, ok
+
+
+def test_reserved_capacity():
+    scheduler = PriorityScheduler(4, {INTERACTIVE: 1})
+    for _ in range(3):
+        assert scheduler.acquire(BULK) == 0
+    blocked = threading.Event()
+    def bulk():
+        scheduler.acquire(BULK)
+        blocked.set()
+    thread = threading.Thread(target=bulk)
+    thread.daemon = True
+    thread.start()
+    assert not blocked.wait(0.1)
+    assert scheduler.acquire(INTERACTIVE) == 0
+    scheduler.release(INTERACTIVE)
+    assert not blocked.wait(0.1)
+    scheduler.release(BULK)
+    assert blocked.wait(1)
+
+
+def test_reserved_capacity_within_adaptive_limit():
+    """Bulk requests fill the (adaptive) limit, not the scheduler's larger
+    capacity: interactive ones still get their reserved slot."""
+    release = threading.Event()
+    def handler(verb, path, headers, body):
+        if 'bulk' in path:
+            release.wait(5)
+        return ok({'balance': 1})
+    v = client(handler, scheduler=PriorityScheduler(10, {INTERACTIVE: 1}),
+               limiter=AdaptiveLimit(initial=4, max_limit=4))
+    def bulk():
+        with priority_class(BULK):
+            v.request('get', 'bulk')
+    threads = [threading.Thread(target=bulk) for _ in range(6)]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    time.sleep(0.2)
+    assert v.scheduler.stats[BULK]['inflight'] == 3
+    started = time.time()
+    try:
+        v.request('get', 'interactive')
+        assert time.time() - started < 1
+    finally:
+        release.set()
+    for thread in threads:
+        thread.join()
+    assert v.limiter.inflight == 0
@@ -0,0 +1,91 @@
+import json
+
+import pytest
+
+from vingd.exceptions import InvalidData
+from vingd.schema import OPERATIONS, Operation
+
+from .util import client, ok
+
+
+def build(name, params):
+    verb, path, body = OPERATIONS[name].build(params)
+    return verb, path, json.loads(body) if body else None
+
+
+# (operation, parameters, expected request)
+REQUESTS = [
+    ('create_object', {'name': 'n', 'url': 'http://x/'},
+     ('post', 'registry/objects/', {'description': {'name': 'n', 'url': 'http://x/'}})),
+    ('update_object', {'oid': 7, 'name': 'n', 'url': 'http://x/'},
+     ('put', 'registry/objects/7/', {'description': {'name': 'n', 'url': 'http://x/'}})),
+    ('verify_purchase', {'oid': '7', 'tid': 'abc123'},
+     ('get', 'objects/7/tokens/abc123', None)),
+    ('commit_purchase', {'purchaseid': 1, 'transferid': 2},
+     ('put', 'purchases/1', {'transferid': 2})),
+    ('create_order', {'oid': 7, 'price': 100, 'order_expires': '2030-01-01T00:00:00'},
+     ('post', 'objects/7/orders/',
+      {'price': 100, 'order_expires': '2030-01-01T00:00:00', 'context': None})),
+    ('get_order', {'orderid': 3}, ('get', 'orders/3', None)),
+    ('get_object', {'oid': 7}, ('get', 'registry/objects/7', None)),
+    ('get_user_profile', {}, ('get', 'id/users', None)),
+    ('get_account_balance', {}, ('get', 'fort/accounts', None)),
+    ('authorized_get_account_balance', {'huid': 'ab12'}, ('get', 'fort/accounts/ab12', None)),
+    ('authorized_purchase_object', {'oid': 7, 'price': 100, 'huid': 'ab12'},
+     ('post', 'objects/7/purchases', {'price': 100, 'huid': 'ab12', 'autocommit': True})),
+    ('authorized_create_user', {'identities': {'mail': 'a@b.c'}, 'primary_identity': 'mail'},
+     ('post', 'id/users/', {'identities': {'mail': 'a@b.c'}, 'primary_identity': 'mail',
+                            'delegate_permissions': None})),
+    ('reward_user', {'huid_to': 'ab12', 'amount': 100},
+     ('post', 'rewards', {'huid_to': 'ab12', 'amount': 100, 'description': None})),
+    ('create_voucher', {'amount': 100, 'until': '2030-01-01T00:00:00', 'gid': 'g1'},
+     ('post', 'vouchers/',
+      {'amount': 100, 'until': '2030-01-01T00:00:00', 'message': None, 'gid': 'g1'})),
+]
+
+
+@pytest.mark.parametrize('name, params, expected', REQUESTS)
+def test_request_construction(name, params, expected):
+    assert build(name, params) == expected
+
+
+def test_all_operations_covered():
+    assert sorted(OPERATIONS) == sorted(name for name, _, _ in REQUESTS)
+
+
+@pytest.mark.parametrize('name, params, message', [
+    ('reward_user', {'huid_to': 'ab12', 'amount': '100'}, "'amount' of reward_user: int expected"),
+    ('reward_user', {'huid_to': 'ab12', 'amount': True}, "'amount' of reward_user: int expected"),
+    ('reward_user', {'huid_to': 'a/b', 'amount': 1}, "'huid_to' of reward_user: ident expected"),
+    ('reward_user', {'amount': 1}, "'huid_to' of reward_user missing"),
+    ('reward_user', {'huid_to': 'ab', 'amount': 1, 'x': 1}, "Unknown parameter of reward_user: 'x'"),
+    ('authorized_get_account_balance', {'huid': 'xyz'}, "'huid' of authorized_get_account_balance: hex expected"),
+    ('get_order', {'orderid': '1/2'}, "'orderid' of get_order: int expected"),
+    ('create_object', {'name': 'n'}, "'url' of create_object missing"),
+    ('create_voucher', {'amount': 1.5, 'until': 'x'}, "'amount' of create_voucher: int expected"),
+])
+def test_validation_errors(name, params, message):
+    with pytest.raises(InvalidData) as e:
+        OPERATIONS[name].build(params)
+    assert message in e.value.msg
+
+
+def test_invalid_types_rejected_on_compile():
+    with pytest.raises(ValueError):
+        Operation('x', 'get', 'x/{id:float}')
+    with pytest.raises(ValueError):
+        Operation('x', 'post', 'x', body={'id': 'float'})
+
+
+def test_invalid_call_not_sent():
+    requests = []
+    def handler(verb, path, headers, body):
+        requests.append(path)
+        return ok({'oid': 1})
+    v = client(handler)
+    with pytest.raises(InvalidData):
+        v.create_voucher('100')
+    with pytest.raises(InvalidData):
+        v.create_object(None, 'http://x/')
+    assert v.create_object('n', 'http://x/') == 1
+    assert requests == ['/broker/v1/registry/objects/']
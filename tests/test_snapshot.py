@@ -0,0 +1,50 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+numpy = pytest.importorskip('numpy')
+
+from vingd.snapshot import Snapshot
+from vingd.util import parse_isotime, tzutc
+
+
+BASE = datetime(2013, 1, 1, tzinfo=tzutc())
+
+
+def entry(id, seconds):
+    return {'id': id, 'vid': id, 'vid_encoded': 'v%d' % id, 'action': 'add',
+            'gid': None, 'uid_from': 1, 'uid_to': None, 'amount_vouched': 100,
+            'ts_created': (BASE + timedelta(seconds=seconds)).isoformat(),
+            'ts_valid_until': (BASE + timedelta(days=7)).isoformat()}
+
+
+class History(object):
+    """`Vingd.get_vouchers_history` stand-in (oldest first, one second
+    resolution of `create_after`, as the API)."""
+
+    def __init__(self, entries):
+        self.entries = entries
+
+    def get_vouchers_history(self, create_after=None, create_before=None, first=None):
+        result = []
+        for e in self.entries:
+            ts = parse_isotime(e['ts_created'])
+            if create_after is not None and ts <= create_after.replace(microsecond=0):
+                continue
+            if create_before is not None and ts >= create_before:
+                continue
+            result.append(e)
+        return result[:first] if first else result
+
+
+def test_sync_same_second_entries_across_pages(tmp_path):
+    history = History([entry(1, 0)] + [entry(id, 10) for id in range(2, 6)])
+    snapshot = Snapshot(str(tmp_path / 'h.snap'))
+    snapshot.sync(history, page_size=2)
+    assert sorted(snapshot.table()['id'].tolist()) == [1, 2, 3, 4, 5]
+
+    history.entries.append(entry(6, 10))
+    history.entries.append(entry(7, 20))
+    snapshot.sync(history, page_size=2)
+    assert sorted(snapshot.table()['id'].tolist()) == [1, 2, 3, 4, 5, 6, 7]
+    assert snapshot.append([entry(7, 20), entry(3, 10)]) == 0
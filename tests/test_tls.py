@@ -0,0 +1,37 @@
+import pytest
+
+from vingd.pool import ConnectionPool
+from vingd.tls import TLSContext
+
+from .util import CERT, TLSServer
+
+
+@pytest.fixture
+def server():
+    server = TLSServer()
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def pool(server):
+    pool = ConnectionPool('127.0.0.1', server.port, tls=TLSContext(cafile=CERT))
+    yield pool
+    pool.close()
+
+
+def test_reconnect_resumes_tls_session(pool):
+    pool.request('GET', '/').read()
+    assert pool.tls.stats == {'full': 1, 'resumed': 0}
+    # session (tickets) saved when the connection was released
+    pool.close()
+    pool.request('GET', '/').read()
+    assert pool.tls.stats == {'full': 1, 'resumed': 1}
+
+
+def test_forget_drops_sessions(pool):
+    pool.request('GET', '/').read()
+    pool.close()
+    pool.tls.forget('127.0.0.1', pool.port)
+    pool.request('GET', '/').read()
+    assert pool.tls.stats == {'full': 2, 'resumed': 0}
@@ -0,0 +1,24 @@
+from vingd.tracing import Tracer
+
+from .util import client, ok
+
+
+def test_traceparent_propagation():
+    traceparents = []
+    def handler(verb, path, headers, body):
+        traceparents.append(headers['traceparent'])
+        return ok()
+    tracer = Tracer()
+    v = client(handler, tracer=tracer)
+    v.get_user_profile()
+    call, = tracer.exporter.find('vingd.get_user_profile')
+    attempt, = tracer.exporter.find('HTTP GET')
+    assert attempt.parent_id == call.span_id
+    assert traceparents == ['00-%s-%s-01' % (call.trace_id, attempt.span_id)]
+
+    # continuing a remote trace
+    remote = Tracer.extract('00-%s-%s-01' % ('ab' * 16, 'cd' * 8))
+    with Tracer.activate(remote):
+        v.get_user_profile()
+    assert traceparents[-1].startswith('00-%s-' % ('ab' * 16))
+    assert tracer.exporter.spans[-1].parent_id == 'cd' * 8
@@ -0,0 +1,42 @@
+import pytest
+
+from vingd.exceptions import NotFound
+from vingd.transport import MemoryTransport, RecordingTransport, ReplayMiss, ReplayTransport
+
+from .util import client, ok
+
+
+def test_memory_transport_routes():
+    transport = MemoryTransport()
+    transport.add('get', '/broker/v1/id/users', {'name': 'user'})
+    v = client()
+    v.transport = transport
+    assert v.get_user_profile() == {'name': 'user'}
+    with pytest.raises(NotFound):
+        v.get_object(1)
+    verb, path, headers, body = transport.requests[0]
+    assert (verb, path) == ('GET', '/broker/v1/id/users')
+    assert headers['Accept-Encoding'] == 'gzip, deflate'
+
+
+def test_record_and_replay(tmp_path):
+    path = str(tmp_path / 'session.jsonl')
+    profiles = iter([{'name': 'first'}, {'name': 'second'}])
+    v = client(lambda *request: ok(next(profiles)))
+    v.transport = RecordingTransport(v.transport, path)
+    assert v.get_user_profile() == {'name': 'first'}
+    assert v.get_user_profile() == {'name': 'second'}
+    v.transport.close()
+    with open(path) as fp:
+        assert 'Authorization' not in fp.read()
+
+    replayed = client()
+    replayed.transport = ReplayTransport(path)
+    assert replayed.get_user_profile() == {'name': 'first'}
+    assert replayed.get_user_profile() == {'name': 'second'}
+    with pytest.raises(ReplayMiss):
+        replayed.get_user_profile()
+
+    replayed.transport = ReplayTransport(path, loop=True)
+    names = [replayed.get_user_profile()['name'] for _ in range(3)]
+    assert names == ['first', 'second', 'first']
@@ -0,0 +1,156 @@
+import re
+from datetime import datetime, timedelta, timezone, tzinfo
+
+import pytest
+
+from vingd import util
+from vingd.util import (ConversionError, UTC, format_isobasic, format_isobasic_many,
+                        parse_duration, parse_durations, parse_isotime, pmap,
+                        safeformat, tzoffset)
+
+
+def test_pmap():
+    results = sorted(pmap(lambda n: 10 // n, [1, 2, 0, 5], workers=2), key=repr)
+    assert [(item, result) for item, result, error in results] == [(0, None), (1, 10), (2, 5), (5, 2)]
+    assert isinstance(results[0][2], ZeroDivisionError)
+
+
+def test_pmap_input_error():
+    def items():
+        yield 1
+        yield 2
+        raise ValueError("Malformed input.")
+    results = []
+    with pytest.raises(ValueError):
+        for item, result, error in pmap(lambda n: n * 2, items(), workers=2):
+            results.append(result)
+    # items read before the error are processed
+    assert sorted(results) == [2, 4]
+
+
+def old_parse_duration(string):
+    """`parse_duration` before memoization (reference implementation)."""
+    string = string.replace(' ', '').upper()
+    for pattern in (
+            r"^P(?:(?:(?P<years>\d+)Y)?(?:(?P<months>\d+)M)?(?:(?P<days>\d+)D)?)?"
+            r"(?:T(?:(?P<hours>\d+)H)?(?:(?P<minutes>\d+)M)?(?:(?P<seconds>\d+)S)?)?$",
+            r"^P(?P<weeks>\d+)W$",
+            r"^P(?P<years>\d{4})(-)?(?P<months>\d{2})(?(2)-)(?P<days>\d{2})T(?P<hours>\d{2})"
+            r"(?(2):)(?P<minutes>\d{2})(?(2):)(?P<seconds>\d{2})$"):
+        match = re.match(pattern, string)
+        if match:
+            d = match.groupdict(0)
+            return dict(zip(d.keys(), map(int, d.values())))
+    return {}
+
+
+DURATIONS = ['P1M', 'p1m', 'P 1y 1m T 2m 1s', 'P12W', 'P 0001-02-03 T 03:02:01',
+             'P00010203T030201', 'PT36H', 'P', 'PT', '', 'P1.5D', 'P1W2D', 'nonsense']
+
+
+@pytest.mark.parametrize('string', DURATIONS)
+def test_parse_duration(string):
+    assert parse_duration(string) == old_parse_duration(string)
+    # memoized: the same (fresh copy of the) result again
+    assert parse_duration(string) == old_parse_duration(string)
+
+
+def test_parse_duration_memo():
+    first = parse_duration('P3D')
+    first['days'] = 100
+    assert parse_duration('P3D')['days'] == 3
+    assert parse_durations(DURATIONS) == [old_parse_duration(s) for s in DURATIONS]
+    # bounded
+    for n in range(util._DURATIONS_MAX + 10):
+        parse_duration('P%dD' % n)
+    assert len(util._durations) <= util._DURATIONS_MAX
+
+
+@pytest.mark.parametrize('string, expected', [
+    ('2013-01-02T03:04:05', datetime(2013, 1, 2, 3, 4, 5, tzinfo=timezone.utc)),
+    ('2013-01-02T03:04:05Z', datetime(2013, 1, 2, 3, 4, 5, tzinfo=timezone.utc)),
+    ('2013-01-02 03:04:05+00:00', datetime(2013, 1, 2, 3, 4, 5, tzinfo=timezone.utc)),
+    ('20130102T030405+0130', datetime(2013, 1, 2, 3, 4, 5, tzinfo=timezone(timedelta(minutes=90)))),
+    ('2013-01-02T03:04:05.5-02', datetime(2013, 1, 2, 3, 4, 5, 500000, tzinfo=timezone(timedelta(hours=-2)))),
+    ('2013-01-02T03:04:05.1234567-00:30', datetime(2013, 1, 2, 3, 4, 5, 123456, tzinfo=timezone(timedelta(minutes=-30)))),
+    (' 2013-01-02T03:04:05.000001Z ', datetime(2013, 1, 2, 3, 4, 5, 1, tzinfo=timezone.utc)),
+])
+def test_parse_isotime(string, expected):
+    parsed = parse_isotime(string)
+    assert parsed == expected and parsed.utcoffset() == expected.utcoffset()
+    # time zones are shared between timestamps with the same offset
+    assert parse_isotime(string).tzinfo is parsed.tzinfo
+
+
+@pytest.mark.parametrize('string', ['', '2013-01-02', '2013-01-02T03:04', 'x2013-01-02T03:04:05',
+                                    '2013-01-02T03:04:05+1', '2013-13-02T03:04:05'])
+def test_parse_isotime_invalid(string):
+    with pytest.raises(ValueError):
+        parse_isotime(string)
+
+
+class Odd(tzinfo):
+    """Time zone with a seconds offset (not representable as ``+hhmm``)."""
+    def utcoffset(self, dt):
+        return timedelta(hours=1, seconds=30)
+    def dst(self, dt):
+        return None
+    def tzname(self, dt):
+        return 'odd'
+
+
+class Unknown(tzinfo):
+    def utcoffset(self, dt):
+        return None
+    def dst(self, dt):
+        return None
+    def tzname(self, dt):
+        return None
+
+
+DATETIMES = [
+    datetime(2013, 1, 2, 3, 4, 5, 6),
+    datetime(2013, 1, 2, 3, 4, 5, tzinfo=UTC),
+    datetime(2013, 1, 2, 3, 4, 5, tzinfo=tzoffset(90)),
+    datetime(2013, 1, 2, 3, 4, 5, tzinfo=tzoffset(-330)),
+    datetime(2013, 1, 2, 3, 4, 5, tzinfo=timezone(timedelta(hours=2))),
+    datetime(2013, 1, 2, 3, 4, 5, tzinfo=Odd()),
+    datetime(2013, 1, 2, 3, 4, 5, tzinfo=Unknown()),
+    datetime(999, 1, 2, 3, 4, 5),
+    datetime(9, 1, 2, 3, 4, 5, tzinfo=UTC),
+]
+
+
+@pytest.mark.parametrize('dt', DATETIMES)
+def test_format_isobasic(dt):
+    assert format_isobasic(dt) == dt.strftime("%Y%m%dT%H%M%S%z")
+
+
+def test_format_isobasic_many():
+    dts = DATETIMES + DATETIMES[::-1]
+    assert format_isobasic_many(dts) == [dt.strftime("%Y%m%dT%H%M%S%z") for dt in dts]
+    assert format_isobasic_many([]) == []
+
+
+@pytest.mark.parametrize('args, expected', [
+    (("Decimal {:int}, hexadecimal {1:hex}", 2, "abc"), "Decimal 2, hexadecimal abc"),
+    (("{:hex}. item: {0:str}", 13), "13. item: 13"),
+    (("objects/{:int}/tokens/{:hex}", 123, "ab2e36d953e7b634"), "objects/123/tokens/ab2e36d953e7b634"),
+    (("{:ident}/{:ident}", "a-b_c", 7), "a-b_c/7"),
+    (("{:int}", "42"), "42"),
+    (("{:iso}", datetime(2013, 1, 2, 3, 4, 5, tzinfo=UTC)), "2013-01-02T03:04:05+00:00"),
+    (("{:isobasic}", datetime(2013, 1, 2, 3, 4, 5, tzinfo=tzoffset(-90))), "20130102T030405-0130"),
+    (("{:isobasic}", datetime(2013, 1, 2, 3, 4, 5)), "20130102T030405"),
+    (("no fields",), "no fields"),
+])
+def test_safeformat(args, expected):
+    assert safeformat(*args) == expected
+
+
+@pytest.mark.parametrize('args', [
+    ("{:hex}", "xyz"), ("{:ident}", "a/b"), ("{:int}", "1.5"), ("{:iso}", "2013-01-02"),
+    ("{:isobasic}", None), ("{:float}", 1), ("{:int} {:int}", 1), ("{3:int}", 1),
+])
+def test_safeformat_errors(args):
+    with pytest.raises(ConversionError):
+        safeformat(*args)
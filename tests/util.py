@@ -0,0 +1,91 @@
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+except ImportError:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+
+import json
+import os
+import ssl
+import threading
+
+from vingd import Vingd
+from vingd.transport import MemoryResponse, MemoryTransport, Transport
+
+
+def ok(data=None):
+    """Successful API response (for `MemoryTransport` handlers)."""
+    return 200, json.dumps({'data': {} if data is None else data})
+
+
+def client(handler=None, **kwargs):
+    """`Vingd` client sending requests to `handler` (a `MemoryTransport`
+    handler; by default, answering all requests with empty data)."""
+    if handler is None:
+        handler = lambda verb, path, headers, body: ok()
+    return Vingd(username='user', password='pass', transport=MemoryTransport(handler), **kwargs)
+
+
+class Hosts(Transport):
+    """Transport dispatching requests to ``handlers[host](verb, path,
+    headers, body)``, which return a `MemoryResponse` argument tuple or raise
+    (network) errors. Requests are kept in `requests` (as ``(host, verb,
+    path)``)."""
+
+    def __init__(self, **handlers):
+        self.handlers = handlers
+        self.requests = []
+
+    def send(self, endpoint, verb, path, headers, body):
+        self.requests.append((endpoint.host, verb, path))
+        return MemoryResponse(*self.handlers[endpoint.host](verb, path, headers, body))
+
+
+def hosts_client(transport, **kwargs):
+    """`Vingd` client with ``a`` and ``b`` endpoints, over `transport`."""
+    return Vingd(username='user', password='pass', transport=transport,
+                 endpoint=['https://a/broker/v1', 'https://b/broker/v1'], **kwargs)
+
+
+CERT = os.path.join(os.path.dirname(__file__), 'data', 'localhost.pem')
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.server.requests.append((self.command, self.path))
+        body = json.dumps({'data': {'path': self.path}}).encode('ascii')
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_POST = do_PUT = do_DELETE = do_GET
+
+
+class TLSServer(ThreadingMixIn, HTTPServer):
+    """Local HTTPS (keep-alive HTTP/1.1) server on ``127.0.0.1:<port>``,
+    answering any request with a Vingd response. Its (self-signed)
+    certificate is `CERT`."""
+
+    daemon_threads = True
+
+    def __init__(self):
+        HTTPServer.__init__(self, ('127.0.0.1', 0), _Handler)
+        self.requests = []
+        self.port = self.server_address[1]
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(CERT)
+        self.socket = context.wrap_socket(self.socket, server_side=True)
+        thread = threading.Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    def close(self):
+        self.shutdown()
+        self.server_close()
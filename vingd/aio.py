@@ -0,0 +1,52 @@
+"""
+`asyncio` adapter for the `Vingd` client (Python 3 only).
+
+Example::
+
+    from vingd import Vingd
+    from vingd.aio import AsyncVingd
+
+    v = AsyncVingd(Vingd(username="...", password="...", http2=True))
+
+    async def checkout(oid, tid):
+        purchase = await v.verify_purchase(oid, tid)
+        await v.commit_purchase(purchase['purchaseid'], purchase['transferid'])
+"""
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+
+# the loop running the calling coroutine (Python 3.7+)
+_running_loop = getattr(asyncio, 'get_running_loop', asyncio.get_event_loop)
+
+
+class AsyncVingd(object):
+    """
+    Wraps a `Vingd` client, exposing all of its API methods as awaitables.
+
+    Blocking calls run in a dedicated thread pool (of `max_workers` threads),
+    off the event loop. With ``http2=True`` on the wrapped client, concurrent
+    calls share a few multiplexed connections instead of holding a socket per
+    in-flight call.
+    """
+
+    def __init__(self, vingd, max_workers=32, executor=None):
+        self.vingd = vingd
+        self.executor = executor or ThreadPoolExecutor(max_workers)
+
+    def __getattr__(self, name):
+        method = getattr(self.vingd, name)
+        if not callable(method):
+            return method
+
+        @functools.wraps(method)
+        async def call(*args, **kwargs):
+            loop = _running_loop()
+            return await loop.run_in_executor(
+                self.executor, functools.partial(method, *args, **kwargs))
+        return call
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+        self.vingd.close()
@@ -0,0 +1,85 @@
+"""
+ASGI version of `vingd.middleware.PurchaseMiddleware` (Python 3.5+).
+
+Token verification (a blocking `Vingd.verify_purchase` call) runs in an
+executor, so the event loop keeps serving other requests meanwhile, and
+purchases are committed in the background once the response is sent. The
+session's purchases are passed to the application in the connection
+`scope`, under ``vingd.purchase``, ``vingd.purchases`` and ``vingd.error``
+keys.
+
+Example::
+
+    from vingd import Vingd
+    from vingd.asgi import AsyncPurchaseMiddleware
+
+    v = Vingd(username="...", password="...")
+    app = AsyncPurchaseMiddleware(app, v, oid=OID, required=True)
+"""
+from .aio import _running_loop
+from .middleware import PurchaseSessions, _callback, _cookie, _set_cookie
+
+
+class AsyncPurchaseMiddleware(object):
+    """
+    ASGI middleware handling purchase callbacks of `app` (see
+    `vingd.middleware.PurchaseMiddleware`, for arguments). Verifications run
+    in `executor` (the loop's default executor, if `None`).
+    """
+
+    def __init__(self, app, vingd, oid=None, required=False, sessions=None,
+                 executor=None, **options):
+        self.app = app
+        self.oid = oid
+        self.required = required
+        self.executor = executor
+        self.sessions = sessions or PurchaseSessions(vingd, **options)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+
+        sessions = self.sessions
+        cookies = b'; '.join(v for k, v in scope.get('headers', ()) if k == b'cookie')
+        session = _cookie(cookies.decode('latin-1'))
+        query = scope.get('query_string', b'').decode('latin-1')
+        callback = _callback(query)
+        if callback is None or sessions.cached(callback[0], callback[1], session) is not None:
+            # nothing to verify: no blocking calls
+            result = sessions.request(session, query, self.oid)
+        else:
+            loop = _running_loop()
+            result = await loop.run_in_executor(
+                self.executor, sessions.request, session, query, self.oid)
+        new, purchase, purchases, pending, error = result
+
+        scope = dict(scope)
+        scope['vingd.purchase'] = purchase
+        scope['vingd.purchases'] = purchases
+        scope['vingd.error'] = error
+        cookie = None
+        if new != session:
+            secure = scope.get('scheme') == 'https'
+            cookie = (b'set-cookie', _set_cookie(new, secure).encode('latin-1'))
+
+        if self.required and purchase is None:
+            headers = [(b'content-type', b'text/plain')]
+            if cookie:
+                headers.append(cookie)
+            await send({'type': 'http.response.start', 'status': 403, 'headers': headers})
+            await send({'type': 'http.response.body', 'body': b'Purchase required.'})
+            return
+
+        status = []
+        async def send_wrapper(message):
+            if message['type'] == 'http.response.start':
+                status[:] = [message['status']]
+                if cookie:
+                    message = dict(message, headers=list(message.get('headers', ())) + [cookie])
+            await send(message)
+            if (message['type'] == 'http.response.body' and not message.get('more_body')
+                    and pending is not None and status and status[0] < 400):
+                # queued for the commit threads; doesn't block the loop
+                sessions.commit(pending)
+
+        await self.app(scope, receive, send_wrapper)
@@ -0,0 +1,145 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class RevalidationCache(object):
+    """
+    Client-side HTTP cache of (parsed) response data, stored along with its
+    validators (``ETag`` and/or ``Last-Modified`` response headers).
+    
+    Cached data is never served blindly: each subsequent request for the same
+    resource is made conditional (``If-None-Match``/``If-Modified-Since``), and
+    only if the backend confirms the cached copy is still fresh (``304 Not
+    Modified``), the cached data is returned -- without transferring and
+    parsing the payload again. Responses without validators are not cached at
+    all, so backends that don't support conditional requests simply see plain
+    requests.
+    
+    Cache holds at most `maxsize` entries (least recently used are evicted
+    first). It is safe to share between threads.
+    
+    Note: cached data is shared between all callers revalidating the same
+    resource, and it MUST NOT be modified in place.
+    """
+    
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.stats = {'stored': 0, 'revalidated': 0, 'evicted': 0}
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+    
+    def __len__(self):
+        return len(self._entries)
+    
+    def __getstate__(self):
+        # configuration only, cached data is not transferred
+        return {'maxsize': self.maxsize}
+    
+    def __setstate__(self, state):
+        self.__init__(**state)
+    
+    def __contains__(self, key):
+        return key in self._entries
+    
+    @property
+    def last_revalidated(self):
+        """`True` iff the last cacheable response (in the current thread) was
+        served from cache, after successful revalidation."""
+        return getattr(self._local, 'revalidated', False)
+    
+    def validators(self, key):
+        """Returns conditional request headers for resource `key` (empty
+        ``dict`` if `key` is not cached)."""
+        self._local.revalidated = False
+        entry = self._entries.get(key)
+        if entry is None:
+            return {}
+        data, etag, modified = entry
+        headers = {}
+        if etag:
+            headers['If-None-Match'] = etag
+        if modified:
+            headers['If-Modified-Since'] = modified
+        return headers
+    
+    def store(self, key, data, etag=None, modified=None):
+        """Caches `data` for resource `key`, iff at least one validator is
+        given (otherwise, a stale entry for `key` is dropped)."""
+        with self._lock:
+            if not etag and not modified:
+                self._entries.pop(key, None)
+                return
+            self._entries[key] = (data, etag, modified)
+            self.stats['stored'] += 1
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.stats['evicted'] += 1
+    
+    def revalidate(self, key):
+        """Marks cached entry for `key` as fresh (on ``304 Not Modified``) and
+        returns its data. Raises `KeyError` if `key` is not cached (anymore)."""
+        with self._lock:
+            data = self._entries[key][0]
+            # refresh LRU position
+            self._entries[key] = self._entries.pop(key)
+            self.stats['revalidated'] += 1
+        self._local.revalidated = True
+        return data
+    
+    def invalidate(self, key=None):
+        """Drops cached entry for `key`, or all entries if `key` is `None`."""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+
+class TTLCache(object):
+    """
+    Thread-safe mapping with entries expiring `ttl` seconds after they were
+    set, holding at most `maxsize` entries (oldest are evicted first).
+    """
+    
+    def __init__(self, ttl, maxsize=1024, clock=time.time):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.clock = clock
+        self.stats = {'hits': 0, 'misses': 0}
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def __len__(self):
+        return len(self._entries)
+    
+    def get(self, key, default=None):
+        """Returns unexpired value for `key`, or `default`."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > self.clock():
+                self.stats['hits'] += 1
+                return entry[0]
+            if entry is not None:
+                del self._entries[key]
+            self.stats['misses'] += 1
+            return default
+    
+    def set(self, key, value, ttl=None):
+        """Stores `value` under `key`, for `ttl` (default: `self.ttl`)
+        seconds."""
+        expires = self.clock() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (value, expires)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+    
+    def invalidate(self, key=None):
+        """Drops entry for `key`, or all entries if `key` is `None`."""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
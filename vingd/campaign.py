@@ -0,0 +1,297 @@
+"""
+Multi-process driver for large reward (`Vingd.reward_user`) and voucher
+(`Vingd.create_voucher`) campaigns.
+
+A campaign file (CSV with a header row, or JSONL) holds one operation per row:
+
+ * rewards: ``huid``, ``amount`` and (optional) ``description``,
+ * vouchers: ``amount`` and (optional) ``expires``, ``message``, ``gid``.
+   ``expires`` is an ISO8601 duration (e.g. ``P14D``) or timestamp.
+
+Each row is identified by its ``id`` column, or by its (1-based) row number if
+there's no ``id`` column. Rows are sharded across a pool of processes (each
+with its own pooled `Vingd` client, running a few threads), under a global
+(all processes) rate limit.
+
+Results are appended to a JSONL `results` file (``{"id": .., "result": ..}``)
+and failures to a `failures` file (``{"id": .., "error": ..}``) as they come
+in. Rows already in `results` are skipped, so a crashed (or interrupted) run
+is continued simply by running it again; failed rows are retried.
+
+Example::
+
+    from vingd import Vingd
+    from vingd.campaign import Campaign
+
+    v = Vingd(username="...", password="...")
+    campaign = Campaign(v, 'reward', processes=4, rate=50)
+    stats = campaign.run('rewards.csv', 'rewards.results.jsonl',
+                         'rewards.failures.jsonl')
+
+or, from the command line::
+
+    python -m vingd.campaign reward rewards.csv --processes 4 --rate 50
+
+Rewards are sent through a `vingd.rewards.RewardPipeline`, with an
+idempotency key derived from the campaign name and row ``id``, and recorded in
+a `vingd.rewards.RewardLedger` (by default, next to `results`) before they're
+sent. So a reward sent right before a crash, but not yet recorded in
+`results`, is not sent again on resume: it's taken from the ledger if it was
+completed, and reported as failed (uncertain) otherwise, to be resolved in the
+ledger.
+
+Note: a voucher created right before a crash, but not yet recorded in
+`results`, is created again on resume.
+"""
+import csv
+import json
+import multiprocessing
+import os
+import sys
+import time
+from collections import deque
+from itertools import islice
+
+from .exceptions import GeneralException, InvalidData
+from .records import Record
+from .rewards import RewardLedger, RewardPipeline
+from .scheduler import BULK, prioritized
+from .util import parse_duration, parse_isotime, pmap
+
+
+KINDS = ('reward', 'voucher')
+
+
+class RateLimit(object):
+    """
+    Limits the rate of operations to `rate` per second, across all processes
+    sharing this object (it has to be passed to child processes on their
+    creation, e.g. via `multiprocessing.Pool` initializer arguments).
+    """
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate
+        self._next = multiprocessing.Value('d', 0.0)
+
+    def acquire(self):
+        """Blocks until the next operation is allowed."""
+        with self._next.get_lock():
+            now = time.time()
+            at = max(now, self._next.value)
+            self._next.value = at + self.interval
+        if at > now:
+            time.sleep(at - now)
+
+
+def read_campaign(path):
+    """Yields campaign rows (dictionaries, with ``id`` set) read from a CSV or
+    JSONL (if `path` ends with ``.jsonl`` or ``.json``) file."""
+    jsonl = os.path.splitext(path)[1].lower() in ('.jsonl', '.json')
+    with open(path) as fp:
+        if jsonl:
+            rows = (json.loads(line) for line in fp if line.strip())
+        else:
+            rows = csv.DictReader(fp)
+        for n, row in enumerate(rows, 1):
+            if row.get('id') in (None, ''):
+                row['id'] = n
+            yield row
+
+
+def read_done(path):
+    """Returns the set of row ids recorded in the `results` file at `path`."""
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path) as fp:
+        for line in fp:
+            try:
+                done.add(json.loads(line)['id'])
+            except (ValueError, KeyError):
+                # truncated last line, after a crash
+                pass
+    return done
+
+
+def parse_expires(value):
+    """Converts voucher spec ``expires`` (ISO8601 duration or timestamp) to a
+    `Vingd.create_voucher` argument."""
+    if value in (None, ''):
+        return None
+    if isinstance(value, dict):
+        return value
+    if value.strip().upper().startswith('P'):
+        duration = parse_duration(value)
+        if not duration or duration.pop('years', 0) or duration.pop('months', 0):
+            raise InvalidData("Invalid voucher expiry duration: '%s'." % value)
+        return dict((k, v) for k, v in duration.items() if v)
+    try:
+        return parse_isotime(value)
+    except ValueError:
+        raise InvalidData("Invalid voucher expiry: '%s'." % value)
+
+
+def execute(vingd, kind, row, pipeline=None, key=None):
+    """Executes a single campaign `row` (of `kind` ``reward`` or
+    ``voucher``). Returns the (JSON serializable) result. Rewards are sent
+    through `pipeline` (`vingd.rewards.RewardPipeline`), if given, with
+    idempotency `key`."""
+    try:
+        amount = int(row['amount'])
+        if kind == 'reward':
+            args = (row['huid'], amount, row.get('description') or None)
+        else:
+            args = (amount, parse_expires(row.get('expires')),
+                    row.get('message') or '', row.get('gid') or None)
+    except (KeyError, TypeError, ValueError) as e:
+        raise InvalidData("Invalid campaign row %s (%r)." % (row['id'], e))
+    if kind == 'reward':
+        if pipeline is not None:
+            return pipeline.submit(*args, key=key)
+        return vingd.reward_user(*args)
+    return vingd.create_voucher(*args)['raw']
+
+
+def jsonable(value):
+    """`json.dumps` ``default``: records (see `vingd.records`) are encoded as
+    dictionaries, other unknown values (e.g. `datetime`) as strings."""
+    if isinstance(value, Record):
+        return value.to_dict()
+    return str(value)
+
+
+def describe(error):
+    """JSON serializable description of `error`."""
+    if isinstance(error, GeneralException):
+        return {'type': type(error).__name__, 'code': error.code,
+                'context': error.context, 'message': error.msg}
+    return {'type': type(error).__name__, 'message': str(error)}
+
+
+# per-process worker state
+_worker = {}
+
+def _init_worker(vingd, kind, limit, threads, name=None, ledger=None):
+    pipeline = None
+    if kind == 'reward' and ledger is not None:
+        pipeline = RewardPipeline(vingd, RewardLedger(ledger))
+    _worker.update(vingd=vingd, kind=kind, limit=limit, threads=threads,
+                   name=name, pipeline=pipeline)
+
+def _run_batch(rows):
+    vingd, kind, limit = _worker['vingd'], _worker['kind'], _worker['limit']
+    name, pipeline = _worker['name'], _worker['pipeline']
+    def run(row):
+        if limit is not None:
+            limit.acquire()
+        return execute(vingd, kind, row, pipeline, '%s:%s' % (name, row['id']))
+    return [
+        (row['id'], result, None if error is None else describe(error))
+        for row, result, error in pmap(prioritized(run, BULK), rows, _worker['threads'])
+    ]
+
+
+class Campaign(object):
+    """
+    Runs a campaign of `kind` (``reward`` or ``voucher``) operations with
+    `vingd` client (which is pickled, i.e. only its configuration is
+    transferred, to each of `processes` worker processes).
+
+    Each process runs `threads` concurrent requests, on batches of
+    `batch_size` rows. With `rate` set, at most `rate` operations per second
+    are started (in total). Requests are of `BULK` priority class (see
+    `vingd.scheduler`).
+
+    Reward idempotency keys are ``<name>:<row id>``, `name` being the
+    campaign file name (without extension) by default.
+    """
+
+    def __init__(self, vingd, kind, processes=None, threads=4, rate=None,
+                 batch_size=50, name=None):
+        if kind not in KINDS:
+            raise InvalidData("Unknown campaign kind: '%s'." % kind)
+        self.vingd = vingd
+        self.kind = kind
+        self.processes = processes or multiprocessing.cpu_count()
+        self.threads = threads
+        self.rate = rate
+        self.batch_size = batch_size
+        self.name = name
+
+    def batches(self, rows):
+        """Groups `rows` into lists of `batch_size`."""
+        rows = iter(rows)
+        while True:
+            batch = list(islice(rows, self.batch_size))
+            if not batch:
+                return
+            yield batch
+
+    def run(self, path, results, failures, progress=None, ledger=None):
+        """
+        Runs campaign from file `path`, appending to `results` and `failures`
+        files. Rows already in `results` are skipped. `progress`, if given, is
+        called with updated stats after each batch. Rewards are recorded in
+        the `ledger` file (``<results>.ledger.db`` by default).
+
+        :rtype: ``dict``
+        :returns: ``{'skipped': <n>, 'succeeded': <n>, 'failed': <n>}``
+        """
+        done = read_done(results)
+        stats = {'skipped': 0, 'succeeded': 0, 'failed': 0}
+        rows = read_campaign(path)
+
+        def skip(row):
+            if row['id'] in done:
+                stats['skipped'] += 1
+                return False
+            return True
+
+        limit = RateLimit(self.rate) if self.rate else None
+        name = self.name or os.path.splitext(os.path.basename(path))[0]
+        if self.kind == 'reward' and ledger is None:
+            ledger = results + '.ledger.db'
+        if ledger is not None:
+            # create the schema once, before workers open it concurrently
+            RewardLedger(ledger).close()
+        pool = multiprocessing.Pool(
+            self.processes, _init_worker,
+            (self.vingd, self.kind, limit, self.threads, name, ledger))
+        pending = deque()
+        try:
+            with open(results, 'a') as out, open(failures, 'a') as err:
+                for batch in self.batches(row for row in rows if skip(row)):
+                    pending.append(pool.apply_async(_run_batch, (batch,)))
+                    # keep a bounded number of batches in flight
+                    if len(pending) >= 2 * self.processes:
+                        self._write(pending.popleft().get(), out, err, stats, progress)
+                while pending:
+                    self._write(pending.popleft().get(), out, err, stats, progress)
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
+        return stats
+
+    @staticmethod
+    def _write(batch, out, err, stats, progress):
+        for id, result, error in batch:
+            if error is None:
+                out.write(json.dumps({'id': id, 'result': result}, default=jsonable) + '\n')
+                stats['succeeded'] += 1
+            else:
+                err.write(json.dumps({'id': id, 'error': error}, default=jsonable) + '\n')
+                stats['failed'] += 1
+        out.flush()
+        err.flush()
+        if progress is not None:
+            progress(stats)
+
+
+def main(argv=None):
+    from .cli import main
+    return main(['campaign'] + (sys.argv[1:] if argv is None else list(argv)))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,259 @@
+"""
+``vingd`` command-line interface, for bulk operations.
+
+Commands read JSONL (one JSON value per line) from `--input` (standard input
+by default) and write JSONL to `--output` (standard output by default), one
+line per input line, in order of completion. Malformed input lines are
+reported (and counted) as failed rows. Inputs are streamed through a
+bounded number of concurrent requests (`--workers`) on a pooled client, so
+any number of rows is processed in constant memory. With `--adaptive`, the
+number of requests in flight is adapted (up to `--workers`) to backend
+latency and errors (see `vingd.limiter.AdaptiveLimit`). Requests are of
+`BULK` priority class (see `vingd.scheduler`).
+
+Commands:
+
+ * ``history``: syncs voucher history into a local store (`--db`), and
+   exports (matching) log entries,
+ * ``create-vouchers``: creates vouchers from specs (``{"amount": ..,
+   "expires": "P14D", "message": .., "gid": ..}``),
+ * ``revoke``: revokes vouchers (``"<vid_encoded>"`` or ``{"vid_encoded":
+   ..}``),
+ * ``verify``: verifies (and with `--commit`, commits) purchase tokens
+   (``{"oid": .., "tid": ..}``),
+ * ``balances``: fetches account balances (``"<huid>"`` or ``{"huid": ..}``;
+   each distinct huid is fetched once, see
+   `Vingd.authorized_get_account_balances`),
+ * ``campaign``: runs a multi-process reward/voucher campaign (see
+   `vingd.campaign`).
+
+Credentials and endpoint are taken from `--username`, `--password` and
+`--endpoint` options, or ``VINGD_USERNAME``, ``VINGD_PASSWORD`` and
+``VINGD_ENDPOINT`` environment variables. Example::
+
+    export VINGD_USERNAME=... VINGD_PASSWORD=...
+    vingd history --db vouchers.db --action use > used.jsonl
+    cut -f1 huids.txt | jq -R . | vingd balances --workers 32
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+from itertools import islice
+
+from .campaign import Campaign, KINDS, describe, execute, jsonable
+from .exceptions import InvalidData
+from .history import VoucherHistory
+from .limiter import AdaptiveLimit
+from .scheduler import BULK, prioritized, priority_class
+from .schema import string_types
+from .util import parse_isotime, pmap
+
+
+def add_client_arguments(parser):
+    group = parser.add_argument_group('client')
+    group.add_argument('--endpoint', action='append',
+                       help="API endpoint URL (repeat for failover)")
+    group.add_argument('--username', default=os.environ.get('VINGD_USERNAME'))
+    group.add_argument('--password', default=os.environ.get('VINGD_PASSWORD'))
+    group.add_argument('--http2', action='store_true', default=None)
+
+
+def client(args, **kwargs):
+    """Creates `Vingd` client configured by parsed command-line `args`."""
+    from .client import Vingd
+    endpoint = args.endpoint
+    if not endpoint and os.environ.get('VINGD_ENDPOINT'):
+        endpoint = os.environ['VINGD_ENDPOINT'].split(',')
+    return Vingd(username=args.username, password=args.password,
+                 endpoint=endpoint, http2=args.http2, **kwargs)
+
+
+# rows per `cmd_balances` bulk lookup
+BALANCES_BATCH = 1000
+
+
+class Malformed(object):
+    """Input line that isn't valid JSON (reported as a failed row)."""
+
+    def __init__(self, number, line, error):
+        self.line = line
+        self.error = InvalidData("Malformed JSON on line %d (%s)." % (number, error))
+
+
+def read_jsonl(fp):
+    """Yields JSON values, one per (non-empty) line of `fp`, or `Malformed`
+    for lines that can't be parsed."""
+    for number, line in enumerate(fp, 1):
+        if line.strip():
+            try:
+                yield json.loads(line)
+            except ValueError as e:
+                yield Malformed(number, line.rstrip('\r\n'), e)
+
+
+def write_jsonl(fp, value):
+    fp.write(json.dumps(value, default=jsonable) + '\n')
+
+
+def _field(row, name):
+    return row.get(name) if isinstance(row, dict) else row
+
+
+def run_bulk(func, rows, out, workers):
+    """Applies `func` to each of `rows`, concurrently, writing ``{"input": ..,
+    "result": ..}`` (or ``"error"``) lines to `out`. Returns the number of
+    failed rows."""
+    def apply(row):
+        if isinstance(row, Malformed):
+            raise row.error
+        return func(row)
+    failed = 0
+    for row, result, error in pmap(prioritized(apply, BULK), rows, workers):
+        if isinstance(row, Malformed):
+            row = row.line
+        if error is None:
+            write_jsonl(out, {'input': row, 'result': result})
+        else:
+            write_jsonl(out, {'input': row, 'error': describe(error)})
+            failed += 1
+    return failed
+
+
+def cmd_history(vingd, args):
+    if args.db:
+        history = VoucherHistory(args.db)
+    else:
+        # on disk (not in memory), whatever the size of history
+        fd, path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        history = VoucherHistory(path)
+    try:
+        history.sync(vingd)
+        since = parse_isotime(args.since) if args.since else None
+        for entry in history.iterate(action=args.action, gid=args.gid,
+                                     create_after=since):
+            write_jsonl(args.output, entry)
+    finally:
+        history.close()
+        if not args.db:
+            os.unlink(history.path)
+    return 0
+
+
+def cmd_create_vouchers(vingd, args):
+    create = lambda row: execute(vingd, 'voucher', dict({'id': None}, **row))
+    return run_bulk(create, read_jsonl(args.input), args.output, args.workers)
+
+
+def cmd_revoke(vingd, args):
+    def revoke(row):
+        vid = row.get('vid_encoded') if isinstance(row, dict) else row
+        if not vid or not isinstance(vid, string_types):
+            # `revoke_vouchers` without a voucher id revokes all vouchers
+            raise InvalidData("Invalid voucher id: %r." % (vid,))
+        return vingd.revoke_vouchers(vid_encoded=vid)
+    return run_bulk(revoke, read_jsonl(args.input), args.output, args.workers)
+
+
+def cmd_verify(vingd, args):
+    def verify(row):
+        purchase = vingd.verify_purchase(row['oid'], row['tid'])
+        if args.commit:
+            purchase['commit'] = vingd.commit_purchase(
+                purchase['purchaseid'], purchase['transferid'])
+        return purchase
+    return run_bulk(verify, read_jsonl(args.input), args.output, args.workers)
+
+
+def cmd_balances(vingd, args):
+    rows, failed = read_jsonl(args.input), 0
+    with priority_class(BULK):
+        for batch in iter(lambda: list(islice(rows, BALANCES_BATCH)), []):
+            huids = []
+            for row in batch:
+                huid = None if isinstance(row, Malformed) else _field(row, 'huid')
+                huids.append(huid if isinstance(huid, string_types) else None)
+            lookup = vingd.authorized_get_account_balances(
+                [huid for huid in huids if huid is not None], args.workers)
+            for row, huid in zip(batch, huids):
+                if isinstance(row, Malformed):
+                    row, error = row.line, row.error
+                elif huid is None:
+                    error = InvalidData("Invalid huid: %r." % (row,))
+                else:
+                    error = lookup['errors'].get(huid)
+                if error is None:
+                    write_jsonl(args.output, {'input': row, 'result': lookup['balances'][huid]})
+                else:
+                    write_jsonl(args.output, {'input': row, 'error': describe(error)})
+                    failed += 1
+    return failed
+
+
+def cmd_campaign(vingd, args):
+    campaign = Campaign(vingd, args.kind, args.processes, args.threads, args.rate)
+    stats = campaign.run(
+        args.path,
+        args.results or args.path + '.results.jsonl',
+        args.failures or args.path + '.failures.jsonl',
+        ledger=args.ledger)
+    write_jsonl(args.output, stats)
+    return stats['failed']
+
+
+def parser():
+    parser = argparse.ArgumentParser(
+        prog='vingd', description="Vingd API bulk operations.")
+    commands = parser.add_subparsers(dest='command', metavar='command')
+    commands.required = True
+
+    def command(name, func, help, input=True):
+        sub = commands.add_parser(name, help=help)
+        sub.set_defaults(func=func)
+        add_client_arguments(sub)
+        if input:
+            sub.add_argument('--input', type=argparse.FileType('r'), default=sys.stdin)
+        sub.add_argument('--output', type=argparse.FileType('w'), default=sys.stdout)
+        sub.add_argument('--workers', type=int, default=8,
+                         help="max. concurrent requests")
+        sub.add_argument('--adaptive', action='store_true',
+                         help="adapt concurrent requests to backend load")
+        return sub
+
+    sub = command('history', cmd_history, "export voucher history", input=False)
+    sub.add_argument('--db', help="local history store (synced incrementally)")
+    sub.add_argument('--action', choices=('add', 'use', 'revoke', 'expire'))
+    sub.add_argument('--gid')
+    sub.add_argument('--since', help="ISO8601 timestamp")
+
+    command('create-vouchers', cmd_create_vouchers, "create vouchers")
+    command('revoke', cmd_revoke, "revoke vouchers")
+    sub = command('verify', cmd_verify, "verify purchase tokens")
+    sub.add_argument('--commit', action='store_true', help="also commit purchases")
+    command('balances', cmd_balances, "fetch account balances")
+
+    sub = command('campaign', cmd_campaign, "run a reward/voucher campaign",
+                  input=False)
+    sub.add_argument('kind', choices=KINDS)
+    sub.add_argument('path', help="campaign file (.csv or .jsonl)")
+    sub.add_argument('--results', help="default: <path>.results.jsonl")
+    sub.add_argument('--failures', help="default: <path>.failures.jsonl")
+    sub.add_argument('--ledger', help="rewards ledger, default: <results>.ledger.db")
+    sub.add_argument('--processes', type=int)
+    sub.add_argument('--threads', type=int, default=4)
+    sub.add_argument('--rate', type=float, help="max. operations per second")
+    return parser
+
+
+def main(argv=None):
+    args = parser().parse_args(argv)
+    limiter = AdaptiveLimit(max_limit=max(args.workers, 1)) if args.adaptive else None
+    vingd = client(args, pool_size=max(args.workers, 1), limiter=limiter)
+    try:
+        failed = args.func(vingd, args)
+    finally:
+        args.output.flush()
+        vingd.close()
+    return 1 if failed else 0
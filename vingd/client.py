@@ -13,19 +13,58 @@ except ImportError:
     import http.client as httplib
 
 try:
-    from urlparse import urljoin, urlparse
+    from urlparse import urljoin
 except ImportError:
-    from urllib.parse import urljoin, urlparse
+    from urllib.parse import urljoin
 
 import base64
+import copy
+import os
+import socket
+import threading
+import time
+import weakref
+import zlib
 from datetime import datetime, timedelta
 
+from .cache import RevalidationCache, TTLCache
+from .endpoints import EndpointSet
+from .hedging import HedgePolicy
+from .limiter import AdaptiveLimit, batch_workers
 from .exceptions import Forbidden, GeneralException, InternalError, InvalidData, NotFound
+from .pool import ConnectionPool, ConnectError
+from .profiling import mark, profiled
+from .resolver import Resolver
+from .records import Object, Order, Token, Voucher, VoucherLogEntry
+from .scheduler import INTERACTIVE, PriorityScheduler, current_priority, prioritized
+from .schema import OPERATIONS
+from .tls import TLSContext
+from .tracing import annotate, traced
+from .transport import PooledTransport
 from .response import Codes
-from .util import quote, hash, safeformat, now, absdatetime
+from .util import quote, hash, safeformat, now, absdatetime, compress, decompress, iterread, pmap
 from . import __version__
 
 
+# live clients, reinitialized in child processes after `fork()`
+_clients = weakref.WeakSet()
+
+def _reinit_after_fork():
+    for client in list(_clients):
+        client._after_fork()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reinit_after_fork)
+
+
+def _dumps(obj):
+    """JSON-encodes request body `obj` (profiled as the ``encode`` phase)."""
+    mark('build')
+    body = json.dumps(obj)
+    mark('encode')
+    return body
+
+
 class Vingd:
     # production urls
     URL_ENDPOINT = "https://api.vingd.com/broker/v1"
@@ -38,54 +77,386 @@ class Vingd:
     EXP_VOUCHER = {'days': 7}
     
     USER_AGENT = 'vingd-api-python/'+__version__
+    ACCEPT_ENCODING = 'gzip, deflate'
+    
+    # requests safe to resend to another endpoint, even if the failed one
+    # might have received them
+    IDEMPOTENT = ('GET', 'PUT', 'DELETE')
     
     api_key = None
     api_secret = None
     api_endpoint = URL_ENDPOINT
     usr_frontend = URL_FRONTEND
     
+    # request bodies of at least this many bytes are sent gzip-compressed
+    # (`None` disables request compression)
+    compress_min_size = None
+    
+    # `RevalidationCache` for conditional GETs of cacheable resources (objects,
+    # user profile), or `None` to disable
+    cache = None
+    
+    # connection pool: max. number of concurrent HTTP/1.1 connections, socket
+    # timeout (in seconds), and whether to multiplex requests over HTTP/2
+    # (requires `h2` package)
+    pool_size = 10
+    timeout = None
+    http2 = False
+    
+    # how long (in seconds) resolved endpoint addresses are cached
+    dns_ttl = 300
+    
+    # interval (in seconds) of background endpoints health checks (`None` to
+    # disable)
+    health_interval = None
+    
+    # `HedgePolicy` for latency-critical read calls (`None` disables hedging)
+    hedging = None
+    
+    # `AdaptiveLimit` on the number of requests in flight (`None` for no
+    # limit, other than `pool_size`)
+    limiter = None
+    
+    # `PriorityScheduler` admitting requests by priority class (see
+    # `vingd.scheduler`), or `None` to disable; class of requests not
+    # prioritized otherwise
+    scheduler = None
+    default_priority = INTERACTIVE
+    
+    # how long (in seconds) balances fetched in bulk are cached
+    balance_ttl = 10
+    
+    # return compact records (see `vingd.records`) instead of plain
+    # dictionaries for orders, vouchers, voucher log entries, tokens and
+    # objects
+    records = False
+    
+    # `vingd.transport.Transport` requests are sent with (`None` for the
+    # default, `PooledTransport` over the client's connection pools)
+    transport = None
+    
+    # `vingd.profiling.Profiler` API calls are profiled with (`None` to
+    # disable; can be changed at any time)
+    profiler = None
+    
+    # `vingd.tracing.Tracer` API calls and HTTP attempts are recorded as spans
+    # with (`None` to disable)
+    tracer = None
+    
     def __init__(self, key=None, secret=None, endpoint=None, frontend=None,
-                 username=None, password=None):
+                 username=None, password=None, compress_min_size=None,
+                 cache=None, pool_size=None, timeout=None, http2=None,
+                 warmup=None, health_interval=None, hedging=None, records=None,
+                 transport=None, profiler=None, tracer=None, limiter=None,
+                 scheduler=None, default_priority=None, dns_ttl=None,
+                 balance_ttl=None):
         # `key`, `secret` are forward compatible arguments (we'll switch to oauth soon)
         self.api_key = key or username
         self.api_secret = secret or hash(password)
         if not self.api_key or not self.api_secret:
             raise Exception("API key/username and/or API secret/password undefined.")
-        if endpoint: self.api_endpoint = endpoint
+        # `endpoint` can be a list of (regional) endpoints, used for failover
+        # and latency-aware routing (see `EndpointSet`)
+        if isinstance(endpoint, (list, tuple)):
+            self.endpoints = EndpointSet(endpoint)
+            self.api_endpoint = endpoint[0]
+        else:
+            if endpoint: self.api_endpoint = endpoint
+            self.endpoints = EndpointSet([self.api_endpoint])
         if frontend: self.usr_frontend = frontend
+        if compress_min_size is not None: self.compress_min_size = compress_min_size
+        if cache is True: cache = RevalidationCache()
+        if cache not in (None, False): self.cache = cache
+        if pool_size is not None: self.pool_size = pool_size
+        if timeout is not None: self.timeout = timeout
+        if http2 is not None: self.http2 = http2
+        if hedging is True: hedging = HedgePolicy()
+        if hedging: self.hedging = hedging
+        if limiter is True: limiter = AdaptiveLimit()
+        if limiter: self.limiter = limiter
+        if scheduler is True: scheduler = PriorityScheduler(self.pool_size)
+        if scheduler: self.scheduler = scheduler
+        if default_priority is not None: self.default_priority = default_priority
+        if records is not None: self.records = records
+        self.transport = transport or PooledTransport(self)
+        if profiler is not None: self.profiler = profiler
+        if tracer is not None: self.tracer = tracer
+        self._pid = os.getpid()
+        _clients.add(self)
+        self._pools = {}
+        self._pools_lock = threading.Lock()
+        if dns_ttl is not None: self.dns_ttl = dns_ttl
+        if balance_ttl is not None: self.balance_ttl = balance_ttl
+        self.resolver = Resolver(self.dns_ttl)
+        self.balances = TTLCache(self.balance_ttl, maxsize=100000)
+        
+        # one SSL context (CA certs loaded once) per client, shared by all
+        # pooled connections, which also resume TLS sessions on reconnect
+        self.tls = TLSContext()
+        self.tls_h2 = None
+        if self.http2:
+            from .http2 import HTTP2Connection
+            self.tls_h2 = TLSContext(alpn_protocols=HTTP2Connection.ALPN_PROTOCOLS)
+        
+        # optional background connection pre-warming
+        self.warmup_time = None
+        self.warmup_error = None
+        self._warmup_thread = None
+        if warmup:
+            self._warmup_thread = threading.Thread(
+                target=self._background_warmup, args=(warmup,))
+            self._warmup_thread.daemon = True
+            self._warmup_thread.start()
+        
+        # optional periodic endpoints health checks
+        if health_interval is not None: self.health_interval = health_interval
+        self._closed = threading.Event()
+        if self.health_interval and len(self.endpoints) > 1:
+            checker = threading.Thread(target=self._health_loop)
+            checker.daemon = True
+            checker.start()
+    
+    def __getstate__(self):
+        """Client configuration only (credentials, endpoints, policies and
+        all other constructor options, except the one-off `warmup`), without
+        any connections, threads or cached data."""
+        return {
+            'key': self.api_key,
+            'secret': self.api_secret,
+            'endpoint': [endpoint.url for endpoint in self.endpoints],
+            'frontend': self.usr_frontend,
+            'compress_min_size': self.compress_min_size,
+            'cache': self.cache,
+            'pool_size': self.pool_size,
+            'timeout': self.timeout,
+            'http2': self.http2,
+            'health_interval': self.health_interval,
+            'hedging': self.hedging,
+            'limiter': self.limiter,
+            'scheduler': self.scheduler,
+            'default_priority': self.default_priority,
+            'dns_ttl': self.dns_ttl,
+            'balance_ttl': self.balance_ttl,
+            'records': self.records,
+            'transport': None if isinstance(self.transport, PooledTransport) else self.transport,
+            'profiler': self.profiler,
+            'tracer': self.tracer
+        }
+    
+    def __setstate__(self, state):
+        self.__init__(**state)
+    
+    def _after_fork(self):
+        """Rebuilds connection pools, locks and threads in a forked child
+        process. Inherited connections are dropped without being closed (or
+        shut down), not to disturb the parent's connections."""
+        state = self.__getstate__()
+        for name in ('cache', 'hedging', 'limiter', 'scheduler', 'profiler'):
+            if state[name] is not None:
+                # a fresh instance with the same configuration (copied via
+                # `__getstate__`): inherited locks might be held, and
+                # counters include the parent's requests in flight
+                state[name] = copy.copy(state[name])
+        self.__setstate__(state)
+    
+    @property
+    def revalidated(self):
+        """`True` iff the last cacheable response (in the current thread) was
+        served from `cache`, after the backend confirmed it's still fresh."""
+        return self.cache is not None and self.cache.last_revalidated
+    
+    def connection_pool(self, host, port=443):
+        """Returns (lazily created) `ConnectionPool` for ``host:port``."""
+        if self._pid != os.getpid():
+            # forked, but not reinitialized (no `os.register_at_fork`)
+            self._after_fork()
+        with self._pools_lock:
+            pool = self._pools.get((host, port))
+            if pool is None:
+                pool = self._pools[(host, port)] = ConnectionPool(
+                    host, port, maxsize=self.pool_size, timeout=self.timeout,
+                    http2=self.http2, stream_timeout=self.timeout,
+                    resolver=self.resolver, tls=self.tls, tls_h2=self.tls_h2
+                )
+            return pool
+    
+    @property
+    def tls_stats(self):
+        """Counts of ``full`` and ``resumed`` TLS handshakes."""
+        stats = dict(self.tls.stats)
+        if self.tls_h2 is not None:
+            for kind, count in self.tls_h2.stats.items():
+                stats[kind] += count
+        return stats
+    
+    def health_check(self):
+        """
+        Probes all endpoints (by opening a fresh connection to each, which is
+        then kept in the pool), updating their health and latency estimate.
+        
+        :rtype: ``dict``
+        :returns: ``{<endpoint_url>: <connect_time_in_seconds> | None}``, with
+            `None` for unreachable endpoints.
+        """
+        results = {}
+        for endpoint in self.endpoints:
+            try:
+                latency = self.connection_pool(endpoint.host, endpoint.port).probe()
+            except (httplib.HTTPException, socket.error):
+                self.endpoints.failure(endpoint)
+                latency = None
+            else:
+                self.endpoints.success(endpoint, latency)
+            results[endpoint.url] = latency
+        return results
+    
+    def _health_loop(self):
+        while not self._closed.wait(self.health_interval):
+            self.health_check()
+    
+    def endpoint_stats(self):
+        """Returns health, latency, request and pool statistics for each
+        endpoint."""
+        return [{
+            'url': endpoint.url,
+            'healthy': endpoint.healthy,
+            'latency': endpoint.latency,
+            'requests': endpoint.stats['requests'],
+            'errors': endpoint.stats['errors'],
+            'pool': dict(self.connection_pool(endpoint.host, endpoint.port).stats)
+        } for endpoint in self.endpoints]
+    
+    def warmup(self, connections=None, timeout=None):
+        """
+        Resolves endpoint addresses and opens `connections` pooled connections
+        (TLS handshake included) to each endpoint, ahead of time. Returns the
+        time (in seconds) it took.
+        
+        If `connections` is not given and a background warm-up (started with
+        the ``warmup=N`` constructor argument) is in progress, waits (at most
+        `timeout` seconds) for it to finish instead, and returns its duration
+        (or `None` on timeout). Suitable for readiness probes.
+        """
+        if connections is None and self._warmup_thread is not None:
+            self._warmup_thread.join(timeout)
+            if self.warmup_error is not None:
+                raise self.warmup_error
+            return self.warmup_time
+        started = time.time()
+        for endpoint in self.endpoints:
+            self.connection_pool(endpoint.host, endpoint.port).warmup(connections or 1)
+        self.warmup_time = time.time() - started
+        return self.warmup_time
+    
+    def _background_warmup(self, connections):
+        try:
+            self.warmup(connections)
+        except Exception as e:
+            self.warmup_error = e
+    
+    def close(self):
+        """Closes all idle pooled connections (and stops health checks)."""
+        self._closed.set()
+        with self._pools_lock:
+            pools, self._pools = self._pools, {}
+        for pool in pools.values():
+            pool.close()
     
-    def request(self, verb, subpath, data=''):
+    def request(self, verb, subpath, data='', cacheable=False, hedge=False,
+                headers=None, priority=None):
         """
         Generic Vingd-backend authenticated request (currently HTTP Basic Auth
         over HTTPS, but OAuth1 in the future).
         
+        Requests are sent over pooled keep-alive connections (see
+        `connection_pool`), optionally multiplexed over HTTP/2, to the fastest
+        available endpoint (see `EndpointSet`). On connection errors, requests
+        fail over to the next endpoint (non-idempotent requests only if they
+        certainly weren't sent).
+        
+        Response compression (``gzip``/``deflate``) is negotiated
+        transparently, and response body is decompressed as it's being read
+        (it's parsed as JSON once complete: parsing isn't incremental).
+        Request body is gzip-compressed if it's at least `compress_min_size`
+        bytes long.
+        
+        If `cacheable` (and a `cache` is configured), a ``GET`` request is made
+        conditional on validators of the previously cached response, and on
+        ``304 Not Modified`` cached data is returned.
+        
+        If `hedge` is set (and `hedging` policy is configured), a slow request
+        is duplicated, and the first response is used. Only read-only requests
+        should be hedged.
+        
+        Additional request `headers` (``dict``) are sent as given.
+        
+        With a `scheduler`, the request waits for admission according to its
+        `priority` class (see `vingd.scheduler`), and with a `limiter`, for
+        the adaptive concurrency limit (with both, the scheduler admits
+        requests within the limit).
+        
         :returns: Data ``dict``, or raises exception.
         """
         if not self.api_key or not self.api_secret:
             raise Exception("Vingd authentication credentials undefined.")
         
-        endpoint = urlparse(self.api_endpoint)
-        if endpoint.scheme != 'https':
-            raise Exception("Invalid Vingd endpoint URL (non-https).")
-        
-        host = endpoint.netloc.split(':')[0]
-        port = 443
-        path = urljoin(endpoint.path+'/', subpath)
-        
         creds = "%s:%s" % (self.api_key, self.api_secret)
-        headers = {
+        extra, headers = headers, {
             'Authorization': b'Basic ' + base64.b64encode(creds.encode('ascii')),
-            'User-Agent': self.USER_AGENT
+            'User-Agent': self.USER_AGENT,
+            'Accept-Encoding': self.ACCEPT_ENCODING
         }
+        if extra:
+            headers.update(extra)
+        cache = self.cache if cacheable and verb.lower() == 'get' else None
+        if cache is not None:
+            headers.update(cache.validators(subpath))
+        mark('build')
+        if data and self.compress_min_size is not None and len(data) >= self.compress_min_size:
+            data = compress(data)
+            headers['Content-Encoding'] = 'gzip'
+            mark('encode')
+        verb = verb.upper()
+        scheduler, limiter = self.scheduler, self.limiter
+        if scheduler is not None:
+            priority = priority or current_priority(self.default_priority)
+            # within the adaptive limit, if any (so it's not filled by lower
+            # priority requests, regardless of slots reserved)
+            waited = scheduler.acquire(priority, limiter)
+            annotate(**{'queue.wait': waited, 'priority': priority})
+        if limiter is not None:
+            limiter.acquire(wait=scheduler is None)
+        if scheduler is not None or limiter is not None:
+            mark('pool')
+        started, code = time.time(), None
         try:
-            conn = httplib.HTTPSConnection(host, port)
-            conn.request(verb.upper(), quote(path), data, headers)
-            r = conn.getresponse()
-            content = r.read().decode('ascii')
-            code = r.status
-            conn.close()
-        except httplib.HTTPException as e:
+            if hedge and self.hedging is not None:
+                fetch = lambda exclude=(): self._fetch(verb, subpath, data, headers, exclude)
+                # hedge on another endpoint, if there is one
+                exclude = [self.endpoints.select()] if len(self.endpoints) > 1 else []
+                hedge = lambda fetch=fetch: fetch(exclude)
+                if self.tracer is not None:
+                    # attempts run in other threads
+                    fetch, hedge = self.tracer.wrap(fetch), self.tracer.wrap(hedge, 'hedge')
+                code, content, etag, modified = self.hedging.call(fetch, hedge)
+                mark('wait')
+            else:
+                code, content, etag, modified = self._fetch(verb, subpath, data, headers)
+        except (httplib.HTTPException, socket.error, zlib.error) as e:
             raise InternalError('HTTP request failed! (Network error? Installation error?)')
+        finally:
+            if limiter is not None:
+                limiter.release(time.time() - started,
+                                code is None or code >= 500 or code == Codes.TOO_MANY_REQUESTS)
+            if scheduler is not None:
+                scheduler.release(priority)
+        
+        if code == Codes.NOT_MODIFIED and cache is not None:
+            try:
+                return cache.revalidate(subpath)
+            except KeyError:
+                # evicted in the meantime, refetch unconditionally
+                return self.request(verb, subpath, data, headers=extra, priority=priority)
         
         try:
             content = json.loads(content)
@@ -94,28 +465,116 @@ class Vingd:
         
         if 200 <= code <= 299:
             try:
-                return content['data']
+                data = content['data']
             except:
                 raise InvalidData('Invalid server DATA response format!')
+            if cache is not None:
+                cache.store(subpath, data, etag, modified)
+            mark('decode')
+            return data
         
+        mark('decode')
         try:
-            message = content['message']
-            context = content['context']
-        except:
-            raise InvalidData('Invalid server ERROR response format!')
-        
-        if code == Codes.BAD_REQUEST:
-            raise InvalidData(message, context)
-        elif code == Codes.FORBIDDEN:
-            raise Forbidden(message, context)
-        elif code == Codes.NOT_FOUND:
-            raise NotFound(message, context)
-        elif code == Codes.INTERNAL_SERVER_ERROR:
-            raise InternalError(message, context)
-        elif code == Codes.CONFLICT:
-            raise GeneralException(message, context)
+            try:
+                message = content['message']
+                context = content['context']
+            except:
+                raise InvalidData('Invalid server ERROR response format!')
+            
+            if code == Codes.BAD_REQUEST:
+                raise InvalidData(message, context)
+            elif code == Codes.FORBIDDEN:
+                raise Forbidden(message, context)
+            elif code == Codes.NOT_FOUND:
+                raise NotFound(message, context)
+            elif code == Codes.INTERNAL_SERVER_ERROR:
+                raise InternalError(message, context)
+            elif code == Codes.CONFLICT:
+                raise GeneralException(message, context)
+            
+            raise GeneralException(message, context, code)
+        finally:
+            mark('raise')
+    
+    def _fetch(self, verb, subpath, data, headers, exclude=()):
+        """Sends request and reads the response. Returns ``(code, content,
+        etag, last_modified)``."""
+        r = self._send(verb, subpath, data, headers, exclude)
+        try:
+            encoding = r.getheader('Content-Encoding')
+            try:
+                content = b''.join(decompress(iterread(r), encoding)).decode('ascii')
+            except ValueError:
+                # unsupported content encoding (or non-ASCII body)
+                raise InternalError('Invalid server response encoding! (%s)' % encoding)
+            mark('read')
+            return r.status, content, r.getheader('ETag'), r.getheader('Last-Modified')
+        finally:
+            r.close()
+    
+    def _send(self, verb, subpath, data, headers, exclude=()):
+        """Sends request (with `transport`) to the best available endpoint
+        (not in `exclude`, if possible), failing over to other endpoints on connection errors.
+        Returns the response."""
+        tried = list(exclude) if len(exclude) < len(self.endpoints) else []
+        attempt = 0
+        while True:
+            attempt += 1
+            endpoint = self.endpoints.select(exclude=tried)
+            path = quote(urljoin(endpoint.path+'/', subpath))
+            mark('build')
+            span = None
+            if self.tracer is not None:
+                span = self.tracer.start_span('HTTP %s' % verb, {
+                    'http.method': verb,
+                    'http.host': endpoint.host,
+                    'http.path': path,
+                    'attempt': attempt
+                })
+                headers = dict(headers, traceparent=span.traceparent)
+            started = time.time()
+            try:
+                r = self.transport.send(endpoint, verb, path, headers, data)
+            except (httplib.HTTPException, socket.error) as e:
+                if span is not None:
+                    span.finish(e)
+                self.endpoints.failure(endpoint)
+                tried.append(endpoint)
+                retry = isinstance(e, ConnectError) or verb in self.IDEMPOTENT
+                if not retry or len(set(tried)) >= len(self.endpoints):
+                    raise
+                continue
+            except Exception as e:
+                if span is not None:
+                    span.finish(e)
+                raise
+            self.endpoints.success(endpoint, time.time() - started)
+            if span is not None:
+                span.attributes['http.status_code'] = r.status
+                span.finish()
+            mark('wait')
+            return r
+    
+    @traced
+    @profiled
+    def call(self, operation, params=None, **options):
+        """
+        Calls `operation` (name of a `vingd.schema.Operation` in
+        `vingd.schema.OPERATIONS`) with `params` (``dict``), validated
+        locally. Additional `options` (e.g. `hedge`, `headers`, `priority`) are passed on
+        to `request`.
         
-        raise GeneralException(message, context, code)
+        :returns: Data ``dict``, or raises exception (`InvalidData` if
+            `params` are invalid).
+        """
+        try:
+            operation = OPERATIONS[operation]
+        except KeyError:
+            raise InvalidData("Unknown operation: '%s'." % operation)
+        verb, path, body = operation.build(params or {})
+        options.setdefault('cacheable', operation.cacheable)
+        options.setdefault('hedge', operation.hedge)
+        return self.request(verb, path, body, **options)
     
     @staticmethod
     def _extract_id_from_batch_response(r, name='id'):
@@ -150,6 +609,8 @@ class Vingd:
                 parts.append(quote(k+"="+fv))
         return "/".join(parts)
     
+    @traced
+    @profiled
     def create_object(self, name, url):
         """
         CREATES a single object in Vingd Object registry.
@@ -168,14 +629,11 @@ class Vingd:
         :resource: ``registry/objects/``
         :access: authorized users
         """
-        r = self.request('post', 'registry/objects/', json.dumps({
-            'description': {
-                'name': name,
-                'url': url
-            }
-        }))
+        r = self.call('create_object', {'name': name, 'url': url})
         return self._extract_id_from_batch_response(r, 'oid')
     
+    @traced
+    @profiled
     def verify_purchase(self, oid, tid):
         """
         VERIFIES token ``tid`` and returns token data associated with ``tid``
@@ -228,11 +686,14 @@ class Vingd:
         :resource: ``objects/<oid>/tokens/<tid>``
         :access: authenticated user MUST be the object's owner
         """
-        return self.request(
-            'get',
-            safeformat('objects/{:int}/tokens/{:hex}', oid, tid)
+        token = self.call(
+            'verify_purchase', {'oid': oid, 'tid': tid},
+            hedge=self.hedging is not None and self.hedging.verify_purchase
         )
+        return Token.convert(token) if self.records else token
     
+    @traced
+    @profiled
     def commit_purchase(self, purchaseid, transferid):
         """
         DECLARES a purchase defined with ``purchaseid`` (bound to vingd transfer
@@ -263,12 +724,13 @@ class Vingd:
         :resource: ``purchases/<purchaseid>``
         :access: authorized users (ACL flag: ``type.business``)
         """
-        return self.request(
-            'put',
-            safeformat('purchases/{:int}', purchaseid),
-            json.dumps({'transferid': transferid})
-        )
+        return self.call('commit_purchase', {
+            'purchaseid': purchaseid,
+            'transferid': transferid
+        })
     
+    @traced
+    @profiled
     def create_order(self, oid, price, context=None, expires=None):
         """
         CREATES a single order for object ``oid``, with price set to ``price``
@@ -316,15 +778,16 @@ class Vingd:
         :access: authorized users
         """
         expires = absdatetime(expires, default=self.EXP_ORDER)
-        orders = self.request(
-            'post',
-            safeformat('objects/{:int}/orders/', oid),
-            json.dumps({
-                'price': price,
-                'order_expires': expires.isoformat(),
-                'context': context
-            }))
+        orders = self.call('create_order', {
+            'oid': oid,
+            'price': price,
+            'order_expires': expires.isoformat(),
+            'context': context
+        })
         orderid = self._extract_id_from_batch_response(orders)
+        if self.records:
+            return Order(frontend=self.usr_frontend, id=orderid, expires=expires,
+                         context=context, object={'id': oid, 'price': price})
         return {
             'id': orderid,
             'expires': expires,
@@ -339,6 +802,8 @@ class Vingd:
             }
         }
     
+    @traced
+    @profiled
     def get_orders(self, oid=None, include_expired=False, orderid=None):
         """
         FETCHES filtered orders. All arguments are optional.
@@ -369,9 +834,12 @@ class Vingd:
                 safeformat('objects/{:int}/', oid) if oid else "",
                 "all/" if include_expired else "",
                 safeformat('{:int}', orderid) if orderid else ""
-            )
+            ),
+            hedge=True
         )
     
+    @traced
+    @profiled
     def get_order(self, orderid):
         """
         FETCHES a single order defined with ``orderid``, or fails if order is
@@ -391,8 +859,10 @@ class Vingd:
         :access: authorized users (authenticated user MUST be the object/order
             owner)
         """
-        return self.get_orders(orderid=orderid)
+        return self.call('get_order', {'orderid': orderid})
     
+    @traced
+    @profiled
     def update_object(self, oid, name, url):
         """
         UPDATES a single object in Vingd Object registry.
@@ -414,18 +884,11 @@ class Vingd:
         :resource: ``registry/objects/<oid>/``
         :access: authorized user MUST be the object owner
         """
-        r = self.request(
-            'put',
-            safeformat('registry/objects/{:int}/', oid),
-            json.dumps({
-                'description': {
-                    'name': name,
-                    'url': url
-                }
-            })
-        )
+        r = self.call('update_object', {'oid': oid, 'name': name, 'url': url})
         return self._extract_id_from_batch_response(r, 'oid')
     
+    @traced
+    @profiled
     def get_objects(self, oid=None,
                     since=None, until=None, last=None, first=None):
         """
@@ -470,8 +933,11 @@ class Vingd:
                                since=('isobasic', absdatetime(since)),
                                until=('isobasic', absdatetime(until)),
                                first=('int', first), last=('int', last))
-        return self.request('get', resource)
+        objects = self.request('get', resource, cacheable=True, hedge=True)
+        return Object.convert(objects) if self.records else objects
     
+    @traced
+    @profiled
     def get_object(self, oid):
         """
         FETCHES a single object, referenced by its ``oid``.
@@ -494,8 +960,11 @@ class Vingd:
         :access: authorized users (only objects owned by the authenticated user
             are returned)
         """
-        return self.request('get', safeformat('registry/objects/{:int}', oid))
+        obj = self.call('get_object', {'oid': oid})
+        return Object.convert(obj) if self.records else obj
     
+    @traced
+    @profiled
     def get_user_profile(self):
         """
         FETCHES profile dictionary of the authenticated user.
@@ -509,8 +978,10 @@ class Vingd:
         :access: authorized users; only authenticated user's metadata can be
             fetched (UID is automatically set to the authenticated user's UID)
         """
-        return self.request('get', 'id/users')
+        return self.call('get_user_profile')
     
+    @traced
+    @profiled
     def get_account_balance(self):
         """
         FETCHES the account balance for the authenticated user.
@@ -523,8 +994,10 @@ class Vingd:
         :access: authorized users; authenticated user's account data will be
             fetched
         """
-        return int(self.request('get', 'fort/accounts')['balance'])
+        return int(self.call('get_account_balance')['balance'])
     
+    @traced
+    @profiled
     def authorized_get_account_balance(self, huid):
         """
         FETCHES the account balance for the user defined with `huid`.
@@ -537,9 +1010,57 @@ class Vingd:
         :access: authorized users; delegate permission required for the
             requester to read user's balance: ``get.account.balance``
         """
-        acc = self.request('get', safeformat('fort/accounts/{:hex}', huid))
+        acc = self.call('authorized_get_account_balance', {'huid': huid})
         return int(acc['balance'])
     
+    @traced
+    @profiled
+    def authorized_get_account_balances(self, huids, workers=None):
+        """
+        FETCHES account balances for all users defined with `huids` (any
+        iterable), with at most `workers` requests in flight (see
+        `vingd.limiter.batch_workers`). Balances are
+        cached for `balance_ttl` seconds, so repeated lookups within that time
+        are not sent again.
+        
+        A failed lookup doesn't abort the others: its `huid` is reported under
+        ``errors`` instead, with the exception raised.
+        
+        :rtype: ``dict``
+        :returns:
+            ``{'balances': {<huid>: <amount_in_cents>, ...},
+            'errors': {<huid>: <exception>, ...}}``
+        :resource: ``fort/accounts/<huid>``
+        
+        :access: authorized users; delegate permission required for the
+            requester to read users' balances: ``get.account.balance``
+        """
+        balances, errors, missing = {}, {}, []
+        for huid in huids:
+            if huid in balances:
+                continue
+            balance = self.balances.get(huid)
+            if balance is None:
+                missing.append(huid)
+                balances[huid] = None
+            else:
+                balances[huid] = balance
+        # lookups (in worker threads) of the caller's priority class
+        fetch = prioritized(self.authorized_get_account_balance,
+                            current_priority(self.default_priority))
+        if self.tracer is not None:
+            fetch = self.tracer.wrap(fetch)
+        for huid, balance, error in pmap(fetch, missing, batch_workers(self, workers)):
+            if error is not None:
+                del balances[huid]
+                errors[huid] = error
+                continue
+            balances[huid] = balance
+            self.balances.set(huid, balance)
+        return {'balances': balances, 'errors': errors}
+    
+    @traced
+    @profiled
     def authorized_purchase_object(self, oid, price, huid):
         """Does delegated (pre-authorized) purchase of `oid` in the name of
         `huid`, at price `price` (vingd transferred from `huid` to consumer's
@@ -552,15 +1073,14 @@ class Vingd:
             delegate permission required for the requester to charge the
             user: ``purchase.object``
         """
-        return self.request(
-            'post',
-            safeformat('objects/{:int}/purchases', oid),
-            json.dumps({
-                'price': price,
-                'huid': huid,
-                'autocommit': True
-            }))
+        return self.call('authorized_purchase_object', {
+            'oid': oid,
+            'price': price,
+            'huid': huid
+        })
     
+    @traced
+    @profiled
     def authorized_create_user(self, identities=None, primary=None, permissions=None):
         """Creates Vingd user (profile & account), links it with the provided
         identities (to be verified later), and sets the delegate-user
@@ -586,13 +1106,15 @@ class Vingd:
         
         :access: authorized users with ACL flag ``user.create``
         """
-        return self.request('post', 'id/users/', json.dumps({
+        return self.call('authorized_create_user', {
             'identities': identities,
             'primary_identity': primary,
             'delegate_permissions': permissions
-        }))
+        })
     
-    def reward_user(self, huid_to, amount, description=None):
+    @traced
+    @profiled
+    def reward_user(self, huid_to, amount, description=None, idempotency_key=None):
         """
         PERFORMS a single reward. User defined with `huid_to` is rewarded with
         `amount` cents, transfered from the account of the authenticated user.
@@ -607,6 +1129,10 @@ class Vingd:
         :type description: ``string``
         :param description:
             Transaction description (optional).
+        :type idempotency_key: ``string``
+        :param idempotency_key:
+            Client-generated unique key of this reward, sent as
+            ``Idempotency-Key`` header (optional; see `vingd.rewards`).
         
         :rtype: ``dict``
         :returns: ``{'transfer_id': <transfer_id>}``
@@ -618,12 +1144,15 @@ class Vingd:
         :resource: ``rewards/``
         :access: authorized users (ACL flag: ``transfer.outbound``)
         """
-        return self.request('post', 'rewards', json.dumps({
+        headers = {'Idempotency-Key': idempotency_key} if idempotency_key else None
+        return self.call('reward_user', {
             'huid_to': huid_to,
             'amount': amount,
             'description': description
-        }))
+        }, headers=headers)
     
+    @traced
+    @profiled
     def create_voucher(self, amount, expires=None, message='', gid=None):
         """
         CREATES a new preallocated voucher with ``amount`` vingd cents reserved
@@ -676,12 +1205,14 @@ class Vingd:
         :access: authorized users (ACL flag: ``voucher.add``)
         """
         expires = absdatetime(expires, default=self.EXP_VOUCHER).isoformat()
-        voucher = self.request('post', 'vouchers/', json.dumps({
+        voucher = self.call('create_voucher', {
             'amount': amount,
             'until': expires,
             'message': message,
             'gid': gid
-        }))
+        })
+        if self.records:
+            return Voucher(voucher, self.usr_frontend)
         return {
             'raw': voucher,
             'urls': {
@@ -690,6 +1221,8 @@ class Vingd:
             }
         }
     
+    @traced
+    @profiled
     def get_vouchers(self, vid_encoded=None,
                      uid_from=None, uid_to=None, gid=None,
                      valid_after=None, valid_before=None,
@@ -758,8 +1291,11 @@ class Vingd:
                 'last': ('int', last)
             }
         )
-        return self.request('get', resource)
+        vouchers = self.request('get', resource)
+        return Voucher.convert(vouchers, self.usr_frontend) if self.records else vouchers
     
+    @traced
+    @profiled
     def get_vouchers_history(self, vid_encoded=None, vid=None, action=None,
                              uid_from=None, uid_to=None, gid=None,
                              valid_after=None, valid_before=None,
@@ -848,8 +1384,11 @@ class Vingd:
                 'last': ('int', last)
             }
         )
-        return self.request('get', resource)
+        entries = self.request('get', resource)
+        return VoucherLogEntry.convert(entries) if self.records else entries
     
+    @traced
+    @profiled
     def revoke_vouchers(self, vid_encoded=None,
                         uid_from=None, uid_to=None, gid=None,
                         valid_after=None, valid_before=None,
@@ -922,4 +1461,4 @@ class Vingd:
                 'last': ('int', last)
             }
         )
-        return self.request('delete', resource, json.dumps({'revoke': True}))
+        return self.request('delete', resource, _dumps({'revoke': True}))
@@ -0,0 +1,277 @@
+"""
+Columnar (NumPy-backed) representation of voucher history and object
+listings, for vectorized analytics. Requires `numpy` (``pip install numpy``).
+
+Listings (as returned by `Vingd.get_vouchers_history` and `Vingd.get_objects`,
+or streamed from `vingd.history.VoucherHistory.iterate`) are converted to a
+`Table` of columns: ids and amounts become ``int64`` arrays (`MISSING` where
+undefined), timestamps ``datetime64[us]`` arrays (UTC, ``NaT`` where
+undefined) and strings (actions, gids, ...) `Categorical` columns (``int32``
+codes into an array of distinct values).
+
+Example (vouched amount per gid per day)::
+
+    from vingd.columnar import history_table
+
+    table = history_table(history.iterate(action='use'))
+    daily = table.group_sum(['gid', table.day('ts_created')], 'amount_vouched')
+    for gid, day, amount in zip(daily['gid'].values(), daily['day'], daily['sum']):
+        ...
+"""
+import re
+
+import numpy
+
+from .util import parse_isotime, timestamp
+
+
+# value of undefined integer fields
+MISSING = -1
+
+INT = 'int'
+TIME = 'time'
+CATEGORY = 'category'
+
+_UTC = ('Z', '+00:00', '+0000', '+00')
+_EXTENDED = re.compile(r'^\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}(\.\d{1,6})?$').match
+
+
+class Categorical(object):
+    """String column, stored as ``int32`` `codes` into `categories` (array
+    of distinct values). Code ``-1`` stands for an undefined value."""
+
+    def __init__(self, codes, categories):
+        self.codes = codes
+        self.categories = categories
+
+    @classmethod
+    def encode(cls, values):
+        """Builds `Categorical` from a sequence of strings (or `None`)."""
+        index, codes = {}, numpy.empty(len(values), dtype=numpy.int32)
+        for i, value in enumerate(values):
+            if value is None:
+                codes[i] = -1
+            else:
+                codes[i] = index.setdefault(value, len(index))
+        categories = numpy.empty(len(index), dtype=object)
+        for value, code in index.items():
+            categories[code] = value
+        return cls(codes, categories)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, key):
+        if isinstance(key, (int, numpy.integer)):
+            code = self.codes[key]
+            return None if code < 0 else self.categories[code]
+        return Categorical(self.codes[key], self.categories)
+
+    def code(self, value):
+        """Code of `value` (``-2``, matching nothing, if not a category)."""
+        found = numpy.nonzero(self.categories == value)[0]
+        return found[0] if len(found) else -2
+
+    def __eq__(self, value):
+        return self.codes == self.code(value)
+
+    def __ne__(self, value):
+        return self.codes != self.code(value)
+
+    def isin(self, values):
+        return numpy.isin(self.codes, [self.code(v) for v in values])
+
+    def values(self):
+        """Decoded values (object array, with `None` for undefined)."""
+        out = numpy.empty(len(self.codes), dtype=object)
+        defined = self.codes >= 0
+        out[defined] = self.categories[self.codes[defined]]
+        return out
+
+    def counts(self):
+        """``{<category>: <count>}``."""
+        counts = numpy.bincount(self.codes[self.codes >= 0],
+                                minlength=len(self.categories))
+        return dict(zip(self.categories, counts.tolist()))
+
+
+def _parse(value):
+    return int(round(timestamp(parse_isotime(value)) * 1e6))
+
+def _timestamps(values):
+    """Converts ISO8601 timestamps to ``datetime64[us]`` (UTC). Extended
+    format UTC timestamps are parsed by NumPy, in bulk; others one by one."""
+    out = numpy.empty(len(values), dtype='datetime64[us]')
+    out[:] = numpy.datetime64('NaT')
+    utc, utc_index = [], []
+    for i, value in enumerate(values):
+        if not value:
+            continue
+        for suffix in _UTC:
+            if value.endswith(suffix):
+                value = value[:-len(suffix)]
+                break
+        if _EXTENDED(value):
+            utc.append(value)
+            utc_index.append(i)
+        else:
+            out[i] = _parse(values[i])
+    if utc:
+        try:
+            out[utc_index] = numpy.array(utc, dtype='datetime64[us]')
+        except ValueError:
+            for i in utc_index:
+                out[i] = _parse(values[i])
+    return out
+
+
+def _integers(values):
+    return numpy.array([MISSING if v is None else v for v in values], dtype=numpy.int64)
+
+
+CONVERTERS = {
+    INT: _integers,
+    TIME: _timestamps,
+    CATEGORY: Categorical.encode
+}
+
+
+class Table(object):
+    """
+    A set of equally long, named columns: NumPy arrays, or `Categorical`.
+
+    Rows are selected with a boolean mask (or an index array)::
+
+        recent = table[table['ts_created'] > numpy.datetime64('2013-01-01')]
+    """
+
+    def __init__(self, columns):
+        self.columns = columns
+
+    def __len__(self):
+        for column in self.columns.values():
+            return len(column)
+        return 0
+
+    def __contains__(self, name):
+        return name in self.columns
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return self.columns[key]
+        return Table(dict((name, column[key]) for name, column in self.columns.items()))
+
+    def keys(self):
+        return list(self.columns)
+
+    def day(self, key):
+        """Column `key` (name, or ``datetime64`` array) truncated to days
+        (``datetime64[D]``)."""
+        return self._column(key).astype('datetime64[D]')
+
+    def _column(self, key):
+        return self.columns[key] if isinstance(key, str) else key
+
+    def group_sum(self, by, value):
+        """
+        Sums column `value` grouped by columns `by` (a list of column names
+        or arrays, e.g. ``table.day('ts_created')``). Returns a `Table` with
+        a column for each of `by` (named after it; ``key<n>`` for unnamed
+        arrays, except ``day`` for a ``datetime64[D]`` array), plus ``sum``
+        (of defined values: `MISSING` integers are left out) and ``count``
+        (of rows).
+        """
+        codes, uniques, names = [], [], []
+        for n, key in enumerate(by):
+            column = self._column(key)
+            if isinstance(column, Categorical):
+                codes.append(column.codes + 1)      # undefined (-1) -> 0
+                uniques.append(column)
+            else:
+                unique, inverse = numpy.unique(column, return_inverse=True)
+                codes.append(inverse.ravel())
+                uniques.append(unique)
+            if isinstance(key, str):
+                names.append(key)
+            elif getattr(column, 'dtype', None) == numpy.dtype('datetime64[D]'):
+                names.append('day')
+            else:
+                names.append('key%d' % n)
+
+        dims = [len(u.categories) + 1 if isinstance(u, Categorical) else len(u)
+                for u in uniques]
+        if not len(self):
+            flat = numpy.zeros(0, dtype=numpy.int64)
+        else:
+            flat = numpy.ravel_multi_index(codes, dims)
+        groups, inverse = numpy.unique(flat, return_inverse=True)
+        values = self._column(value)
+        weights = values
+        if values.dtype.kind in 'iu':
+            weights = numpy.where(values == MISSING, 0, values)
+        sums = numpy.bincount(inverse.ravel(), weights=weights, minlength=len(groups))
+        counts = numpy.bincount(inverse.ravel(), minlength=len(groups))
+
+        columns = {}
+        keys = numpy.unravel_index(groups, dims) if len(groups) else [groups] * len(dims)
+        for name, unique, key in zip(names, uniques, keys):
+            if isinstance(unique, Categorical):
+                columns[name] = Categorical((key - 1).astype(numpy.int32), unique.categories)
+            else:
+                columns[name] = unique[key]
+        if values.dtype.kind in 'iu':
+            sums = sums.round().astype(numpy.int64)
+        columns['sum'] = sums
+        columns['count'] = counts
+        return Table(columns)
+
+
+def to_table(rows, schema):
+    """Converts `rows` (an iterable of dictionaries) to a `Table`, according
+    to `schema`: a list of ``(name, type, getter)`` (`getter` extracts the
+    value from a row; ``row.get(name)`` if `None`)."""
+    values = [[] for _ in schema]
+    getters = [getter or (lambda row, name=name: row.get(name))
+               for name, typ, getter in schema]
+    for row in rows:
+        for column, getter in zip(values, getters):
+            column.append(getter(row))
+    return Table(dict(
+        (name, CONVERTERS[typ](column))
+        for (name, typ, getter), column in zip(schema, values)
+    ))
+
+
+HISTORY_SCHEMA = [
+    ('id', INT, None),
+    ('vid', INT, None),
+    ('vid_encoded', CATEGORY, None),
+    ('action', CATEGORY, None),
+    ('gid', CATEGORY, None),
+    ('uid_from', INT, None),
+    ('uid_to', INT, None),
+    ('amount_vouched', INT, None),
+    ('ts_created', TIME, None),
+    ('ts_valid_until', TIME, None),
+]
+
+OBJECTS_SCHEMA = [
+    ('oid', INT, None),
+    ('uid', INT, None),
+    ('name', CATEGORY, lambda o: (o.get('description') or {}).get('name')),
+    ('url', CATEGORY, lambda o: (o.get('description') or {}).get('url')),
+    ('timestamp_created', TIME, None),
+    ('timestamp_modified', TIME, None),
+]
+
+
+def history_table(entries):
+    """`Table` of voucher log `entries` (see `HISTORY_SCHEMA`)."""
+    return to_table(entries, HISTORY_SCHEMA)
+
+
+def objects_table(objects):
+    """`Table` of `objects` (see `OBJECTS_SCHEMA`)."""
+    if isinstance(objects, dict):
+        objects = [objects]
+    return to_table(objects, OBJECTS_SCHEMA)
@@ -0,0 +1,100 @@
+"""
+Latency-aware selection of (and failover between) several Vingd backend
+endpoints.
+"""
+try:
+    from urlparse import urlparse
+except ImportError:
+    from urllib.parse import urlparse
+
+import threading
+import time
+
+
+class Endpoint(object):
+    """A single backend endpoint (API URL), with its health and latency
+    (exponentially weighted moving average, in seconds)."""
+
+    def __init__(self, url):
+        parsed = urlparse(url)
+        if parsed.scheme != 'https':
+            raise Exception("Invalid Vingd endpoint URL (non-https).")
+        self.url = url
+        self.host = parsed.hostname
+        self.port = parsed.port or 443
+        self.path = parsed.path
+        self.latency = None
+        self.healthy = True
+        self.retry_at = 0
+        self.stats = {'requests': 0, 'errors': 0}
+
+    def __repr__(self):
+        return "<Endpoint %s (%s, latency=%s)>" % (
+            self.url, 'healthy' if self.healthy else 'unhealthy', self.latency)
+
+    def available(self, now=None):
+        """Endpoint is healthy, or it's time to try it again."""
+        return self.healthy or (now or time.time()) >= self.retry_at
+
+
+class EndpointSet(object):
+    """
+    Set of interchangeable backend endpoints.
+
+    `select` picks the healthy endpoint with the lowest latency (EWMA with
+    smoothing factor `alpha`, fed by both request and health check latencies).
+    Endpoints never measured are tried first. An endpoint that fails (on
+    connection level) is skipped for `cooldown` seconds, unless no other
+    endpoint is available.
+    """
+
+    def __init__(self, urls, alpha=0.3, cooldown=30):
+        if not isinstance(urls, (list, tuple)):
+            urls = [urls]
+        if not urls:
+            raise Exception("No Vingd endpoints given.")
+        self.endpoints = [Endpoint(url) for url in urls]
+        self.alpha = alpha
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.endpoints)
+
+    def __iter__(self):
+        return iter(self.endpoints)
+
+    @property
+    def primary(self):
+        return self.endpoints[0]
+
+    def select(self, exclude=()):
+        """Returns the best endpoint not in `exclude`, or `None`."""
+        candidates = [e for e in self.endpoints if e not in exclude]
+        if len(candidates) <= 1:
+            return candidates[0] if candidates else None
+        now = time.time()
+        available = [e for e in candidates if e.available(now)]
+        if not available:
+            # all failing: try the one to recover first
+            return min(candidates, key=lambda e: e.retry_at)
+        return min(available, key=lambda e: (e.latency is not None, e.latency))
+
+    def success(self, endpoint, latency):
+        """Records a successful request (or probe), which took `latency`
+        seconds."""
+        with self._lock:
+            endpoint.stats['requests'] += 1
+            endpoint.healthy = True
+            if endpoint.latency is None:
+                endpoint.latency = latency
+            else:
+                endpoint.latency += self.alpha * (latency - endpoint.latency)
+
+    def failure(self, endpoint):
+        """Records a (connection-level) failure of `endpoint`."""
+        with self._lock:
+            endpoint.stats['requests'] += 1
+            endpoint.stats['errors'] += 1
+            endpoint.healthy = False
+            endpoint.retry_at = time.time() + self.cooldown
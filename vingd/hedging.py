@@ -0,0 +1,141 @@
+"""
+Hedged requests: if a read-only request is slower than usual, a duplicate is
+sent (to another endpoint, or over another pooled connection), and whichever
+response arrives first is used.
+"""
+try:
+    from queue import Queue, Empty
+except ImportError:
+    from Queue import Queue, Empty
+
+import threading
+import time
+from collections import deque
+
+
+class HedgePolicy(object):
+    """
+    Decides when to hedge, and keeps hedging statistics.
+
+    A request is hedged if it's still unanswered after `delay` seconds: the
+    `percentile` of recently observed latencies (last `window` requests),
+    clamped to ``[min_delay, max_delay]``. Until `min_samples` latencies are
+    observed, `max_delay` is used.
+
+    Hedges are limited by a budget: each request earns `budget` hedge tokens
+    (at most `burst` are kept), and each hedge costs one token. So, with the
+    default budget of ``0.05``, at most ~5% of requests are duplicated.
+
+    Note: `Vingd.verify_purchase` also decrements the entitlement counter of
+    the purchased object, so a duplicated verification might consume it
+    twice. It's hedged only if `verify_purchase` is set.
+    """
+
+    def __init__(self, percentile=95, budget=0.05, burst=10, min_delay=0.005,
+                 max_delay=1.0, window=1000, min_samples=20,
+                 verify_purchase=False):
+        self.window = window
+        self.percentile = percentile
+        self.budget = budget
+        self.burst = burst
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.min_samples = min_samples
+        self.verify_purchase = verify_purchase
+        self.stats = {
+            'requests': 0,
+            'hedged': 0,
+            'hedge_wins': 0,
+            'budget_exhausted': 0
+        }
+        self._latencies = deque(maxlen=window)
+        self._tokens = float(burst)
+        self._delay = None
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        # configuration only, statistics are not transferred
+        return dict((name, getattr(self, name)) for name in (
+            'percentile', 'budget', 'burst', 'min_delay', 'max_delay', 'window',
+            'min_samples', 'verify_purchase'))
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def record(self, latency):
+        """Records latency (in seconds) of an unhedged attempt."""
+        with self._lock:
+            self._latencies.append(latency)
+            self._delay = None
+
+    def delay(self):
+        """Current hedging delay, in seconds."""
+        delay = self._delay
+        if delay is not None:
+            return delay
+        with self._lock:
+            latencies = sorted(self._latencies)
+        if len(latencies) < self.min_samples:
+            delay = self.max_delay
+        else:
+            rank = int(round(self.percentile / 100.0 * (len(latencies) - 1)))
+            delay = min(max(latencies[rank], self.min_delay), self.max_delay)
+        self._delay = delay
+        return delay
+
+    def _acquire(self):
+        """Takes a hedge token, if available."""
+        with self._lock:
+            if self._tokens >= 1:
+                self._tokens -= 1
+                self.stats['hedged'] += 1
+                return True
+            self.stats['budget_exhausted'] += 1
+            return False
+
+    def call(self, attempt, alternative):
+        """
+        Runs ``attempt()``, and if it doesn't finish in `delay` seconds (and
+        budget allows), also ``alternative()`` (in parallel). Returns the
+        result of whichever finishes first (successfully, unless both fail).
+        """
+        with self._lock:
+            self.stats['requests'] += 1
+            self._tokens = min(self._tokens + self.budget, self.burst)
+
+        results = Queue()
+        def run(func, hedge):
+            started = time.time()
+            try:
+                result = (hedge, func(), None)
+            except Exception as e:
+                result = (hedge, None, e)
+            if not hedge:
+                self.record(time.time() - started)
+            results.put(result)
+
+        self._start(run, attempt, False)
+        try:
+            hedge, result, error = results.get(timeout=self.delay())
+            pending = 0
+        except Empty:
+            pending = 1
+            if self._acquire():
+                self._start(run, alternative, True)
+                pending = 2
+            hedge, result, error = results.get()
+            pending -= 1
+        if error is not None and pending:
+            hedge, result, error = results.get()
+        if error is not None:
+            raise error
+        if hedge:
+            with self._lock:
+                self.stats['hedge_wins'] += 1
+        return result
+
+    @staticmethod
+    def _start(run, func, hedge):
+        thread = threading.Thread(target=run, args=(func, hedge))
+        thread.daemon = True
+        thread.start()
@@ -0,0 +1,214 @@
+"""
+Incremental synchronization of the vouchers log (`Vingd.get_vouchers_history`)
+into a local, indexed, SQLite store.
+
+Example::
+
+    from vingd import Vingd
+    from vingd.history import VoucherHistory
+
+    v = Vingd(username="...", password="...")
+    history = VoucherHistory('vouchers.db')
+    history.sync(v)     # fetches only entries newer than already stored
+
+    used = history.query(action='use', create_after={'days': -30})
+    total = history.execute(
+        "SELECT gid, SUM(amount_vouched) FROM log WHERE action = ? GROUP BY gid",
+        ('use',)
+    ).fetchall()
+"""
+try:
+    import simplejson as json
+except ImportError:
+    import json
+
+import sqlite3
+from datetime import datetime, timedelta
+
+from .util import absdatetime, parse_isotime, timestamp, tzutc
+
+
+class VoucherHistory(object):
+    """
+    Local store of voucher log entries, kept in a single SQLite table (``log``)
+    indexed by ``vid``, ``vid_encoded``, ``gid``, ``action``, ``uid_from``,
+    ``uid_to`` and timestamps (``ts_created`` and ``ts_valid_until``, both
+    stored as POSIX timestamps). Complete log entry is kept in the ``raw``
+    column (as JSON).
+
+    The high-water mark for incremental sync is the creation timestamp of the
+    newest stored entry.
+    """
+
+    # log entry fields extracted into (indexed) columns
+    COLUMNS = (
+        ('vid', 'INTEGER'),
+        ('vid_encoded', 'TEXT'),
+        ('action', 'TEXT'),
+        ('gid', 'TEXT'),
+        ('uid_from', 'INTEGER'),
+        ('uid_to', 'INTEGER'),
+        ('amount_vouched', 'INTEGER'),
+        ('ts_created', 'REAL'),
+        ('ts_valid_until', 'REAL'),
+    )
+    INDEXED = ('vid', 'vid_encoded', 'gid', 'action', 'uid_from', 'uid_to',
+               'ts_created', 'ts_valid_until')
+    TIMESTAMPS = ('ts_created', 'ts_valid_until')
+
+    # log entry field with the entry creation timestamp
+    TIMESTAMP_FIELD = 'ts_created'
+
+    # number of entries fetched per `get_vouchers_history` call
+    PAGE_SIZE = 1000
+
+    def __init__(self, path=':memory:'):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self._create()
+
+    def _create(self):
+        columns = ", ".join("%s %s" % c for c in self.COLUMNS)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS log "
+            "(id INTEGER PRIMARY KEY, %s, raw TEXT NOT NULL)" % columns
+        )
+        for name in self.INDEXED:
+            self.db.execute(
+                "CREATE INDEX IF NOT EXISTS log_%s ON log (%s)" % (name, name)
+            )
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+    def __len__(self):
+        return self.db.execute("SELECT COUNT(*) FROM log").fetchone()[0]
+
+    def _row(self, entry):
+        row = [entry['id']]
+        for name, typ in self.COLUMNS:
+            val = entry.get(name)
+            if name in self.TIMESTAMPS and val is not None:
+                val = timestamp(parse_isotime(val))
+            row.append(val)
+        row.append(json.dumps(entry))
+        return row
+
+    def add(self, entries):
+        """Stores (or updates) voucher log `entries`. Returns the number of
+        entries stored."""
+        rows = [self._row(e) for e in entries]
+        if not rows:
+            return 0
+        placeholders = ", ".join("?" * (len(self.COLUMNS) + 2))
+        with self.db:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO log VALUES (%s)" % placeholders, rows
+            )
+        return len(rows)
+
+    def high_water_mark(self):
+        """Creation timestamp (`datetime`) of the newest stored entry, or `None`
+        if store is empty."""
+        ts = self.db.execute("SELECT MAX(ts_created) FROM log").fetchone()[0]
+        if ts is None:
+            return None
+        return datetime(1970, 1, 1, tzinfo=tzutc()) + timedelta(seconds=ts)
+
+    def sync(self, vingd, page_size=None):
+        """
+        Fetches all voucher log entries created after the `high_water_mark`
+        from `vingd` (a `Vingd` client instance), in pages of `page_size`
+        (oldest first; see `sync_log`). Returns the number of entries fetched.
+        """
+        return sync_log(vingd, self.add, self.high_water_mark(),
+                        page_size or self.PAGE_SIZE, self.TIMESTAMP_FIELD)
+
+    def query(self, vid=None, vid_encoded=None, action=None, gid=None,
+              uid_from=None, uid_to=None, create_after=None, create_before=None,
+              valid_after=None, valid_before=None, last=None, first=None):
+        """
+        Returns a filtered list of stored voucher log entries (as returned by
+        `Vingd.get_vouchers_history`). Filters have the same meaning as in
+        `Vingd.get_vouchers_history`; entries are ordered by creation time.
+        """
+        entries = list(self.iterate(
+            vid, vid_encoded, action, gid, uid_from, uid_to, create_after,
+            create_before, valid_after, valid_before, last, first))
+        if last is not None:
+            entries.reverse()
+        return entries
+
+    def iterate(self, vid=None, vid_encoded=None, action=None, gid=None,
+                uid_from=None, uid_to=None, create_after=None, create_before=None,
+                valid_after=None, valid_before=None, last=None, first=None):
+        """Like `query`, but yields entries one by one, as they're read from
+        the store (with `last` given, newest first)."""
+        where, params = [], []
+        for name, val in (('vid', vid), ('vid_encoded', vid_encoded),
+                          ('action', action), ('gid', gid),
+                          ('uid_from', uid_from), ('uid_to', uid_to)):
+            if val is not None:
+                where.append("%s = ?" % name)
+                params.append(val)
+        for name, op, val in (('ts_created', '>', create_after),
+                              ('ts_created', '<', create_before),
+                              ('ts_valid_until', '>', valid_after),
+                              ('ts_valid_until', '<', valid_before)):
+            val = absdatetime(val)
+            if val is not None:
+                where.append("%s %s ?" % (name, op))
+                params.append(timestamp(val))
+        sql = "SELECT raw FROM log"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        if last is not None:
+            sql += " ORDER BY ts_created DESC, id DESC LIMIT %d" % int(last)
+        else:
+            sql += " ORDER BY ts_created, id"
+            if first is not None:
+                sql += " LIMIT %d" % int(first)
+        for (raw,) in self.db.execute(sql, params):
+            yield json.loads(raw)
+
+    def execute(self, sql, params=()):
+        """Runs an arbitrary (reporting) SQL query against the store."""
+        return self.db.execute(sql, params)
+
+
+def sync_log(vingd, add, mark=None, page_size=1000, field='ts_created'):
+    """
+    Pages voucher log entries created after `mark` (`datetime`, or `None` for
+    all) from `vingd` (`Vingd.get_vouchers_history`, oldest first, `page_size`
+    entries per call) into `add`, a callable storing entries (deduplicated on
+    ``id``) and returning their count. `field` holds the entry creation
+    timestamp. Returns the total count.
+
+    Since `create_after` filter is sent with a one second resolution, the
+    last second before the mark is always re-fetched, and so is the last
+    second of each page (entries created within it might span pages).
+    """
+    fetched = 0
+    since = _floor(mark) - timedelta(seconds=1) if mark else None
+    while True:
+        entries = vingd.get_vouchers_history(create_after=since, first=page_size)
+        fetched += add(entries)
+        if len(entries) < page_size:
+            break
+        newest = _floor(max(parse_isotime(e[field]) for e in entries))
+        if since is not None and newest - timedelta(seconds=1) <= since:
+            # a full page within a single second: fetch the rest of that
+            # second (and the next one, since the mark can't be set in
+            # between) in one go, and move on
+            fetched += add(vingd.get_vouchers_history(
+                create_after=since, create_before=newest + timedelta(seconds=2)
+            ))
+            since = newest + timedelta(seconds=1)
+        else:
+            since = newest - timedelta(seconds=1)
+    return fetched
+
+
+def _floor(dt):
+    return dt.replace(microsecond=0)
@@ -0,0 +1,370 @@
+"""
+HTTP/2 client connection, multiplexing concurrent requests (streams) over a
+single TLS connection. Requires the `h2` package (``pip install h2``).
+
+Used by `vingd.pool.ConnectionPool` when created with ``http2=True``.
+"""
+try:
+    import httplib
+except ImportError:
+    import http.client as httplib
+
+try:
+    from queue import Queue, Empty
+except ImportError:
+    from Queue import Queue, Empty
+
+import socket
+import threading
+
+import h2.config
+import h2.connection
+import h2.errors
+import h2.events
+
+from .pool import ConnectError
+from .profiling import mark
+from .tls import TLSContext
+
+
+class ProtocolNegotiationError(httplib.HTTPException):
+    """Server did not select HTTP/2 during ALPN negotiation."""
+
+
+class StreamReset(httplib.HTTPException):
+    """Stream was reset (or connection terminated) by the server."""
+
+
+class StreamTimeout(socket.timeout):
+    """Stream-level timeout: no response (or response data) received in
+    time."""
+
+
+class _Stream(object):
+    def __init__(self, stream_id):
+        self.id = stream_id
+        self.status = None
+        self.headers = {}
+        self.ready = threading.Event()
+        self.data = Queue()
+        self.buffer = b''
+        self.eof = False
+        self.error = None
+
+    def fail(self, error):
+        self.error = error
+        self.ready.set()
+        self.data.put(error)
+
+
+class HTTP2Response(object):
+    """
+    Response received on an HTTP/2 stream. Mimics (a subset of)
+    `httplib.HTTPResponse` interface: `status`, `getheader` and `read`.
+    """
+
+    def __init__(self, connection, stream, timeout=None):
+        self.status = stream.status
+        self.headers = stream.headers
+        self._connection = connection
+        self._stream = stream
+        self._timeout = timeout
+
+    def getheader(self, name, default=None):
+        return self.headers.get(name.lower(), default)
+
+    def read(self, size=None):
+        stream = self._stream
+        while not stream.eof and (size is None or len(stream.buffer) < size):
+            try:
+                chunk = stream.data.get(timeout=self._timeout)
+            except Empty:
+                self._connection.reset(stream.id)
+                raise StreamTimeout("HTTP/2 stream %d read timed out." % stream.id)
+            if chunk is None:
+                stream.eof = True
+            elif isinstance(chunk, Exception):
+                raise chunk
+            else:
+                stream.buffer += chunk
+        if size is None:
+            size = len(stream.buffer)
+        chunk, stream.buffer = stream.buffer[:size], stream.buffer[size:]
+        return chunk
+
+    def close(self):
+        if not self._stream.eof:
+            self._connection.reset(self._stream.id)
+
+
+class HTTP2Connection(object):
+    """
+    A single HTTP/2 client connection to ``host:port``.
+
+    Protocol is negotiated via ALPN; if server selects anything but HTTP/2,
+    `connect` raises `ProtocolNegotiationError` (so that the caller can fall
+    back to HTTP/1.1). TLS configuration and session resumption is handled by
+    `tls` (`vingd.tls.TLSContext`, which MUST offer ``h2`` via ALPN). With
+    `secure` unset, HTTP/2 is spoken over plain TCP
+    ("prior knowledge" h2c), which is useful with local stand-in servers.
+
+    Requests are thread-safe: any number of threads can issue concurrent
+    requests, each on its own stream (up to the server's
+    ``SETTINGS_MAX_CONCURRENT_STREAMS``). Frames are read by a background
+    thread, which dispatches them to waiting streams and maintains flow-control
+    windows. Flow-control and traffic counters are kept in `stats`.
+    """
+
+    ALPN_PROTOCOLS = ['h2', 'http/1.1']
+    READ_SIZE = 65536
+
+    def __init__(self, host, port=443, timeout=None, tls=None, secure=True,
+                 resolver=None):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.tls = tls
+        self.secure = secure
+        self.resolver = resolver
+        self.authority = host if port == 443 else '%s:%d' % (host, port)
+        self.sock = None
+        self.closed = False
+        self.stats = {
+            'streams': 0,
+            'streams_reset': 0,
+            'stream_timeouts': 0,
+            'bytes_sent': 0,
+            'bytes_received': 0,
+            'data_frames_received': 0,
+            'window_updates_received': 0,
+            'flow_control_stalls': 0
+        }
+        self._streams = {}
+        self._lock = threading.RLock()
+        self._changed = threading.Condition(self._lock)
+        self._conn = h2.connection.H2Connection(config=h2.config.H2Configuration(
+            client_side=True, header_encoding='utf-8'
+        ))
+
+    def connect(self):
+        try:
+            if self.resolver is not None:
+                sock = self.resolver.connect(self.host, self.port, self.timeout)
+            else:
+                sock = socket.create_connection((self.host, self.port), self.timeout)
+        except socket.error as e:
+            raise ConnectError("Connection to %s:%s failed (%s)." % (self.host, self.port, e))
+        mark('pool')
+        try:
+            if self.secure:
+                if self.tls is None:
+                    self.tls = TLSContext(alpn_protocols=self.ALPN_PROTOCOLS)
+                try:
+                    sock = self.tls.wrap(sock, self.host, self.port)
+                except socket.error as e:
+                    raise ConnectError("TLS handshake with %s:%s failed (%s)." % (self.host, self.port, e))
+                mark('tls')
+                protocol = sock.selected_alpn_protocol()
+                if protocol != 'h2':
+                    raise ProtocolNegotiationError(
+                        "Server selected '%s' instead of HTTP/2." % protocol)
+            sock.settimeout(None)
+            self.sock = sock
+            with self._lock:
+                self._conn.initiate_connection()
+                self._flush()
+        except:
+            sock.close()
+            self.closed = True
+            raise
+        reader = threading.Thread(target=self._read_loop)
+        reader.daemon = True
+        reader.start()
+
+    @property
+    def active(self):
+        """Number of currently open streams."""
+        return len(self._streams)
+
+    @property
+    def max_streams(self):
+        return self._conn.remote_settings.max_concurrent_streams
+
+    @property
+    def available(self):
+        """`True` iff connection can accept a new stream right away."""
+        return not self.closed and self.active < self.max_streams
+
+    def flow_control(self):
+        """Current outbound flow-control windows, for the connection and for
+        each open stream."""
+        with self._lock:
+            return {
+                'connection': self._conn.outbound_flow_control_window,
+                'streams': dict(
+                    (sid, self._conn.local_flow_control_window(sid))
+                    for sid in self._streams
+                )
+            }
+
+    def _flush(self):
+        data = self._conn.data_to_send()
+        if data:
+            self.sock.sendall(data)
+            self.stats['bytes_sent'] += len(data)
+
+    def _read_loop(self):
+        error = None
+        session_saved = not self.secure
+        try:
+            while True:
+                data = self.sock.recv(self.READ_SIZE)
+                if not data:
+                    break
+                if not session_saved:
+                    # TLS 1.3 session tickets arrive after the handshake
+                    self.tls.save(self.sock, self.host, self.port)
+                    session_saved = True
+                with self._lock:
+                    self.stats['bytes_received'] += len(data)
+                    for event in self._conn.receive_data(data):
+                        self._handle(event)
+                    self._flush()
+                    self._changed.notify_all()
+        except Exception as e:
+            error = e
+        self._terminate(StreamReset("HTTP/2 connection lost (%r)." % error))
+
+    def _handle(self, event):
+        stream = self._streams.get(getattr(event, 'stream_id', None))
+        if isinstance(event, h2.events.ResponseReceived):
+            if stream is not None:
+                stream.headers = dict(event.headers)
+                stream.status = int(stream.headers.pop(':status'))
+                stream.ready.set()
+        elif isinstance(event, h2.events.DataReceived):
+            self.stats['data_frames_received'] += 1
+            self._conn.acknowledge_received_data(
+                event.flow_controlled_length, event.stream_id)
+            if stream is not None:
+                stream.data.put(event.data)
+        elif isinstance(event, h2.events.StreamEnded):
+            if stream is not None:
+                stream.data.put(None)
+                self._streams.pop(stream.id, None)
+        elif isinstance(event, h2.events.StreamReset):
+            self.stats['streams_reset'] += 1
+            if stream is not None:
+                stream.fail(StreamReset(
+                    "HTTP/2 stream %d reset (error code %s)." % (stream.id, event.error_code)))
+                self._streams.pop(stream.id, None)
+        elif isinstance(event, h2.events.WindowUpdated):
+            self.stats['window_updates_received'] += 1
+        elif isinstance(event, h2.events.ConnectionTerminated):
+            self._terminate(StreamReset(
+                "HTTP/2 connection terminated (error code %s)." % event.error_code))
+
+    def _terminate(self, error):
+        with self._lock:
+            self.closed = True
+            streams, self._streams = self._streams, {}
+            for stream in streams.values():
+                stream.fail(error)
+            self._changed.notify_all()
+
+    def reset(self, stream_id):
+        """Cancels stream `stream_id`."""
+        with self._lock:
+            if self._streams.pop(stream_id, None) is None or self.closed:
+                return
+            self.stats['streams_reset'] += 1
+            try:
+                self._conn.reset_stream(stream_id, h2.errors.ErrorCodes.CANCEL)
+                self._flush()
+            except Exception:
+                pass
+            self._changed.notify_all()
+
+    def _wait(self, predicate, timeout, stream_id=None):
+        """Waits (holding the lock) until `predicate` is true."""
+        while not predicate():
+            if self.closed:
+                raise StreamReset("HTTP/2 connection closed.")
+            if not self._changed.wait(timeout) and not predicate():
+                self.stats['stream_timeouts'] += 1
+                raise StreamTimeout("HTTP/2 stream %s timed out." % stream_id)
+
+    def request(self, verb, path, body=None, headers={}, timeout=None):
+        """Sends request on a new stream, and returns `HTTP2Response` as soon as
+        the response headers are received (or raises `StreamTimeout` after
+        `timeout` seconds)."""
+        if body and not isinstance(body, bytes):
+            body = body.encode('utf-8')
+        request_headers = [
+            (':method', verb.upper()),
+            (':scheme', 'https'),
+            (':authority', self.authority),
+            (':path', path)
+        ]
+        for name, value in headers.items():
+            name = name.lower()
+            if name not in ('connection', 'host', 'keep-alive', 'transfer-encoding'):
+                request_headers.append((name, value))
+        if body:
+            request_headers.append(('content-length', str(len(body))))
+
+        with self._lock:
+            self._wait(lambda: self.active < self.max_streams, timeout)
+            stream = _Stream(self._conn.get_next_available_stream_id())
+            self._streams[stream.id] = stream
+            self.stats['streams'] += 1
+            self._conn.send_headers(stream.id, request_headers, end_stream=not body)
+            self._flush()
+
+        try:
+            if body:
+                self._send_body(stream, body, timeout)
+            if not stream.ready.wait(timeout):
+                self.stats['stream_timeouts'] += 1
+                raise StreamTimeout("HTTP/2 stream %d response timed out." % stream.id)
+            if stream.error is not None:
+                raise stream.error
+        except:
+            self.reset(stream.id)
+            raise
+        return HTTP2Response(self, stream, timeout)
+
+    def _send_body(self, stream, body, timeout):
+        offset = 0
+        while offset < len(body):
+            with self._lock:
+                window = lambda: (stream.id not in self._streams or
+                                  self._conn.local_flow_control_window(stream.id) > 0)
+                if not window():
+                    self.stats['flow_control_stalls'] += 1
+                    self._wait(window, timeout, stream.id)
+                if stream.error is not None:
+                    raise stream.error
+                size = min(self._conn.local_flow_control_window(stream.id),
+                           self._conn.max_outbound_frame_size,
+                           len(body) - offset)
+                end = offset + size
+                self._conn.send_data(stream.id, body[offset:end], end_stream=end == len(body))
+                self._flush()
+            offset = end
+
+    def close(self):
+        with self._lock:
+            if self.sock is not None and not self.closed:
+                try:
+                    self._conn.close_connection()
+                    self._flush()
+                except Exception:
+                    pass
+            self.closed = True
+        if self.sock is not None:
+            try:
+                self.sock.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+            self.sock.close()
@@ -0,0 +1,125 @@
+"""
+Adaptive concurrency limit: the number of requests a client keeps in flight
+is adjusted continuously to what the backend sustains, instead of being fixed
+by a number of worker threads.
+"""
+import threading
+import time
+
+
+class AdaptiveLimit(object):
+    """
+    AIMD (additive increase, multiplicative decrease) concurrency limit,
+    driven by request latencies and overload errors.
+
+    A request (see `acquire` and `release`) is an overload signal if it
+    failed with a network error, a ``5xx`` or a ``429 Too Many Requests``
+    response, or if its latency was above `tolerance` times the `baseline`
+    (the no-load latency estimate: the minimal latency observed, drifting
+    slowly towards recent latencies). On overload, the limit is multiplied by
+    `backoff` (at most once per round-trip: requests started before the last
+    decrease don't decrease it again). Otherwise, while the limit is being
+    used (at least half of it is in flight), it grows by ``1/limit`` per
+    request, i.e. by ~1 per round-trip.
+
+    The limit stays within ``[min_limit, max_limit]``. Its current value is
+    `limit`, and statistics are kept in `stats`. Time is read from `clock`.
+
+    Example (batch of revokes, sent as fast as the backend allows)::
+
+        v = Vingd(username="...", password="...", limiter=AdaptiveLimit(max_limit=32))
+        index.revoke(v, plan)       # uses up to `max_limit` threads
+        print(v.limiter.stats)
+    """
+
+    def __init__(self, initial=4, min_limit=1, max_limit=64, backoff=0.7,
+                 tolerance=2.0, drift=0.01, clock=time.time):
+        self.initial = initial
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff = backoff
+        self.tolerance = tolerance
+        self.drift = drift
+        self.clock = clock
+        self.baseline = None
+        self.stats = {
+            'limit': initial,
+            'inflight': 0,
+            'requests': 0,
+            'overloads': 0,
+            'decreases': 0,
+            'waited': 0
+        }
+        self._limit = float(initial)
+        self._inflight = 0
+        self._decreased = 0
+        self._cond = threading.Condition()
+
+    def __getstate__(self):
+        # configuration only, current limit and statistics are not transferred
+        return dict((name, getattr(self, name)) for name in (
+            'initial', 'min_limit', 'max_limit', 'backoff', 'tolerance', 'drift',
+            'clock'))
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    @property
+    def limit(self):
+        """Current concurrency limit."""
+        return int(self._limit)
+
+    @property
+    def inflight(self):
+        return self._inflight
+
+    def acquire(self, wait=True):
+        """Blocks until a request may be sent (fewer than `limit` are in
+        flight). If not `wait`, the request is only counted as in flight
+        (it's been admitted otherwise, e.g. by a `PriorityScheduler` bounded
+        by this limit)."""
+        with self._cond:
+            if wait and self._inflight >= int(self._limit):
+                self.stats['waited'] += 1
+                while self._inflight >= int(self._limit):
+                    self._cond.wait()
+            self._inflight += 1
+            self.stats['inflight'] = self._inflight
+
+    def release(self, latency, overload=False):
+        """Ends a request (started with `acquire`), which took `latency`
+        seconds, and was an `overload` error (or not)."""
+        now = self.clock()
+        with self._cond:
+            inflight = self._inflight
+            self._inflight -= 1
+            self.stats['inflight'] = self._inflight
+            self.stats['requests'] += 1
+
+            if not overload:
+                if self.baseline is None or latency < self.baseline:
+                    self.baseline = latency
+                else:
+                    self.baseline += (latency - self.baseline) * self.drift
+                overload = latency > self.tolerance * self.baseline
+
+            if overload:
+                self.stats['overloads'] += 1
+                if now - latency >= self._decreased:
+                    self._limit = max(self._limit * self.backoff, self.min_limit)
+                    self._decreased = now
+                    self.stats['decreases'] += 1
+            elif inflight >= self._limit / 2:
+                self._limit = min(self._limit + 1.0 / self._limit, self.max_limit)
+            self.stats['limit'] = int(self._limit)
+            self._cond.notify_all()
+
+
+def batch_workers(vingd, workers=None, default=8):
+    """Number of threads for a batch of `vingd` requests: `workers`, if
+    given, else the client's limiter `max_limit` (if it has a limiter, which
+    then keeps the number of requests in flight adaptive), else `default`."""
+    if workers is not None:
+        return workers
+    limiter = getattr(vingd, 'limiter', None)
+    return limiter.max_limit if limiter is not None else default
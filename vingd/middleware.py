@@ -0,0 +1,273 @@
+"""
+Purchase callback handling for sellers' web applications: after confirming a
+purchase on the Vingd frontend, the buyer is redirected to the object's
+registered URL, expanded with ``oid`` and ``tid`` (token id) query
+parameters. The purchase has to be verified (`Vingd.verify_purchase`), access
+to the content granted, and the purchase committed (`Vingd.commit_purchase`).
+
+`PurchaseMiddleware` (WSGI; see `vingd.asgi` for ASGI) does all of that:
+
+ * verifies the token on callback requests, and remembers the verified
+   purchase for the buyer's session (a ``vingd_session`` cookie), so later
+   requests of the same session (page reloads, assets, ...) are not verified
+   again (which would also consume the buyer's entitlement); a token is
+   accepted once, i.e. the callback URL replayed outside of the buyer's
+   session is rejected (`Forbidden`),
+ * exposes the session's verified purchases to the application, in
+   ``environ['vingd.purchase']`` (purchase of the requested object, or
+   `None`), ``environ['vingd.purchases']`` (``{<oid>: <token>}``) and
+   ``environ['vingd.error']`` (exception raised by a failed verification),
+ * commits each purchase once, after the first successful (non-error)
+   response including it is sent, in a background thread (off the response
+   path).
+
+Example::
+
+    from vingd import Vingd
+    from vingd.middleware import PurchaseMiddleware
+
+    v = Vingd(username="...", password="...")
+    app = PurchaseMiddleware(app, v, oid=OID, required=True)
+"""
+try:
+    from urlparse import parse_qs
+except ImportError:
+    from urllib.parse import parse_qs
+
+try:
+    from queue import Queue
+except ImportError:
+    from Queue import Queue
+
+import binascii
+import os
+import threading
+
+from .cache import TTLCache
+from .exceptions import Forbidden, GeneralException
+
+
+COOKIE = 'vingd_session'
+
+
+def _new_session():
+    return binascii.hexlify(os.urandom(16)).decode('ascii')
+
+
+def _cookie(header, name=COOKIE):
+    """Value of cookie `name` in ``Cookie`` `header` (or `None`)."""
+    for part in (header or '').split(';'):
+        key, sep, value = part.strip().partition('=')
+        if sep and key == name:
+            return value.strip('"') or None
+    return None
+
+
+def _set_cookie(session, secure):
+    """``Set-Cookie`` header value for `session`."""
+    return '%s=%s; Path=/; HttpOnly; SameSite=Lax%s' % (
+        COOKIE, session, '; Secure' if secure else '')
+
+
+def _callback(query):
+    """``(oid, tid)`` from callback URL `query` string (or `None`)."""
+    params = parse_qs(query or '')
+    try:
+        return int(params['oid'][0]), params['tid'][0]
+    except (KeyError, IndexError, ValueError):
+        return None
+
+
+class PurchaseSessions(object):
+    """
+    Verified purchases, per buyer session (kept for `ttl` seconds), and a
+    queue of purchases to commit, processed by `workers` background threads.
+    Each token is bound to the session it's been verified for.
+
+    Commit failures are counted in `stats`, and passed to ``on_error(token,
+    exception)``, if given.
+    """
+
+    def __init__(self, vingd, ttl=3600, maxsize=100000, workers=2, on_error=None):
+        self.vingd = vingd
+        self.on_error = on_error
+        self.stats = {'verified': 0, 'failed': 0, 'committed': 0, 'commit_errors': 0}
+        self._tokens = TTLCache(ttl, maxsize)       # (oid, tid) -> (session, token)
+        self._sessions = TTLCache(ttl, maxsize)     # session -> {oid: token}
+        self._committing = TTLCache(ttl, maxsize)   # purchaseid -> True
+        self._lock = threading.Lock()
+        self._commits = Queue()
+        for _ in range(workers):
+            thread = threading.Thread(target=self._commit_loop)
+            thread.daemon = True
+            thread.start()
+
+    def purchases(self, session):
+        """``{<oid>: <token>}`` of purchases verified in `session`."""
+        return dict(self._sessions.get(session) or {}) if session else {}
+
+    def cached(self, oid, tid, session):
+        """Token `tid` of object `oid`, if already verified for `session` (or
+        `None`)."""
+        bound = self._tokens.get((oid, tid))
+        if bound is None or session is None or bound[0] != session:
+            return None
+        return bound[1]
+
+    def verify(self, oid, tid, session):
+        """Verifies token `tid` of object `oid` for (a new) buyer `session`.
+        A token is verified only once: `Forbidden` is raised if it's already
+        been used (or it's being verified) for another session."""
+        key = (oid, tid)
+        with self._lock:
+            if self._tokens.get(key) is not None:
+                self.stats['failed'] += 1
+                raise Forbidden("Purchase token already used.")
+            self._tokens.set(key, (session, None))
+        try:
+            token = self.vingd.verify_purchase(oid, tid)
+        except BaseException:
+            # not verified (whatever the error): release the claim, so the
+            # token can be verified again
+            self._tokens.invalidate(key)
+            with self._lock:
+                self.stats['failed'] += 1
+            raise
+        with self._lock:
+            self.stats['verified'] += 1
+        self._tokens.set(key, (session, token))
+        return token
+
+    def commit(self, token):
+        """Queues commit of the purchase of `token` (unless already
+        queued)."""
+        purchaseid = token['purchaseid']
+        with self._lock:
+            if self._committing.get(purchaseid):
+                return
+            self._committing.set(purchaseid, True)
+        self._commits.put(token)
+
+    def _commit_loop(self):
+        while True:
+            token = self._commits.get()
+            try:
+                self.vingd.commit_purchase(token['purchaseid'], token['transferid'])
+            except Exception as e:
+                with self._lock:
+                    self.stats['commit_errors'] += 1
+                if self.on_error is not None:
+                    self.on_error(token, e)
+            else:
+                with self._lock:
+                    self.stats['committed'] += 1
+            finally:
+                self._commits.task_done()
+
+    def join(self):
+        """Blocks until all queued commits are processed."""
+        self._commits.join()
+
+    def request(self, session, query, oid=None):
+        """
+        Handles a request of `session` (`None` if the buyer has no session
+        yet) for URL `query`: verifies callback token, if any. Returns
+        ``(session, purchase, purchases, pending, error)``: `session` (a new
+        one, if a new purchase was verified), `purchase` of
+        `oid` (or of the callback object, if `oid` is `None`), all
+        `purchases` of the session, `pending` purchase to commit after a
+        successful response (or `None`) and `error` of the verification.
+        """
+        purchases = self.purchases(session)
+        pending = error = None
+        callback = _callback(query)
+        if callback is not None and (oid is None or callback[0] == oid):
+            # the buyer reloading the callback URL, or a new purchase
+            token = self.cached(callback[0], callback[1], session)
+            if token is None:
+                # a new session for each new purchase (so a session id
+                # planted before the purchase is useless)
+                new = _new_session()
+                try:
+                    token = self.verify(callback[0], callback[1], new)
+                except GeneralException as e:
+                    error = e
+                else:
+                    purchases[callback[0]] = token
+                    session = new
+                    self._sessions.set(session, dict(purchases))
+            pending = token
+            if oid is None:
+                oid = callback[0]
+        purchase = purchases.get(oid) if oid is not None else None
+        if pending is None and purchase is not None:
+            pending = purchase
+        return session, purchase, purchases, pending, error
+
+
+class _Response(object):
+    """WSGI response iterable, committing purchase once it's been sent."""
+
+    def __init__(self, result, done):
+        self._result = result
+        self._done = done
+
+    def __iter__(self):
+        return iter(self._result)
+
+    def close(self):
+        try:
+            if hasattr(self._result, 'close'):
+                self._result.close()
+        finally:
+            self._done()
+
+
+class PurchaseMiddleware(object):
+    """
+    WSGI middleware handling purchase callbacks of `app`, with `vingd` client
+    (see module docs). If `oid` is given, only purchases of that object are
+    considered. If `required`, requests without a verified purchase get
+    ``403 Forbidden``, without reaching `app`. Other arguments are passed on
+    to `PurchaseSessions` (or give one, `sessions`, to share it between
+    middlewares).
+    """
+
+    def __init__(self, app, vingd, oid=None, required=False, sessions=None, **options):
+        self.app = app
+        self.oid = oid
+        self.required = required
+        self.sessions = sessions or PurchaseSessions(vingd, **options)
+
+    def __call__(self, environ, start_response):
+        sessions = self.sessions
+        session = _cookie(environ.get('HTTP_COOKIE'))
+        new, purchase, purchases, pending, error = sessions.request(
+            session, environ.get('QUERY_STRING'), self.oid)
+        environ['vingd.purchase'] = purchase
+        environ['vingd.purchases'] = purchases
+        environ['vingd.error'] = error
+        cookie = None
+        if new != session:
+            secure = environ.get('wsgi.url_scheme') == 'https'
+            cookie = ('Set-Cookie', _set_cookie(new, secure))
+
+        if self.required and purchase is None:
+            headers = [('Content-Type', 'text/plain')]
+            if cookie:
+                headers.append(cookie)
+            start_response('403 Forbidden', headers)
+            return [b'Purchase required.']
+
+        status = []
+        def start(code, headers, exc_info=None):
+            status[:] = [code]
+            if cookie:
+                headers = list(headers) + [cookie]
+            return start_response(code, headers, exc_info)
+
+        def done():
+            if pending is not None and status and int(status[0].split()[0]) < 400:
+                sessions.commit(pending)
+
+        return _Response(self.app(environ, start), done)
@@ -0,0 +1,288 @@
+"""
+Thread-safe pool of persistent (keep-alive) HTTPS connections to a single
+Vingd backend host, optionally multiplexing requests over a few HTTP/2
+connections (see `vingd.http2`).
+"""
+try:
+    import httplib
+except ImportError:
+    import http.client as httplib
+
+import socket
+import threading
+import time
+
+from .profiling import mark
+from .resolver import Resolver
+from .tls import TLSContext
+from .tracing import current_span
+
+
+class ConnectError(socket.error):
+    """Connection (TCP connect, or TLS handshake) to backend host failed, i.e.
+    request was certainly not sent."""
+
+
+class HTTPSConnection(httplib.HTTPSConnection):
+    """`httplib.HTTPSConnection` connecting via (caching) `Resolver`, with a
+    shared `TLSContext` (and TLS session resumption)."""
+    
+    def __init__(self, host, port, timeout=None, resolver=None, tls=None):
+        if timeout is None:
+            timeout = socket._GLOBAL_DEFAULT_TIMEOUT
+        self.resolver = resolver or Resolver()
+        self.tls = tls or TLSContext()
+        httplib.HTTPSConnection.__init__(self, host, port, timeout=timeout,
+                                         context=self.tls.context)
+    
+    def connect(self):
+        timeout = self.timeout
+        if timeout is socket._GLOBAL_DEFAULT_TIMEOUT:
+            timeout = None
+        try:
+            sock = self.resolver.connect(self.host, self.port, timeout)
+            mark('pool')
+            self.sock = self.tls.wrap(sock, self.host, self.port)
+            mark('tls')
+        except socket.error as e:
+            raise ConnectError("Connection to %s:%s failed (%s)." % (self.host, self.port, e))
+
+
+class PooledResponse(object):
+    """
+    HTTP response read from a pooled connection. Mimics (a subset of)
+    `httplib.HTTPResponse` interface: `status`, `getheader` and `read`.
+
+    Connection is returned to the pool as soon as response is read completely
+    (or on `close`).
+    """
+
+    def __init__(self, response, release):
+        self.status = response.status
+        self._response = response
+        self._release = release
+
+    def getheader(self, name, default=None):
+        return self._response.getheader(name, default)
+
+    def read(self, size=None):
+        chunk = self._response.read(size) if size else self._response.read()
+        if not chunk or self._response.isclosed():
+            self.close()
+        return chunk
+
+    def close(self):
+        if self._release is not None:
+            self._release()
+            self._release = None
+
+
+class ConnectionPool(object):
+    """
+    Pool of (at most `maxsize` concurrently used) keep-alive HTTPS connections
+    to ``host:port``. Idle connections are reused in LIFO order. A request
+    failing on a reused connection because the server has closed it in the
+    meantime is retried once, on a fresh connection (if it failed after being
+    sent, only an `IDEMPOTENT` one: the server might have processed it).
+
+    If `http2` is set, requests are multiplexed over (at most)
+    `http2_connections` HTTP/2 connections instead (requires the `h2`
+    package). If the server doesn't negotiate HTTP/2 (via ALPN), pool falls
+    back to HTTP/1.1. `stream_timeout` limits the time (in seconds) an HTTP/2
+    stream waits for a response (or any next chunk of data).
+
+    Host addresses are resolved (and cached) with `resolver`. Connections can
+    be opened ahead of time, with `warmup`. All connections share a single
+    SSL context and resume TLS sessions, via `tls` (and `tls_h2`, for HTTP/2
+    connections; see `vingd.tls.TLSContext`).
+    """
+
+    IDEMPOTENT = ('GET', 'HEAD', 'PUT', 'DELETE')
+
+    def __init__(self, host, port=443, maxsize=10, timeout=None,
+                 http2=False, http2_connections=2, stream_timeout=None,
+                 resolver=None, tls=None, tls_h2=None):
+        self.host = host
+        self.port = port
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self.http2 = http2
+        self.http2_connections = http2_connections
+        self.stream_timeout = stream_timeout
+        self.resolver = resolver or Resolver()
+        self.tls = tls or TLSContext()
+        self.tls_h2 = tls_h2
+        self.stats = {'requests': 0, 'connections': 0, 'reused': 0, 'retried': 0}
+        self._idle = []
+        self._h2 = []
+        self._connecting = 0
+        self._slots = threading.BoundedSemaphore(maxsize)
+        self._lock = threading.Lock()
+        self._h2_changed = threading.Condition(self._lock)
+        if http2:
+            # fail early if `h2` is not installed
+            from .http2 import HTTP2Connection
+
+    def _new_connection(self):
+        with self._lock:
+            self.stats['connections'] += 1
+        return HTTPSConnection(self.host, self.port, timeout=self.timeout,
+                               resolver=self.resolver, tls=self.tls)
+
+    def _get_connection(self):
+        with self._lock:
+            if self._idle:
+                self.stats['reused'] += 1
+                return self._idle.pop(), True
+        return self._new_connection(), False
+
+    def _put_connection(self, conn, response):
+        if conn.sock is not None:
+            self.tls.save(conn.sock, self.host, self.port)
+        if response.isclosed() and not response.will_close:
+            with self._lock:
+                self._idle.append(conn)
+        else:
+            conn.close()
+        self._slots.release()
+
+    def _h2_connection(self):
+        """Returns the least loaded live HTTP/2 connection (opening a new one if
+        needed), or `None` if server doesn't speak HTTP/2."""
+        from .http2 import HTTP2Connection, ProtocolNegotiationError
+        with self._h2_changed:
+            while True:
+                if not self.http2:
+                    return None
+                live = self._h2 = [c for c in self._h2 if not c.closed]
+                free = [c for c in live if c.available]
+                if len(live) + self._connecting < self.http2_connections and not free:
+                    break
+                if free or live:
+                    return min(free or live, key=lambda c: c.active)
+                # first connection is being established
+                self._h2_changed.wait()
+            self._connecting += 1
+        if self.tls_h2 is None:
+            self.tls_h2 = TLSContext(alpn_protocols=HTTP2Connection.ALPN_PROTOCOLS)
+        conn = HTTP2Connection(self.host, self.port, timeout=self.timeout,
+                               resolver=self.resolver, tls=self.tls_h2)
+        try:
+            conn.connect()
+        except ProtocolNegotiationError:
+            self.http2 = False
+            conn = None
+        finally:
+            with self._h2_changed:
+                self._connecting -= 1
+                if conn is not None and not conn.closed:
+                    self._h2.append(conn)
+                    self.stats['connections'] += 1
+                self._h2_changed.notify_all()
+        return conn
+
+    def request(self, verb, path, body=None, headers={}):
+        """Sends request, and returns response (`PooledResponse`, or
+        `vingd.http2.HTTP2Response`) as soon as its headers are received."""
+        with self._lock:
+            self.stats['requests'] += 1
+        if self.http2:
+            conn = self._h2_connection()
+            mark('pool')
+            if conn is not None:
+                return conn.request(verb, path, body, headers, timeout=self.stream_timeout)
+
+        started = time.time()
+        self._slots.acquire()
+        conn, reused = self._get_connection()
+        try:
+            if not reused:
+                conn.connect()
+            mark('pool')
+            span = current_span()
+            if span is not None:
+                span.attributes['pool.wait'] = time.time() - started
+                span.attributes['pool.connection'] = 'reused' if reused else 'new'
+            sent = False
+            try:
+                conn.request(verb, path, body, headers)
+                sent = True
+                response = conn.getresponse()
+            except socket.timeout:
+                raise
+            except (httplib.BadStatusLine, httplib.CannotSendRequest, socket.error):
+                if not reused or (sent and verb.upper() not in self.IDEMPOTENT):
+                    raise
+                # stale keep-alive connection (closed by server while idle)
+                conn.close()
+                with self._lock:
+                    self.stats['retried'] += 1
+                conn = self._new_connection()
+                conn.request(verb, path, body, headers)
+                response = conn.getresponse()
+        except:
+            conn.close()
+            self._slots.release()
+            raise
+        mark('wait')
+        return PooledResponse(response, lambda: self._put_connection(conn, response))
+
+    def warmup(self, connections=1):
+        """
+        Resolves host address and opens up to `connections` idle connections
+        (TCP + TLS handshake) in parallel, so that first requests don't pay the
+        connection setup latency. With `http2`, HTTP/2 connections are opened
+        (up to `http2_connections`) instead.
+        
+        Returns the time (in seconds) warm-up took. Raises the first
+        connection error encountered, if any.
+        """
+        started = time.time()
+        self.resolver.resolve(self.host, self.port)
+        if self.http2:
+            count = min(connections, self.http2_connections)
+            opener = self._h2_connection
+        else:
+            with self._lock:
+                count = min(connections, self.maxsize) - len(self._idle)
+            opener = self._warm_connection
+        errors = []
+        def open():
+            try:
+                opener()
+            except Exception as e:
+                errors.append(e)
+        threads = [threading.Thread(target=open) for _ in range(max(count, 0))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if errors:
+            raise errors[0]
+        return time.time() - started
+
+    def _warm_connection(self):
+        conn = self._new_connection()
+        conn.connect()
+        with self._lock:
+            if len(self._idle) < self.maxsize:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def probe(self):
+        """Opens a fresh (HTTP/1.1) connection, kept idle if there's room, and
+        returns the time (in seconds) it took to connect (TCP + TLS handshake).
+        Raises `ConnectError` on failure."""
+        started = time.time()
+        self._warm_connection()
+        return time.time() - started
+
+    def close(self):
+        """Closes all idle connections (connections in use are closed when
+        released)."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+            h2, self._h2 = self._h2, []
+        for conn in idle + h2:
+            conn.close()
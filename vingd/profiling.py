@@ -0,0 +1,166 @@
+"""
+Per-phase profiling of `Vingd` API calls.
+
+With a `Profiler` set on a client (``vingd.profiler = Profiler()``; set it back
+to `None`, or toggle `Profiler.enabled`, to stop profiling, at any time), the
+wall and CPU time of each API method call is split into phases:
+
+ * ``build``: URL/path building (``safeformat``, ``quote``), argument
+   validation, request headers,
+ * ``encode``: request body JSON encoding (and compression),
+ * ``pool``: waiting for a pooled connection (or under `Vingd.limiter`),
+   connecting (DNS resolution, TCP connect),
+ * ``tls``: TLS handshake of a new connection,
+ * ``wait``: sending the request and waiting for response headers,
+ * ``read``: reading (and decompressing) the response body,
+ * ``decode``: response JSON decoding,
+ * ``raise``: constructing an API exception from an error response,
+ * ``other``: everything else (e.g. result post-processing).
+
+Phase boundaries are marked (with `mark`) along the request path, and each
+phase is charged the time elapsed since the previous mark. Timings are kept
+per thread during a call, and added to the profiler's totals once per call.
+Marks outside of a profiled call (or with profiling disabled) only cost a
+thread-local lookup.
+
+Hedged requests (see `HedgePolicy`) run in helper threads, so their phases
+(apart from ``build``) are charged to ``wait``.
+
+Example::
+
+    from vingd.profiling import Profiler
+
+    vingd.profiler = Profiler()
+    ...
+    print(vingd.profiler.stats())
+    vingd.profiler.dump('vingd.folded')      # for flamegraph.pl / speedscope
+"""
+import threading
+import time
+from functools import wraps
+
+
+# per-thread CPU time, where available
+_cpu = getattr(time, 'thread_time', None) or getattr(time, 'process_time', None) or time.clock
+_wall = time.time
+
+PHASES = ('build', 'encode', 'pool', 'tls', 'wait', 'read', 'decode', 'raise',
+          'other')
+
+_local = threading.local()
+
+
+class _Session(object):
+    """Timings of a single (profiled) API method call, in the calling
+    thread."""
+
+    __slots__ = ('method', 'wall', 'cpu', 'phases')
+
+    def __init__(self, method):
+        self.method = method
+        self.wall = _wall()
+        self.cpu = _cpu()
+        self.phases = {}
+
+    def mark(self, phase):
+        wall, cpu = _wall(), _cpu()
+        totals = self.phases.get(phase)
+        if totals is None:
+            self.phases[phase] = [wall - self.wall, cpu - self.cpu]
+        else:
+            totals[0] += wall - self.wall
+            totals[1] += cpu - self.cpu
+        self.wall, self.cpu = wall, cpu
+
+
+def mark(phase):
+    """Ends current `phase` (charges it with the time elapsed since the
+    previous mark) of the profiled call in progress in this thread, if any."""
+    session = getattr(_local, 'session', None)
+    if session is not None:
+        session.mark(phase)
+
+
+class Profiler(object):
+    """Aggregates wall/CPU time per API method and phase."""
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self._totals = {}
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        # configuration only, totals are not transferred
+        return {'enabled': self.enabled}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def start(self, method):
+        _local.session = _Session(method)
+
+    def stop(self):
+        session = _local.session
+        _local.session = None
+        session.mark('other')
+        with self._lock:
+            method = session.method
+            self._calls[method] = self._calls.get(method, 0) + 1
+            for phase, (wall, cpu) in session.phases.items():
+                totals = self._totals.get((method, phase))
+                if totals is None:
+                    self._totals[(method, phase)] = [wall, cpu]
+                else:
+                    totals[0] += wall
+                    totals[1] += cpu
+
+    def reset(self):
+        with self._lock:
+            self._totals = {}
+            self._calls = {}
+
+    def stats(self):
+        """``{<method>: {'calls': <n>, <phase>: {'wall': <seconds>, 'cpu':
+        <seconds>}, ...}}``."""
+        with self._lock:
+            totals, calls = dict(self._totals), dict(self._calls)
+        stats = dict((method, {'calls': n}) for method, n in calls.items())
+        for (method, phase), (wall, cpu) in totals.items():
+            stats[method][phase] = {'wall': wall, 'cpu': cpu}
+        return stats
+
+    def collapsed(self, metric='cpu'):
+        """Totals in collapsed stack format (one ``vingd;<method>;<phase>
+        <microseconds>`` line per method and phase), as consumed by
+        ``flamegraph.pl`` and speedscope. `metric` is ``cpu`` or ``wall``."""
+        index = {'wall': 0, 'cpu': 1}[metric]
+        with self._lock:
+            totals = sorted(self._totals.items())
+        return ''.join(
+            "vingd;%s;%s %d\n" % (method, phase, round(values[index] * 1e6))
+            for (method, phase), values in totals
+        )
+
+    def dump(self, path, metric='cpu'):
+        """Writes `collapsed` totals to file `path`."""
+        with open(path, 'w') as fp:
+            fp.write(self.collapsed(metric))
+
+
+def profiled(method):
+    """Decorator profiling a `Vingd` API method with the client's `profiler`
+    (calls nested in a profiled call are profiled as a part of it)."""
+    name = method.__name__
+
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        profiler = self.profiler
+        if profiler is None or not profiler.enabled or getattr(_local, 'session', None) is not None:
+            return method(self, *args, **kwargs)
+        profiler.start(name)
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            profiler.stop()
+    return wrapper
@@ -0,0 +1,246 @@
+"""
+Compact (``__slots__``-based) records for Vingd API results, an opt-in
+alternative to plain dictionaries (see `Vingd.records`), for holding large
+numbers of vouchers, voucher log entries, orders, tokens or objects in memory.
+
+Records keep known fields in slots (unknown fields, if any, in a small
+overflow dictionary), and build derived values (parsed timestamps, frontend
+URLs) only when accessed. They remain dictionary-compatible: ``record['vid']``,
+``record.get('gid')``, ``'gid' in record``, ``dict(record)`` work as before,
+and so do the result shapes of `Vingd.create_voucher` (``voucher['raw']``,
+``voucher['urls']``) and `Vingd.create_order` (``order['object']['id']``,
+``order['urls']``).
+
+Derived values (``raw`` and ``urls``) are available through item access
+only: keys (and so iteration, `Record.to_dict`, equality and pickled state)
+hold the data itself.
+"""
+try:
+    from urlparse import urljoin
+except ImportError:
+    from urllib.parse import urljoin
+
+from .util import parse_isotime
+
+
+def _timestamp(field):
+    """Property parsing (ISO8601) timestamp `field` into `datetime` (on each
+    access)."""
+    def get(self):
+        value = getattr(self, field, None)
+        return parse_isotime(value) if value else None
+    return property(get, doc="`%s`, parsed (`datetime`)." % field)
+
+
+class Record(object):
+    """Base record: fields in `FIELDS` are kept in slots, others in `_extra`.
+    Names in `DERIVED` (values derived from fields) are available through
+    item access too, but are not keys."""
+
+    __slots__ = ('_extra',)
+
+    FIELDS = ()
+    DERIVED = ()
+
+    def __init__(self, data=None, **fields):
+        self._extra = None
+        if data:
+            self.update(data)
+        if fields:
+            self.update(fields)
+
+    @classmethod
+    def convert(cls, data, *args):
+        """Converts a result (``dict``, or a ``list`` of them) to record(s);
+        `args` are passed on to the constructor."""
+        if isinstance(data, list):
+            return [cls(item, *args) for item in data]
+        if isinstance(data, dict):
+            return cls(data, *args)
+        return data
+
+    def __repr__(self):
+        return "<%s %r>" % (type(self).__name__, self.to_dict())
+
+    def __getitem__(self, key):
+        if key in self.FIELDS or key in self.DERIVED:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                raise KeyError(key)
+        if self._extra and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key in self.FIELDS:
+            setattr(self, key, value)
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+
+    def __contains__(self, key):
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __eq__(self, other):
+        if isinstance(other, (Record, dict)):
+            return self.to_dict() == dict(other)
+        return NotImplemented
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    __hash__ = None
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self):
+        keys = [name for name in self.FIELDS if hasattr(self, name)]
+        if self._extra:
+            keys.extend(self._extra)
+        return keys
+
+    def values(self):
+        return [self[key] for key in self.keys()]
+
+    def items(self):
+        return [(key, self[key]) for key in self.keys()]
+
+    def update(self, data):
+        for key, value in data.items():
+            self[key] = value
+
+    def to_dict(self):
+        return dict(self.items())
+
+    def __getstate__(self):
+        return self.to_dict()
+
+    def __setstate__(self, state):
+        self._extra = None
+        self.update(state)
+
+
+class Voucher(Record):
+    """Voucher description (as returned by `Vingd.get_vouchers`). For
+    compatibility with `Vingd.create_voucher` results, ``voucher['raw']`` is
+    the voucher itself, and ``voucher['urls']`` its frontend URLs."""
+
+    FIELDS = ('vid', 'vid_encoded', 'amount_allocated', 'amount_vouched',
+              'id_fort_transfer', 'fee', 'uid_from', 'uid_proxy', 'uid_to',
+              'gid', 'ts_valid_until', 'description', 'message', 'state')
+    DERIVED = ('raw', 'urls')
+
+    __slots__ = FIELDS + ('_frontend',)
+
+    def __init__(self, data=None, frontend=None, **fields):
+        self._frontend = frontend
+        super(Voucher, self).__init__(data, **fields)
+
+    valid_until = _timestamp('ts_valid_until')
+
+    @property
+    def raw(self):
+        return self
+
+    @property
+    def urls(self):
+        return {
+            'redirect': urljoin(self._frontend, '/vouchers/%s' % self.vid_encoded),
+            'popup': urljoin(self._frontend, '/popup/vouchers/%s' % self.vid_encoded)
+        }
+
+    def __getstate__(self):
+        return self.to_dict(), self._frontend
+
+    def __setstate__(self, state):
+        data, self._frontend = state
+        super(Voucher, self).__setstate__(data)
+
+
+class VoucherLogEntry(Record):
+    """Voucher log entry (as returned by `Vingd.get_vouchers_history`)."""
+
+    FIELDS = ('id', 'vid', 'vid_encoded', 'action', 'gid', 'uid_from',
+              'uid_to', 'amount_vouched', 'ts_created', 'ts_valid_until')
+
+    __slots__ = FIELDS
+
+    created = _timestamp('ts_created')
+    valid_until = _timestamp('ts_valid_until')
+
+
+class Token(Record):
+    """Purchase token data (as returned by `Vingd.verify_purchase`)."""
+
+    FIELDS = ('object', 'huid', 'context', 'purchaseid', 'transferid')
+
+    __slots__ = FIELDS
+
+
+class Object(Record):
+    """Object description (as returned by `Vingd.get_objects`)."""
+
+    FIELDS = ('oid', 'uid', 'description', 'timestamp_created',
+              'timestamp_modified')
+
+    __slots__ = FIELDS
+
+    created = _timestamp('timestamp_created')
+    modified = _timestamp('timestamp_modified')
+
+
+class Order(Record):
+    """Order (as returned by `Vingd.create_order`): ``id``, ``expires``
+    (`datetime`), ``context``, ``object`` (``{'id': <oid>, 'price':
+    <price>}``) and frontend ``urls``."""
+
+    # ``object`` is kept in ``oid`` and ``price`` slots
+    FIELDS = ('id', 'expires', 'context', 'object')
+    DERIVED = ('urls',)
+
+    __slots__ = ('id', 'expires', 'context', 'oid', 'price', '_frontend')
+
+    def __init__(self, data=None, frontend=None, **fields):
+        self._frontend = frontend
+        super(Order, self).__init__(data, **fields)
+
+    def __setitem__(self, key, value):
+        if key == 'object':
+            self.oid, self.price = value['id'], value['price']
+        else:
+            super(Order, self).__setitem__(key, value)
+
+    @property
+    def object(self):
+        return {'id': self.oid, 'price': self.price}
+
+    @property
+    def urls(self):
+        return {
+            'redirect': urljoin(self._frontend, '/orders/%d/add/' % self.id),
+            'popup': urljoin(self._frontend, '/popup/orders/%d/add/' % self.id)
+        }
+
+    def __getstate__(self):
+        return self.to_dict(), self._frontend
+
+    def __setstate__(self, state):
+        data, self._frontend = state
+        super(Order, self).__setstate__(data)
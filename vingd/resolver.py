@@ -0,0 +1,51 @@
+"""
+Caching DNS resolver for Vingd backend hosts.
+"""
+import socket
+
+from .cache import TTLCache
+
+
+class Resolver(object):
+    """
+    Resolves ``host:port`` into a list of socket addresses (`getaddrinfo`
+    results), caching them for `ttl` seconds.
+    
+    `connect` tries the cached addresses in order, and drops the cached entry
+    if none of them is reachable (so the next attempt resolves anew).
+    """
+    
+    def __init__(self, ttl=300):
+        self.cache = TTLCache(ttl)
+    
+    @property
+    def stats(self):
+        return self.cache.stats
+    
+    def resolve(self, host, port):
+        key = (host, port)
+        addrs = self.cache.get(key)
+        if addrs is None:
+            addrs = socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM)
+            self.cache.set(key, addrs)
+        return addrs
+    
+    def connect(self, host, port, timeout=None):
+        """Opens a TCP connection to ``host:port`` (on the first reachable
+        resolved address). Returns the connected socket."""
+        error = None
+        for family, socktype, proto, _, addr in self.resolve(host, port):
+            sock = None
+            try:
+                sock = socket.socket(family, socktype, proto)
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                if timeout is not None:
+                    sock.settimeout(timeout)
+                sock.connect(addr)
+                return sock
+            except socket.error as e:
+                error = e
+                if sock is not None:
+                    sock.close()
+        self.cache.invalidate((host, port))
+        raise error or socket.error("No addresses found for '%s'." % host)
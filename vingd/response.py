@@ -16,12 +16,14 @@ class Codes:
     # error
     MULTIPLE_CHOICES = 300
     MOVED_PERMANENTLY = 301
+    NOT_MODIFIED = 304
     BAD_REQUEST = 400
     PAYMENT_REQUIRED = 402
     FORBIDDEN = 403
     NOT_FOUND = 404
     CONFLICT = 409
     GONE = 410
+    TOO_MANY_REQUESTS = 429
     INTERNAL_SERVER_ERROR = 500
     NOT_IMPLEMENTED = 501
 
@@ -0,0 +1,260 @@
+"""
+Safe (at-most-once) concurrent rewarding, with idempotency keys and a local
+ledger.
+
+`Vingd.reward_user` is a non-idempotent ``POST``: if a request fails on the
+network level, the reward may or may not have been made, and blindly retrying
+it might pay the user twice. `RewardPipeline` gives each reward a
+client-generated idempotency key (sent as ``Idempotency-Key`` header), and
+records it in a `RewardLedger` *before* sending it. A reward with an uncertain
+outcome (network error, or a ``5xx`` response) is reconciled before it's
+retried: a `reconcile` callable decides whether the reward has been made.
+
+Example::
+
+    from vingd import Vingd
+    from vingd.rewards import RewardLedger, RewardPipeline
+
+    v = Vingd(username="...", password="...")
+    pipeline = RewardPipeline(v, RewardLedger('rewards.db'), workers=16)
+
+    rewards = [{'huid': huid, 'amount': 100, 'key': 'spring-%s' % huid}
+               for huid in huids]
+    for reward, result, error in pipeline.run(rewards):
+        ...
+
+    pipeline.resume()   # after a crash: reconciles unfinished rewards
+
+Note: the Vingd API offers no rewards history to reconcile against, so the
+default is conservative -- an uncertain reward is never resent, but left in
+`RewardLedger.UNCERTAIN` state (to be resolved with `RewardLedger.resolve`).
+Provide `reconcile` (e.g. checking the recipients' balances, or your own
+records), or set `retry_uncertain` if the backend deduplicates rewards on
+``Idempotency-Key``.
+"""
+try:
+    import simplejson as json
+except ImportError:
+    import json
+
+import sqlite3
+import threading
+import time
+import uuid
+
+from .exceptions import GeneralException
+from .response import Codes
+from .util import pmap
+
+
+class RewardLedger(object):
+    """
+    Local (SQLite) record of rewards and their states, keyed by idempotency
+    key. It is safe to share between threads.
+
+    States: `PENDING` (recorded, being sent), `SENT` (done; the result is
+    stored), `FAILED` (definitely rejected by the server) and `UNCERTAIN`
+    (might, or might not, have been made).
+    """
+
+    PENDING = 'pending'
+    SENT = 'sent'
+    FAILED = 'failed'
+    UNCERTAIN = 'uncertain'
+
+    COLUMNS = ('key', 'huid', 'amount', 'description', 'state', 'attempts',
+               'result', 'error', 'ts_created', 'ts_updated')
+
+    def __init__(self, path=':memory:'):
+        self.path = path
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self.db:
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS rewards (key TEXT PRIMARY KEY, "
+                "huid TEXT NOT NULL, amount INTEGER NOT NULL, description TEXT, "
+                "state TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, "
+                "result TEXT, error TEXT, ts_created REAL, ts_updated REAL)"
+            )
+            self.db.execute(
+                "CREATE INDEX IF NOT EXISTS rewards_state ON rewards (state)"
+            )
+
+    def close(self):
+        self.db.close()
+
+    def __len__(self):
+        with self._lock:
+            return self.db.execute("SELECT COUNT(*) FROM rewards").fetchone()[0]
+
+    def _entry(self, row):
+        entry = dict(zip(self.COLUMNS, row))
+        if entry['result'] is not None:
+            entry['result'] = json.loads(entry['result'])
+        return entry
+
+    def get(self, key):
+        """Returns ledger entry (``dict``) for `key`, or `None`."""
+        with self._lock:
+            row = self.db.execute(
+                "SELECT %s FROM rewards WHERE key = ?" % ", ".join(self.COLUMNS),
+                (key,)).fetchone()
+        return self._entry(row) if row else None
+
+    def record(self, key, huid, amount, description=None):
+        """Records a new `PENDING` reward (committed before returning). If
+        `key` is already recorded, the existing entry is returned instead."""
+        now = time.time()
+        with self._lock, self.db:
+            self.db.execute(
+                "INSERT OR IGNORE INTO rewards "
+                "(key, huid, amount, description, state, ts_created, ts_updated) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, huid, amount, description, self.PENDING, now, now))
+        return self.get(key)
+
+    def update(self, key, state, result=None, error=None, attempt=False):
+        """Sets `state` (and `result`/`error`) of `key`, counting an attempt
+        if `attempt` is set."""
+        with self._lock, self.db:
+            self.db.execute(
+                "UPDATE rewards SET state = ?, result = ?, error = ?, "
+                "attempts = attempts + ?, ts_updated = ? WHERE key = ?",
+                (state, None if result is None else json.dumps(result),
+                 None if error is None else str(error), int(attempt),
+                 time.time(), key))
+
+    def resolve(self, key, result=None):
+        """Manually resolves an uncertain reward: as `SENT` (with `result`), or
+        as not made (`FAILED`), if `result` is `None`."""
+        if result is None:
+            self.update(key, self.FAILED, error="Resolved as not made.")
+        else:
+            self.update(key, self.SENT, result)
+
+    def entries(self, *states):
+        """Yields entries in any of `states` (all, if none given), oldest
+        first."""
+        sql = "SELECT %s FROM rewards" % ", ".join(self.COLUMNS)
+        params = states
+        if states:
+            sql += " WHERE state IN (%s)" % ", ".join("?" * len(states))
+        sql += " ORDER BY ts_created"
+        with self._lock:
+            rows = self.db.execute(sql, params).fetchall()
+        for row in rows:
+            yield self._entry(row)
+
+    def stats(self):
+        """Number of entries per state."""
+        with self._lock:
+            return dict(self.db.execute(
+                "SELECT state, COUNT(*) FROM rewards GROUP BY state").fetchall())
+
+
+class RewardPipeline(object):
+    """
+    Sends rewards from (at most) `workers` concurrent threads, recording each
+    in `ledger` before sending it.
+
+    A reward failing with an uncertain outcome is reconciled, by calling
+    ``reconcile(vingd, entry)``, which should return the reward result
+    (e.g. ``{'transfer_id': ..}``) if the reward has been made, `None` if it
+    certainly hasn't (and it's safe to resend it), or raise an exception if
+    that can't be determined. Rewards not made are retried (at most `retries`
+    times), with the same idempotency key.
+
+    Without `reconcile`, uncertain rewards are retried only if
+    `retry_uncertain` is set (i.e. if the backend is known to deduplicate
+    requests on ``Idempotency-Key``), and left `UNCERTAIN` otherwise.
+    """
+
+    def __init__(self, vingd, ledger=None, workers=8, reconcile=None,
+                 retries=2, retry_uncertain=False):
+        self.vingd = vingd
+        self.ledger = ledger if ledger is not None else RewardLedger()
+        self.workers = workers
+        self.reconcile = reconcile
+        self.retries = retries
+        self.retry_uncertain = retry_uncertain
+
+    @staticmethod
+    def uncertain(error):
+        """Whether `error` leaves the reward outcome unknown (network errors
+        are raised as `InternalError`, with a ``5xx`` code)."""
+        return not isinstance(error, GeneralException) or \
+            error.code >= Codes.INTERNAL_SERVER_ERROR
+
+    def _reconcile(self, entry):
+        """Returns ``(made, result)``; `made` is `None` if unknown."""
+        if self.reconcile is None:
+            return (False, None) if self.retry_uncertain else (None, None)
+        try:
+            result = self.reconcile(self.vingd, entry)
+        except Exception:
+            return None, None
+        return result is not None, result
+
+    def send(self, entry):
+        """Sends the reward described by ledger `entry` (reconciling it first,
+        if its outcome is unknown). Returns the reward result."""
+        key = entry['key']
+        if entry['state'] == RewardLedger.SENT:
+            return entry['result']
+        if entry['state'] in (RewardLedger.PENDING, RewardLedger.UNCERTAIN) \
+                and entry['attempts']:
+            made, result = self._reconcile(entry)
+            if made:
+                self.ledger.update(key, RewardLedger.SENT, result)
+                return result
+            if made is None:
+                raise GeneralException(
+                    "Outcome of reward '%s' is unknown." % key, "Uncertain reward")
+        attempts = 0
+        while True:
+            attempts += 1
+            self.ledger.update(key, RewardLedger.PENDING, attempt=True)
+            try:
+                result = self.vingd.reward_user(
+                    entry['huid'], entry['amount'], entry['description'],
+                    idempotency_key=key)
+            except Exception as e:
+                if not self.uncertain(e):
+                    self.ledger.update(key, RewardLedger.FAILED, error=e)
+                    raise
+                made, result = self._reconcile(entry)
+                if made:
+                    self.ledger.update(key, RewardLedger.SENT, result)
+                    return result
+                if made is None or attempts > self.retries:
+                    self.ledger.update(key, RewardLedger.UNCERTAIN, error=e)
+                    raise
+                continue
+            self.ledger.update(key, RewardLedger.SENT, result)
+            return result
+
+    def submit(self, huid, amount, description=None, key=None):
+        """Records and sends a single reward. A reward with an already
+        recorded (and sent) `key` is not sent again."""
+        entry = self.ledger.record(key or uuid.uuid4().hex, huid, amount, description)
+        return self.send(entry)
+
+    def run(self, rewards):
+        """
+        Records and sends `rewards` (an iterable of ``{'huid': .., 'amount':
+        .., 'description': .., 'key': ..}`` dicts; `description` and `key` are
+        optional), concurrently.
+
+        Yields ``(reward, result, error)`` triples, in order of completion.
+        """
+        def submit(reward):
+            return self.submit(reward['huid'], int(reward['amount']),
+                               reward.get('description'), reward.get('key'))
+        return pmap(submit, rewards, self.workers)
+
+    def resume(self):
+        """Reconciles (and, where safe, resends) all rewards left `PENDING` or
+        `UNCERTAIN`, e.g. by a crashed run. Yields ``(entry, result, error)``
+        triples, like `run`."""
+        entries = list(self.ledger.entries(RewardLedger.PENDING, RewardLedger.UNCERTAIN))
+        return pmap(self.send, entries, self.workers)
@@ -0,0 +1,161 @@
+"""
+Priority classes of requests, and a priority-aware scheduler admitting them
+to the connection pool, so bulk jobs sharing a client with user-facing calls
+don't delay them.
+
+Requests are `INTERACTIVE` (the default), `BACKGROUND` or `BULK`. A
+request's class is given explicitly (``priority`` argument of
+`Vingd.request` and `Vingd.call`), or by the ``with priority_class(...)``
+block it runs in (in the current thread; see `prioritized` for worker
+threads), or else by `Vingd.default_priority`.
+
+Example (campaign and checkout sharing a client)::
+
+    v = Vingd(username="...", password="...", scheduler=True)
+
+    # campaign thread(s)
+    with priority_class(BULK):
+        v.create_voucher(amount=100, gid='campaign1')
+
+    # request handlers: interactive by default, unaffected by the campaign
+    v.verify_purchase(oid, tid)
+
+    print(v.scheduler.stats['interactive']['queue_time'])
+"""
+import threading
+import time
+from functools import wraps
+
+
+INTERACTIVE = 'interactive'
+BACKGROUND = 'background'
+BULK = 'bulk'
+
+# highest priority first
+PRIORITIES = (INTERACTIVE, BACKGROUND, BULK)
+
+_local = threading.local()
+
+
+def current_priority(default=None):
+    """Priority class set (with `priority_class`) in the current thread, or
+    `default`."""
+    return getattr(_local, 'priority', None) or default
+
+
+class priority_class(object):
+    """Context manager setting priority class of requests made in the
+    current thread."""
+
+    def __init__(self, priority):
+        if priority not in PRIORITIES:
+            raise ValueError("Invalid priority class: '%s'." % priority)
+        self.priority = priority
+
+    def __enter__(self):
+        self.previous = getattr(_local, 'priority', None)
+        _local.priority = self.priority
+        return self.priority
+
+    def __exit__(self, type, value, traceback):
+        _local.priority = self.previous
+
+
+def prioritized(func, priority):
+    """Wraps `func` to run with `priority` class (in whatever thread it's
+    called, e.g. in `vingd.util.pmap` workers)."""
+    @wraps(func)
+    def run(*args, **kwargs):
+        with priority_class(priority):
+            return func(*args, **kwargs)
+    return run
+
+
+class PriorityScheduler(object):
+    """
+    Admits at most `capacity` requests in flight (by default, the client's
+    `pool_size`), keeping `reserved` (``{<class>: <slots>}``) capacity for
+    each class: slots reserved for a class can't be taken by lower priority
+    classes. So, e.g. by default, with a capacity of 10, bulk requests may
+    take at most 7 slots, background 8, and interactive all 10.
+
+    If a `limiter` (`vingd.limiter.AdaptiveLimit`) is given to `acquire`,
+    capacity is bounded by its current `limit` too, and reserved slots are
+    kept within it.
+
+    Waiting requests are admitted in order of priority. Per class statistics
+    (in `stats`) are: ``requests``, ``queued`` (requests that had to wait),
+    ``queue_time`` (total, in seconds), ``max_queue_time`` and ``inflight``.
+    """
+
+    def __init__(self, capacity=10, reserved=None):
+        if reserved is None:
+            reserved = {INTERACTIVE: max(1, capacity // 4),
+                        BACKGROUND: max(1, capacity // 10)}
+        self.capacity = capacity
+        self.reserved = reserved
+        # slots reserved for higher priority classes
+        self._held = {}
+        held = 0
+        for priority in PRIORITIES:
+            self._held[priority] = held
+            held += reserved.get(priority, 0)
+        self._inflight = 0
+        self._waiting = dict((priority, 0) for priority in PRIORITIES)
+        self._cond = threading.Condition()
+        self.stats = dict((priority, {
+            'requests': 0,
+            'queued': 0,
+            'queue_time': 0.0,
+            'max_queue_time': 0.0,
+            'inflight': 0
+        }) for priority in PRIORITIES)
+
+    def __getstate__(self):
+        # configuration only, statistics are not transferred
+        return {'capacity': self.capacity, 'reserved': self.reserved}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def _admissible(self, priority, limiter=None):
+        capacity = self.capacity
+        if limiter is not None:
+            capacity = min(capacity, limiter.limit)
+        if self._inflight >= max(capacity - self._held[priority], 1):
+            return False
+        for higher in PRIORITIES:
+            if higher == priority:
+                return True
+            if self._waiting[higher]:
+                return False
+
+    def acquire(self, priority=INTERACTIVE, limiter=None):
+        """Blocks until a request of `priority` class is admitted (within
+        `limiter`'s limit, if given). Returns the time waited, in seconds."""
+        stats = self.stats[priority]
+        with self._cond:
+            waited = 0.0
+            if not self._admissible(priority, limiter):
+                started = time.time()
+                self._waiting[priority] += 1
+                try:
+                    while not self._admissible(priority, limiter):
+                        self._cond.wait()
+                finally:
+                    self._waiting[priority] -= 1
+                waited = time.time() - started
+                stats['queued'] += 1
+                stats['queue_time'] += waited
+                stats['max_queue_time'] = max(stats['max_queue_time'], waited)
+            self._inflight += 1
+            stats['requests'] += 1
+            stats['inflight'] += 1
+            return waited
+
+    def release(self, priority=INTERACTIVE):
+        """Ends a request (admitted with `acquire`)."""
+        with self._cond:
+            self._inflight -= 1
+            self.stats[priority]['inflight'] -= 1
+            self._cond.notify_all()
@@ -0,0 +1,242 @@
+"""
+Declarative table of (simple) Vingd API operations: HTTP verb, typed path
+template and typed request body schema.
+
+Each `Operation` is compiled (once, on import) into a request builder, which
+validates its parameters locally, so that an invalid call fails with
+`InvalidData` before anything is sent, instead of after a round-trip. Adding
+an endpoint is a matter of adding a table entry::
+
+    register(Operation('get_order', 'get', 'orders/{orderid:int}', hedge=True))
+
+and calling it with `Vingd.call`::
+
+    vingd.call('get_order', {'orderid': 123})
+
+Path templates hold ``{name:type}`` placeholders, where `type` is one of
+`PATH_TYPES`. Body schema maps body field names to their types (one of
+`BODY_TYPES`, with ``?`` suffix if `None` is allowed too), to nested body
+schemas (``dict``; their fields are parameters too), or to constant
+(non-string, non-dict) values.
+"""
+try:
+    import simplejson as json
+except ImportError:
+    import json
+
+import re
+from numbers import Integral
+
+from .exceptions import InvalidData
+from .profiling import mark
+
+try:
+    string_types = basestring
+except NameError:
+    string_types = str
+
+
+_hex = re.compile(r'^[a-fA-F\d]*$').match
+_ident = re.compile(r'^[-\w]*$').match
+_digits = re.compile(r'^\d+$').match
+
+
+def _int(x):
+    if isinstance(x, Integral) and not isinstance(x, bool):
+        return str(x)
+    if isinstance(x, string_types) and _digits(x):
+        return x
+    raise ValueError
+
+def _pattern(match):
+    def check(x):
+        if isinstance(x, (Integral, string_types)) and not isinstance(x, bool):
+            x = str(x)
+            if match(x):
+                return x
+        raise ValueError
+    return check
+
+def _typed(*types):
+    boolean = bool in types
+    def check(x):
+        if isinstance(x, types) and (boolean or not isinstance(x, bool)):
+            return x
+        raise ValueError
+    return check
+
+
+# path parameter type -> converter (to path segment), raising `ValueError`
+PATH_TYPES = {
+    'int': _int,
+    'hex': _pattern(_hex),
+    'ident': _pattern(_ident),
+    'str': _pattern(lambda x: '/' not in x)
+}
+
+# body field type -> validator, raising `ValueError`
+BODY_TYPES = {
+    'int': _typed(Integral),
+    'bool': _typed(bool),
+    'str': _typed(string_types),
+    'hex': _pattern(_hex),
+    'ident': _pattern(_ident),
+    'list': _typed(list, tuple),
+    'dict': _typed(dict)
+}
+
+_placeholder = re.compile(r'{(\w+):(\w+)}')
+
+
+class Operation(object):
+    """
+    A single API operation: `verb` on `path` template, with request body built
+    from `body` schema. Calls are `cacheable` and/or hedged (`hedge`) as in
+    `Vingd.request`.
+    """
+
+    def __init__(self, name, verb, path, body=None, cacheable=False, hedge=False):
+        self.name = name
+        self.verb = verb
+        self.path = path
+        self.body = body
+        self.cacheable = cacheable
+        self.hedge = hedge
+        self._compile()
+
+    def __repr__(self):
+        return "<Operation %s: %s %s>" % (self.name, self.verb.upper(), self.path)
+
+    def _compile(self):
+        # path: alternating literal parts and (name, type, converter)
+        parts = _placeholder.split(self.path)
+        segments = []
+        for i in range(0, len(parts) - 1, 3):
+            name, typ = parts[i + 1], parts[i + 2]
+            if typ not in PATH_TYPES:
+                raise ValueError("Invalid path parameter type: '%s'." % typ)
+            segments.append((parts[i], name, typ, PATH_TYPES[typ]))
+        self._segments = segments
+        self._tail = parts[-1]
+
+        self._fields = self._compile_body(self.body or {})
+        self.params = frozenset([s[1] for s in segments] + self._body_params(self._fields))
+
+    @classmethod
+    def _compile_body(cls, schema):
+        # (name, type, validator, optional), (name, None, None, constant), or
+        # (name, None, nested fields, None)
+        fields = []
+        for name, typ in schema.items():
+            if isinstance(typ, dict):
+                fields.append((name, None, cls._compile_body(typ), None))
+                continue
+            if not isinstance(typ, string_types):
+                fields.append((name, None, None, typ))
+                continue
+            optional = typ.endswith('?')
+            typ = typ.rstrip('?')
+            if typ not in BODY_TYPES:
+                raise ValueError("Invalid body field type: '%s'." % typ)
+            fields.append((name, typ, BODY_TYPES[typ], optional))
+        return fields
+
+    @classmethod
+    def _body_params(cls, fields):
+        params = []
+        for name, typ, check, optional in fields:
+            if typ is not None:
+                params.append(name)
+            elif check is not None:
+                params.extend(cls._body_params(check))
+        return params
+
+    def _invalid(self, name, typ, value):
+        return InvalidData("Parameter '%s' of %s: %s expected, got %r." % (
+            name, self.name, typ, value))
+
+    def build(self, params):
+        """Validates `params` (``dict``) and returns request ``(verb, path,
+        body)``, or raises `InvalidData`."""
+        for name in params:
+            if name not in self.params:
+                raise InvalidData("Unknown parameter of %s: '%s'." % (self.name, name))
+
+        path = []
+        for literal, name, typ, convert in self._segments:
+            try:
+                value = params[name]
+            except KeyError:
+                raise InvalidData("Parameter '%s' of %s missing." % (name, self.name))
+            try:
+                path.append(literal + convert(value))
+            except ValueError:
+                raise self._invalid(name, typ, value)
+        path.append(self._tail)
+
+        if self.body is None:
+            return self.verb, ''.join(path), ''
+        body = self._build_body(self._fields, params)
+        mark('build')
+        body = json.dumps(body)
+        mark('encode')
+        return self.verb, ''.join(path), body
+
+    def _build_body(self, fields, params):
+        body = {}
+        for name, typ, check, optional in fields:
+            if typ is None:
+                if check is None:
+                    body[name] = optional
+                else:
+                    body[name] = self._build_body(check, params)
+                continue
+            value = params.get(name)
+            if value is None:
+                if not optional:
+                    raise InvalidData("Parameter '%s' of %s missing." % (name, self.name))
+            else:
+                try:
+                    check(value)
+                except ValueError:
+                    raise self._invalid(name, typ, value)
+            body[name] = value
+        return body
+
+
+# name -> `Operation`
+OPERATIONS = {}
+
+def register(operation):
+    """Adds `operation` to the table (replacing one with the same name)."""
+    OPERATIONS[operation.name] = operation
+    return operation
+
+
+for _operation in (
+    Operation('create_object', 'post', 'registry/objects/',
+              body={'description': {'name': 'str', 'url': 'str'}}),
+    Operation('update_object', 'put', 'registry/objects/{oid:int}/',
+              body={'description': {'name': 'str', 'url': 'str'}}),
+    Operation('verify_purchase', 'get', 'objects/{oid:int}/tokens/{tid:hex}'),
+    Operation('commit_purchase', 'put', 'purchases/{purchaseid:int}',
+              body={'transferid': 'int'}),
+    Operation('create_order', 'post', 'objects/{oid:int}/orders/',
+              body={'price': 'int', 'order_expires': 'str', 'context': 'str?'}),
+    Operation('get_order', 'get', 'orders/{orderid:int}', hedge=True),
+    Operation('get_object', 'get', 'registry/objects/{oid:int}',
+              cacheable=True, hedge=True),
+    Operation('get_user_profile', 'get', 'id/users', cacheable=True, hedge=True),
+    Operation('get_account_balance', 'get', 'fort/accounts'),
+    Operation('authorized_get_account_balance', 'get', 'fort/accounts/{huid:hex}'),
+    Operation('authorized_purchase_object', 'post', 'objects/{oid:int}/purchases',
+              body={'price': 'int', 'huid': 'ident', 'autocommit': True}),
+    Operation('authorized_create_user', 'post', 'id/users/',
+              body={'identities': 'dict?', 'primary_identity': 'str?',
+                    'delegate_permissions': 'list?'}),
+    Operation('reward_user', 'post', 'rewards',
+              body={'huid_to': 'ident', 'amount': 'int', 'description': 'str?'}),
+    Operation('create_voucher', 'post', 'vouchers/',
+              body={'amount': 'int', 'until': 'str', 'message': 'str?', 'gid': 'ident?'}),
+):
+    register(_operation)
@@ -0,0 +1,320 @@
+"""
+Compact, memory-mapped, append-only binary snapshots of listings (voucher
+history, by default), in the column layout of `vingd.columnar`. Requires
+`numpy`.
+
+A snapshot file holds a header (format version and column schema), followed
+by segments, each appended by one `Snapshot.append` (or `Snapshot.sync`).
+Segment rows are sorted on the key column (creation timestamp), and only rows
+not older than the snapshot's `high_water_mark` (and not already stored, by
+``id``) are appended, so the snapshot can be updated incrementally.
+
+Columns are stored fixed-width (``int64`` integers and timestamps, ``int32``
+category codes, each followed by the segment's string table), and are mapped
+into memory on open, without being read: opening a multi-GB snapshot only
+reads segment headers, and a query only pages in the columns (and, with a key
+range, the parts of them) it touches.
+
+Example::
+
+    from datetime import datetime
+    from vingd import Vingd
+    from vingd.snapshot import Snapshot
+
+    v = Vingd(username="...", password="...")
+    snapshot = Snapshot('history.snap')
+    snapshot.sync(v)        # fetches only entries newer than already stored
+
+    table = snapshot.table(after=datetime(2013, 1, 1), columns=['gid', 'amount_vouched'])
+"""
+try:
+    import simplejson as json
+except ImportError:
+    import json
+
+import os
+import struct
+from datetime import datetime, timedelta
+
+import numpy
+
+from .columnar import (Categorical, Table, to_table, HISTORY_SCHEMA,
+                       INT, TIME, CATEGORY, MISSING)
+from .history import sync_log
+from .util import parse_isotime, timestamp, tzutc
+
+
+MAGIC = b'VINGDSNP'
+VERSION = 1
+SEGMENT_MAGIC = b'VSEG'
+
+# magic, version, schema length
+_FILE_HEADER = struct.Struct('<8sII')
+# magic, reserved, rows, min key, max key, segment size (with header)
+_SEGMENT_HEADER = struct.Struct('<4sIQqqQ')
+
+_NAT = numpy.iinfo(numpy.int64).min
+
+
+def _pad(size):
+    return (8 - size % 8) % 8
+
+
+def _strings(values):
+    """Encodes `values` (strings) as a string table: count, offsets, UTF-8
+    data (8-byte aligned)."""
+    data = [value.encode('utf-8') for value in values]
+    offsets = numpy.zeros(len(data) + 1, dtype=numpy.uint64)
+    numpy.cumsum([len(d) for d in data], out=offsets[1:])
+    blob = b''.join(data)
+    return (struct.pack('<Q', len(data)) + offsets.tobytes() + blob +
+            b'\0' * _pad(len(blob)))
+
+
+class Segment(object):
+    """A single (memory-mapped) segment of a snapshot: `rows` rows, with key
+    column values within ``[key_min, key_max]``."""
+
+    def __init__(self, buffer, offset, schema):
+        header = _SEGMENT_HEADER.unpack_from(buffer, offset)
+        self.rows, self.key_min, self.key_max, self.size = header[2:]
+        self.offset = offset
+        self._columns = {}
+        self._buffer = buffer
+        self._schema = schema
+        self._layout = {}
+        pos = offset + _SEGMENT_HEADER.size
+        for name, typ, getter in schema:
+            self._layout[name] = pos
+            if typ == CATEGORY:
+                pos += self.rows * 4 + _pad(self.rows * 4)
+                count = struct.unpack_from('<Q', buffer, pos)[0]
+                offsets = numpy.frombuffer(buffer, numpy.uint64, count + 1, pos + 8)
+                pos += 8 + (count + 1) * 8 + int(offsets[-1]) + _pad(int(offsets[-1]))
+            else:
+                pos += self.rows * 8
+
+    def column(self, name):
+        """Column `name` (a read-only view of the mapped file, with category
+        strings decoded on first access)."""
+        column = self._columns.get(name)
+        if column is not None:
+            return column
+        typ = dict((n, t) for n, t, g in self._schema)[name]
+        pos = self._layout[name]
+        if typ == INT:
+            column = numpy.frombuffer(self._buffer, numpy.int64, self.rows, pos)
+        elif typ == TIME:
+            column = numpy.frombuffer(self._buffer, numpy.int64, self.rows, pos).view('datetime64[us]')
+        else:
+            codes = numpy.frombuffer(self._buffer, numpy.int32, self.rows, pos)
+            pos += self.rows * 4 + _pad(self.rows * 4)
+            count = struct.unpack_from('<Q', self._buffer, pos)[0]
+            offsets = numpy.frombuffer(self._buffer, numpy.uint64, count + 1, pos + 8).astype(numpy.int64)
+            start = pos + 8 + (count + 1) * 8
+            blob = bytes(self._buffer[start:start + offsets[-1]])
+            categories = numpy.empty(count, dtype=object)
+            for i in range(count):
+                categories[i] = blob[offsets[i]:offsets[i + 1]].decode('utf-8')
+            column = Categorical(codes, categories)
+        self._columns[name] = column
+        return column
+
+
+class Snapshot(object):
+    """
+    Snapshot file at `path` (created if it doesn't exist), with columns
+    described by `schema` (see `vingd.columnar.to_table`), keyed (sorted and
+    incrementally updated) on `key` column, which has to be of a
+    ``time`` (or ``int``) type. Rows are deduplicated on `id` (``int``)
+    column, if there's one in `schema`.
+    """
+
+    def __init__(self, path, schema=HISTORY_SCHEMA, key='ts_created', id='id'):
+        self.path = path
+        self.schema = list(schema)
+        self.key = key
+        self.id = id if id in [name for name, typ, getter in self.schema] else None
+        self.segments = []
+        self._map = None
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            self._create()
+        self._open()
+
+    def _create(self):
+        schema = json.dumps([[name, typ] for name, typ, getter in self.schema]).encode('utf-8')
+        with open(self.path, 'wb') as fp:
+            fp.write(_FILE_HEADER.pack(MAGIC, VERSION, len(schema)))
+            fp.write(schema + b'\0' * _pad(_FILE_HEADER.size + len(schema)))
+
+    def _open(self):
+        self.close()
+        size = os.path.getsize(self.path)
+        self._map = numpy.memmap(self.path, mode='r')
+        buffer = self._map
+        magic, version, length = _FILE_HEADER.unpack_from(buffer, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("Not a (supported) Vingd snapshot: '%s'." % self.path)
+        stored = json.loads(bytes(buffer[_FILE_HEADER.size:_FILE_HEADER.size + length]).decode('utf-8'))
+        if [tuple(c) for c in stored] != [(n, t) for n, t, g in self.schema]:
+            raise ValueError("Snapshot '%s' schema differs." % self.path)
+        offset = _FILE_HEADER.size + length + _pad(_FILE_HEADER.size + length)
+        segments = []
+        while offset + _SEGMENT_HEADER.size <= size:
+            header = _SEGMENT_HEADER.unpack_from(buffer, offset)
+            if header[0] != SEGMENT_MAGIC or offset + header[5] > size:
+                # incomplete (interrupted) append
+                break
+            segments.append(Segment(buffer, offset, self.schema))
+            offset += header[5]
+        self.segments = segments
+        self._end = offset
+
+    def close(self):
+        # the mapping is released once no (returned) column refers to it
+        self.segments = []
+        self._map = None
+
+    def __len__(self):
+        return sum(segment.rows for segment in self.segments)
+
+    def high_water_mark(self):
+        """Largest key stored (``int64``; microseconds since epoch, for
+        timestamps), or `None` if snapshot is empty."""
+        marks = [s.key_max for s in self.segments if s.rows]
+        return max(marks) if marks else None
+
+    def _key_type(self):
+        return dict((n, t) for n, t, g in self.schema)[self.key]
+
+    def _stored_ids(self, after):
+        """`id` column values of stored rows with keys at or above `after`."""
+        ids = []
+        for segment in self.segments:
+            if segment.key_max < after:
+                continue
+            keys = segment.column(self.key)
+            keys = keys.view(numpy.int64) if keys.dtype.kind == 'M' else keys
+            start = numpy.searchsorted(keys, after, 'left')
+            ids.append(segment.column(self.id)[start:])
+        return numpy.concatenate(ids) if ids else numpy.empty(0, numpy.int64)
+
+    def append(self, rows):
+        """Appends `rows` (dictionaries, converted according to `schema`)
+        with keys at or above `high_water_mark` (above it, without an `id`
+        column), and not already stored, as a new segment. Returns the number
+        of rows appended."""
+        table = to_table(rows, self.schema)
+        keys = table[self.key]
+        keys = keys.view(numpy.int64) if keys.dtype.kind == 'M' else keys
+        mark = self.high_water_mark()
+        newer = keys != (_NAT if self._key_type() == TIME else MISSING)
+        if mark is not None and self.id is None:
+            newer &= keys > mark
+        elif mark is not None:
+            # rows stored last might share their key with new ones (e.g.
+            # entries created within the same second, split between pages)
+            newer &= keys >= mark
+            newer &= ~numpy.isin(table[self.id], self._stored_ids(mark))
+        order = numpy.argsort(keys[newer], kind='stable')
+        table = table[numpy.nonzero(newer)[0][order]]
+        if not len(table):
+            return 0
+        keys = keys[newer][order]
+
+        blocks = []
+        for name, typ, getter in self.schema:
+            column = table[name]
+            if typ == CATEGORY:
+                codes = column.codes.astype('<i4').tobytes()
+                blocks.append(codes + b'\0' * _pad(len(codes)))
+                blocks.append(_strings(column.categories))
+            else:
+                blocks.append(column.view(numpy.int64).astype('<i8').tobytes())
+        body = b''.join(blocks)
+        header = _SEGMENT_HEADER.pack(
+            SEGMENT_MAGIC, 0, len(table), int(keys[0]), int(keys[-1]),
+            _SEGMENT_HEADER.size + len(body))
+
+        self.close()
+        with open(self.path, 'r+b') as fp:
+            # drop any incomplete segment left by an interrupted append
+            fp.truncate(self._end)
+            fp.seek(self._end)
+            fp.write(header + body)
+            fp.flush()
+            os.fsync(fp.fileno())
+        self._open()
+        return len(table)
+
+    def sync(self, vingd, page_size=1000):
+        """Appends voucher history entries (`Vingd.get_vouchers_history`)
+        newer than the `high_water_mark` (for the default, history `schema`;
+        see `vingd.history.sync_log`). Returns the number of entries
+        appended."""
+        mark = self.high_water_mark()
+        if mark is not None:
+            mark = datetime(1970, 1, 1, tzinfo=tzutc()) + timedelta(microseconds=mark)
+        return sync_log(vingd, self.append, mark, page_size, self.key)
+
+    def _bounds(self, segment, after, before):
+        """Row range of `segment` with keys in ``(after, before)``."""
+        if after is None and before is None:
+            return 0, segment.rows
+        keys = segment.column(self.key)
+        keys = keys.view(numpy.int64) if keys.dtype.kind == 'M' else keys
+        start = 0 if after is None else numpy.searchsorted(keys, after, 'right')
+        stop = segment.rows if before is None else numpy.searchsorted(keys, before, 'left')
+        return start, stop
+
+    def _key(self, value):
+        if value is None or self._key_type() != TIME:
+            return value
+        if not hasattr(value, 'year'):
+            value = parse_isotime(value)
+        return int(round(timestamp(value) * 1e6))
+
+    def table(self, columns=None, after=None, before=None):
+        """
+        Reads rows with key in ``(after, before)`` (`datetime` or ISO8601
+        timestamps, for a time key) into a `vingd.columnar.Table` of
+        `columns` (all, if `None`). Segments outside of the key range are
+        skipped, and only the needed parts of the others are read.
+        """
+        names = columns or [name for name, typ, getter in self.schema]
+        types = dict((n, t) for n, t, g in self.schema)
+        after, before = self._key(after), self._key(before)
+        parts = []
+        for segment in self.segments:
+            if after is not None and segment.key_max <= after:
+                continue
+            if before is not None and segment.key_min >= before:
+                continue
+            start, stop = self._bounds(segment, after, before)
+            if stop > start:
+                parts.append((segment, start, stop))
+
+        result = {}
+        for name in names:
+            if types[name] != CATEGORY:
+                dtype = 'datetime64[us]' if types[name] == TIME else numpy.int64
+                chunks = [s.column(name)[a:b] for s, a, b in parts]
+                result[name] = numpy.concatenate(chunks) if chunks else numpy.empty(0, dtype)
+                continue
+            # merge segment-local categories
+            index, categories, chunks = {}, [], []
+            for segment, start, stop in parts:
+                column = segment.column(name)
+                remap = numpy.empty(len(column.categories) + 1, dtype=numpy.int32)
+                remap[-1] = -1
+                for code, value in enumerate(column.categories):
+                    if value not in index:
+                        index[value] = len(categories)
+                        categories.append(value)
+                    remap[code] = index[value]
+                chunks.append(remap[column.codes[start:stop]])
+            codes = numpy.concatenate(chunks) if chunks else numpy.empty(0, numpy.int32)
+            values = numpy.empty(len(categories), dtype=object)
+            values[:] = categories
+            result[name] = Categorical(codes, values)
+        return Table(result)
@@ -0,0 +1,62 @@
+"""
+Shared TLS configuration and session resumption for Vingd client connections.
+"""
+import ssl
+import threading
+
+
+class TLSContext(object):
+    """
+    Holds a single `ssl.SSLContext` (with CA certificates loaded once), to be
+    shared by all connections of a client, along with the last TLS session
+    per ``host:port``, so that reconnects can resume the session (abbreviated
+    handshake, session tickets) instead of doing a full handshake.
+
+    Handshakes are counted in `stats` (``full`` vs. ``resumed``).
+    """
+
+    def __init__(self, cafile=None, alpn_protocols=None, context=None):
+        if context is None:
+            context = ssl.create_default_context(cafile=cafile)
+        if alpn_protocols:
+            context.set_alpn_protocols(alpn_protocols)
+        self.context = context
+        self.stats = {'full': 0, 'resumed': 0}
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def wrap(self, sock, host, port):
+        """Wraps connected `sock`, resuming the last session with
+        ``host:port``, if available. Returns `ssl.SSLSocket`."""
+        session = self._sessions.get((host, port))
+        if session is not None:
+            try:
+                sock = self.context.wrap_socket(sock, server_hostname=host, session=session)
+            except TypeError:
+                # no session resumption support (python < 3.6)
+                sock = self.context.wrap_socket(sock, server_hostname=host)
+        else:
+            sock = self.context.wrap_socket(sock, server_hostname=host)
+        with self._lock:
+            if getattr(sock, 'session_reused', False):
+                self.stats['resumed'] += 1
+            else:
+                self.stats['full'] += 1
+        self.save(sock, host, port)
+        return sock
+
+    def save(self, sock, host, port):
+        """Stores session of `sock` for resumption. With TLS 1.3, session
+        tickets are received after the handshake, so this should be called
+        again once some data has been read."""
+        session = getattr(sock, 'session', None)
+        if session is not None:
+            self._sessions[(host, port)] = session
+
+    def forget(self, host=None, port=None):
+        """Drops stored session(s)."""
+        with self._lock:
+            if host is None:
+                self._sessions.clear()
+            else:
+                self._sessions.pop((host, port), None)
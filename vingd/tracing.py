@@ -0,0 +1,219 @@
+"""
+Tracing of `Vingd` API calls, with W3C Trace Context propagation.
+
+With a `Tracer` set on a client (``vingd.tracer = Tracer(exporter)``), each
+API method call is recorded as a span, with a child span for each HTTP
+attempt: failovers to other endpoints and hedged requests (under a ``hedge``
+span) are separate attempts, and pool wait time (``pool.wait``, in seconds)
+and connection reuse (``pool.connection``) are recorded as attempt
+attributes. Every request carries a ``traceparent`` header identifying its
+attempt span, so backend logs can be correlated with client traces.
+
+Finished spans are passed to the exporter: any object with an
+``export(span)`` method (e.g. `MemoryExporter`, for tests).
+
+API calls made within a span of your own (e.g. of an incoming request to your
+service) join its trace::
+
+    tracer = Tracer(exporter)
+    with tracer.activate(tracer.extract(request.headers.get('traceparent'))):
+        vingd.verify_purchase(oid, tid)
+
+With `Vingd.tracer` unset (the default), tracing costs an attribute lookup
+per call and attempt.
+"""
+import random
+import threading
+import time
+from functools import wraps
+
+
+_local = threading.local()
+_random = random.SystemRandom()
+
+
+def current_span():
+    """Span active in this thread (or `None`)."""
+    return getattr(_local, 'span', None)
+
+
+def annotate(**attributes):
+    """Sets `attributes` on the span active in this thread, if any."""
+    span = getattr(_local, 'span', None)
+    if span is not None:
+        span.attributes.update(attributes)
+
+
+class Span(object):
+    """
+    A timed operation: `name`, `start` and `end` (POSIX timestamps),
+    `attributes` (``dict``) and `error` (exception raised, if any). Spans of
+    a trace share `trace_id` (32 hex digits), and refer to their parent by
+    `parent_id` (16 hex digits).
+    """
+
+    __slots__ = ('name', 'trace_id', 'span_id', 'parent_id', 'start', 'end',
+                 'attributes', 'error', '_tracer', '_previous')
+
+    def __init__(self, name, trace_id, span_id, parent_id=None, attributes=None, tracer=None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = span_id
+        self.parent_id = parent_id
+        self.attributes = attributes or {}
+        self.error = None
+        self.start = time.time()
+        self.end = None
+        self._tracer = tracer
+        self._previous = None
+
+    def __repr__(self):
+        return "<Span %s %s/%s>" % (self.name, self.trace_id, self.span_id)
+
+    @property
+    def duration(self):
+        return None if self.end is None else self.end - self.start
+
+    @property
+    def traceparent(self):
+        """W3C ``traceparent`` header value (sampled)."""
+        return '00-%s-%s-01' % (self.trace_id, self.span_id)
+
+    def finish(self, error=None):
+        """Ends the span, restores the previously active span, and exports
+        the span."""
+        self.end = time.time()
+        if error is not None:
+            self.error = error
+        _local.span = self._previous
+        if self._tracer is not None:
+            self._tracer.exporter.export(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.finish(value)
+
+
+class MemoryExporter(object):
+    """Keeps finished spans in `spans` (a list, in order of finishing)."""
+
+    def __init__(self):
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        # finished spans are not transferred
+        return {}
+
+    def __setstate__(self, state):
+        self.__init__()
+
+    def export(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+    def clear(self):
+        with self._lock:
+            self.spans = []
+
+    def find(self, name):
+        """Finished spans named `name`."""
+        return [span for span in self.spans if span.name == name]
+
+
+class Tracer(object):
+    """Creates spans, and exports them (when finished) with `exporter`
+    (`MemoryExporter`, if not given)."""
+
+    def __init__(self, exporter=None):
+        self.exporter = exporter if exporter is not None else MemoryExporter()
+
+    def start_span(self, name, attributes=None, parent=None):
+        """Starts span `name`, a child of `parent` (the active span, if
+        `None`), and makes it active (in this thread) until finished."""
+        previous = getattr(_local, 'span', None)
+        if parent is None:
+            parent = previous
+        if parent is None:
+            trace_id, parent_id = '%032x' % _random.getrandbits(128), None
+        else:
+            trace_id, parent_id = parent.trace_id, parent.span_id
+        span = Span(name, trace_id, '%016x' % _random.getrandbits(64),
+                    parent_id, attributes, self)
+        span._previous = previous
+        _local.span = span
+        return span
+
+    @staticmethod
+    def extract(traceparent):
+        """Remote parent span from a ``traceparent`` header value (`None` if
+        missing or invalid), to be `activate`-d."""
+        try:
+            version, trace_id, span_id, flags = traceparent.strip().split('-')[:4]
+            int(trace_id, 16), int(span_id, 16)
+        except (AttributeError, ValueError):
+            return None
+        if len(trace_id) != 32 or len(span_id) != 16 or version == 'ff':
+            return None
+        return Span('remote', trace_id.lower(), span_id.lower())
+
+    @staticmethod
+    def activate(span):
+        """Makes `span` (e.g. a remote parent, see `extract`) active in this
+        thread for the duration of the ``with`` block."""
+        return _Activation(span)
+
+    def wrap(self, func, name=None):
+        """Binds `func` to the span active now, so it can run in another
+        thread (within a new child span `name`, if given)."""
+        parent = getattr(_local, 'span', None)
+
+        def run(*args, **kwargs):
+            with self.activate(parent):
+                if name is None:
+                    return func(*args, **kwargs)
+                with self.start_span(name, parent=parent):
+                    return func(*args, **kwargs)
+        return run
+
+
+class _Activation(object):
+
+    def __init__(self, span):
+        self.span = span
+
+    def __enter__(self):
+        self.previous = getattr(_local, 'span', None)
+        if self.span is not None:
+            _local.span = self.span
+        return self.span
+
+    def __exit__(self, type, value, traceback):
+        _local.span = self.previous
+
+
+def traced(method):
+    """Decorator recording a `Vingd` API method call as a span, with the
+    client's `tracer` (calls nested in a traced call are recorded as a part
+    of it)."""
+    name = 'vingd.' + method.__name__
+
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        tracer = self.tracer
+        if tracer is None:
+            return method(self, *args, **kwargs)
+        parent = getattr(_local, 'span', None)
+        if parent is not None and 'vingd.method' in parent.attributes:
+            return method(self, *args, **kwargs)
+        span = tracer.start_span(name, {'vingd.method': method.__name__})
+        try:
+            result = method(self, *args, **kwargs)
+        except Exception as e:
+            span.finish(e)
+            raise
+        span.finish()
+        return result
+    return wrapper
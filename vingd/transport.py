@@ -0,0 +1,223 @@
+"""
+Pluggable HTTP transports for the `Vingd` client.
+
+A transport sends a single request to an endpoint and returns the response::
+
+    response = transport.send(endpoint, verb, path, headers, body)
+
+where `endpoint` is a `vingd.endpoints.Endpoint` (``host``, ``port``), and
+`response` offers (a subset of) `httplib.HTTPResponse` interface: `status`,
+``getheader(name, default=None)``, ``read(size=None)`` and ``close()``.
+Network failures are raised as `httplib.HTTPException` or `socket.error` (a
+`vingd.pool.ConnectError` if the request certainly wasn't sent), so that the
+client can fail over to another endpoint.
+
+Transports included:
+
+ * `PooledTransport`: the default, over the client's connection pools
+   (HTTP/1.1 keep-alive, or HTTP/2),
+ * `MemoryTransport`: in-memory, canned (or handler-computed) responses, for
+   tests,
+ * `RecordingTransport`: records all exchanges of another transport into a
+   (JSONL) file,
+ * `ReplayTransport`: replays a recorded session, without network access.
+
+Example (offline benchmark of the full client stack)::
+
+    from vingd import Vingd
+    from vingd.transport import PooledTransport, RecordingTransport, ReplayTransport
+
+    v = Vingd(username="...", password="...")
+    v.transport = RecordingTransport(PooledTransport(v), 'session.jsonl')
+    v.get_objects()
+    v.transport.close()
+
+    offline = Vingd(username="...", password="...",
+                    transport=ReplayTransport('session.jsonl', loop=True))
+    offline.get_objects()       # replayed
+"""
+try:
+    import simplejson as json
+except ImportError:
+    import json
+
+import base64
+import threading
+from collections import defaultdict, deque
+from io import BytesIO
+
+
+class Transport(object):
+    """Transport interface."""
+
+    def send(self, endpoint, verb, path, headers, body):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class MemoryResponse(object):
+    """Response with `body` (``bytes``) held in memory."""
+
+    def __init__(self, status, body=b'', headers=None):
+        if not isinstance(body, bytes):
+            body = body.encode('utf-8')
+        self.status = status
+        self.headers = dict((k.lower(), v) for k, v in (headers or {}).items())
+        self._body = BytesIO(body)
+
+    def getheader(self, name, default=None):
+        return self.headers.get(name.lower(), default)
+
+    def read(self, size=None):
+        return self._body.read() if size is None else self._body.read(size)
+
+    def close(self):
+        pass
+
+
+class PooledTransport(Transport):
+    """Sends requests over `client`'s connection pools (see
+    `Vingd.connection_pool`)."""
+
+    def __init__(self, client):
+        self.client = client
+
+    def send(self, endpoint, verb, path, headers, body):
+        pool = self.client.connection_pool(endpoint.host, endpoint.port)
+        return pool.request(verb, path, body, headers)
+
+
+class MemoryTransport(Transport):
+    """
+    Serves responses from memory: canned ones (see `add`), or computed by
+    ``handler(verb, path, headers, body)``, which returns ``(status,
+    body[, headers])``. Unmatched requests get a ``404 Not Found`` (Vingd
+    error response). All requests are kept in `requests` (as ``(verb, path,
+    headers, body)``).
+    """
+
+    def __init__(self, handler=None):
+        self.handler = handler
+        self.requests = []
+        self._routes = {}
+        self._lock = threading.Lock()
+
+    def add(self, verb, path, data=None, status=200, body=None, headers=None):
+        """Responds to `verb` on `path` with `body` (or, if not given, with a
+        Vingd response wrapping `data`)."""
+        if body is None:
+            body = json.dumps({'data': data})
+        self._routes[(verb.upper(), path)] = (status, body, headers)
+
+    def send(self, endpoint, verb, path, headers, body):
+        with self._lock:
+            self.requests.append((verb, path, headers, body))
+        route = self._routes.get((verb.upper(), path))
+        if route is None and self.handler is not None:
+            route = self.handler(verb, path, headers, body)
+        if route is None:
+            route = (404, json.dumps({
+                'message': "No response for %s %s." % (verb, path),
+                'context': "Not found"
+            }), None)
+        return MemoryResponse(*route)
+
+
+def _encode(data):
+    if data is None:
+        return None
+    if not isinstance(data, bytes):
+        data = data.encode('utf-8')
+    return base64.b64encode(data).decode('ascii')
+
+
+def _decode(data):
+    return b'' if data is None else base64.b64decode(data.encode('ascii'))
+
+
+class RecordingTransport(Transport):
+    """
+    Sends requests with `transport`, recording each exchange as a JSON line
+    appended to file `path`: request verb, path and body, response status,
+    headers and (still content-encoded) body. Request headers are not
+    recorded (they hold credentials).
+    """
+
+    RECORDED_HEADERS = ('Content-Encoding', 'Content-Type', 'ETag', 'Last-Modified')
+
+    def __init__(self, transport, path):
+        self.transport = transport
+        self.path = path
+        self._file = open(path, 'a')
+        self._lock = threading.Lock()
+
+    def send(self, endpoint, verb, path, headers, body):
+        response = self.transport.send(endpoint, verb, path, headers, body)
+        try:
+            content = response.read()
+        finally:
+            response.close()
+        recorded_headers = {}
+        for name in self.RECORDED_HEADERS:
+            value = response.getheader(name)
+            if value is not None:
+                recorded_headers[name] = value
+        exchange = {
+            'verb': verb,
+            'path': path,
+            'body': _encode(body or None),
+            'status': response.status,
+            'headers': recorded_headers,
+            'response': _encode(content)
+        }
+        with self._lock:
+            self._file.write(json.dumps(exchange) + '\n')
+            self._file.flush()
+        return MemoryResponse(response.status, content, recorded_headers)
+
+    def close(self):
+        self._file.close()
+        self.transport.close()
+
+
+class ReplayMiss(LookupError):
+    """No recorded response for the request."""
+
+
+class ReplayTransport(Transport):
+    """
+    Replays responses recorded (by `RecordingTransport`) in file `path`.
+
+    Requests are matched on verb and path (bodies are not compared, since
+    they may hold timestamps), and responses to the same request are replayed
+    in the recorded order. Once they run out, `ReplayMiss` is raised, unless
+    `loop` is set, in which case they're replayed again from the start.
+    """
+
+    def __init__(self, path, loop=False):
+        self.path = path
+        self.loop = loop
+        self._recorded = defaultdict(list)
+        with open(path) as fp:
+            for line in fp:
+                if not line.strip():
+                    continue
+                exchange = json.loads(line)
+                self._recorded[(exchange['verb'].upper(), exchange['path'])].append(
+                    (exchange['status'], _decode(exchange['response']), exchange['headers']))
+        self._pending = dict((key, deque(responses))
+                             for key, responses in self._recorded.items())
+        self._lock = threading.Lock()
+
+    def send(self, endpoint, verb, path, headers, body):
+        key = (verb.upper(), path)
+        with self._lock:
+            pending = self._pending.get(key)
+            if not pending and self.loop and key in self._recorded:
+                pending = self._pending[key] = deque(self._recorded[key])
+            if not pending:
+                raise ReplayMiss("No recorded response for %s %s." % key)
+            status, content, recorded_headers = pending.popleft()
+        return MemoryResponse(status, content, recorded_headers)
@@ -1,8 +1,15 @@
 import re
+import zlib
+import threading
 from hashlib import sha1
 from datetime import datetime, timedelta, tzinfo
 from itertools import count
 
+try:
+    from queue import Queue
+except ImportError:
+    from Queue import Queue
+
 try:
     from urllib.parse import quote as base_quote
     def quote(url, safe='/=:%{}'):
@@ -21,19 +28,126 @@ def hash(msg):
     return sha1(msg.encode('utf-8')).hexdigest() if msg else None
 
 
+def compress(data, level=6):
+    """Gzip-compresses `data` (``str`` is UTF-8 encoded first). Returns
+    ``bytes``, suitable for a ``Content-Encoding: gzip`` request body."""
+    if not isinstance(data, bytes):
+        data = data.encode('utf-8')
+    gz = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return gz.compress(data) + gz.flush()
+
+
+def iterread(stream, size=16384):
+    """Yields chunks of (at most) `size` bytes read from a file-like `stream`
+    (e.g. `httplib.HTTPResponse`), until exhausted."""
+    while True:
+        chunk = stream.read(size)
+        if not chunk:
+            break
+        yield chunk
+
+
+def decompress(chunks, encoding=None):
+    """Incrementally decodes an iterable of ``bytes`` `chunks`, content-encoded
+    with `encoding` (``gzip``, ``deflate`` or identity, if `None`/empty).
+    
+    Decoded chunks are yielded as soon as they're available, so decompression
+    doesn't need the whole (compressed) body in memory. (`Vingd.request`
+    still joins the decoded chunks, and parses the JSON body once it's
+    complete.)
+    
+    Note: ``deflate`` is accepted both zlib-wrapped (as per RFC 2616) and raw
+    (as sent by some misbehaving servers).
+    """
+    encoding = (encoding or '').strip().lower()
+    if encoding in ('', 'identity'):
+        for chunk in chunks:
+            yield chunk
+        return
+    if encoding in ('gzip', 'x-gzip'):
+        wbits = 16 + zlib.MAX_WBITS
+    elif encoding == 'deflate':
+        wbits = zlib.MAX_WBITS
+    else:
+        raise ValueError("Unsupported content encoding: '%s'." % encoding)
+    
+    decoder = zlib.decompressobj(wbits)
+    first = True
+    for chunk in chunks:
+        if first and wbits == zlib.MAX_WBITS:
+            try:
+                out = decoder.decompress(chunk)
+            except zlib.error:
+                # raw deflate stream (no zlib header)
+                decoder = zlib.decompressobj(-zlib.MAX_WBITS)
+                out = decoder.decompress(chunk)
+        else:
+            out = decoder.decompress(chunk)
+        first = False
+        if out:
+            yield out
+    out = decoder.flush()
+    if out:
+        yield out
+
+
+_ZERO = timedelta(0)
+
+
 class tzutc(tzinfo):
-    '''UTC time zone info.'''
+    '''UTC time zone info. A singleton: ``tzutc()`` always returns the same
+    (immutable) instance, `UTC`.'''
+    
+    _instance = None
+    
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = tzinfo.__new__(cls)
+        return cls._instance
     
     def utcoffset(self, dt):
-        return timedelta(0)
+        return _ZERO
     
     def dst(self, dt):
-        return timedelta(0)
+        return _ZERO
     
     def tzname(self, dt):
         return "UTC"
 
 
+class tzoffset(tzinfo):
+    '''Fixed offset (in minutes east from UTC) time zone info.'''
+    
+    def __init__(self, minutes):
+        self.minutes = minutes
+        self._offset = timedelta(minutes=minutes)
+    
+    def __getinitargs__(self):
+        return (self.minutes,)
+    
+    def utcoffset(self, dt):
+        return self._offset
+    
+    def dst(self, dt):
+        return _ZERO
+    
+    def tzname(self, dt):
+        sign = '-' if self.minutes < 0 else '+'
+        return "%s%02d:%02d" % ((sign,) + divmod(abs(self.minutes), 60))
+
+
+UTC = tzutc()
+
+# minutes -> `tzoffset` (shared by all timestamps parsed with that offset)
+_offsets = {}
+
+def _tzoffset(minutes):
+    tz = _offsets.get(minutes)
+    if tz is None:
+        tz = _offsets.setdefault(minutes, tzoffset(minutes))
+    return tz
+
+
 def localnow():
     """Local time without time zone (local time @ local time zone)."""
     return datetime.now()
@@ -44,7 +158,7 @@ def utcnow():
 
 def now():
     """Current UTC/GMT time with time zone."""
-    return datetime.now(tzutc())
+    return datetime.now(UTC)
 
 def absdatetime(ts, default=None):
     """Accepts relative timestamp (`timedelta` or `timedelta`-supported ``dict``
@@ -61,6 +175,62 @@ def absdatetime(ts, default=None):
     return None
 
 
+_ISOTIME = re.compile(
+    r"^(\d{4})-?(\d{2})-?(\d{2})[T ](\d{2}):?(\d{2}):?(\d{2})(?:\.(\d{1,6})\d*)?"
+    r"(Z|[-+]\d{2}(?::?\d{2})?)?$"
+).match
+
+def parse_isotime(string):
+    """Parses ISO8601 timestamp, in basic (``YYYYMMDDThhmmss``) or extended
+    (``YYYY-MM-DDThh:mm:ss``) format, with optional fractional seconds and time
+    zone (``Z`` or ``+hh:mm``/``+hhmm``). Returns a time zone aware `datetime`
+    (UTC is assumed if time zone is not given), or raises `ValueError`."""
+    match = _ISOTIME(string.strip())
+    if not match:
+        raise ValueError("Invalid ISO8601 timestamp: '%s'." % string)
+    parts = match.groups()
+    fields = [int(x) for x in parts[:6]]
+    micro = int((parts[6] or '0').ljust(6, '0'))
+    zone = parts[7]
+    if not zone or zone == 'Z':
+        tz = UTC
+    else:
+        minutes = int(zone[1:3]) * 60 + int(zone[3:].lstrip(':') or 0)
+        tz = _tzoffset(-minutes if zone[0] == '-' else minutes)
+    return datetime(*fields, microsecond=micro, tzinfo=tz)
+
+
+def timestamp(dt):
+    """Converts `datetime` `dt` to POSIX timestamp (``float`` seconds since
+    epoch). Naive `dt` is taken to be in UTC."""
+    if dt.tzinfo is not None:
+        dt = dt.replace(tzinfo=None) - dt.utcoffset()
+    return (dt - datetime(1970, 1, 1)).total_seconds()
+
+
+_DURATION_FORMS = [re.compile(pattern).match for pattern in (
+    # `PnYnMnDTnHnMnS` form
+    r"^P(?:(?:(?P<years>\d+)Y)?(?:(?P<months>\d+)M)?(?:(?P<days>\d+)D)?)?"
+    r"(?:T(?:(?P<hours>\d+)H)?(?:(?P<minutes>\d+)M)?(?:(?P<seconds>\d+)S)?)?$",
+    # `PnW` form
+    r"^P(?P<weeks>\d+)W$",
+    # `P<date>T<time>` form, subforms `PYYYYMMDDThhmmss` and `PYYYY-MM-DDThh:mm:ss`
+    r"^P(?P<years>\d{4})(-)?(?P<months>\d{2})(?(2)-)(?P<days>\d{2})T(?P<hours>\d{2})(?(2):)(?P<minutes>\d{2})(?(2):)(?P<seconds>\d{2})$"
+)]
+
+# duration string -> parsed components (bounded memo of `parse_duration`)
+_durations = {}
+_DURATIONS_MAX = 4096
+
+def _parse_duration(string):
+    string = string.replace(' ', '').upper()
+    for form in _DURATION_FORMS:
+        match = form(string)
+        if match:
+            return dict((k, int(v)) for k, v in match.groupdict(0).items())
+    return {}
+
+
 def parse_duration(string):
     '''
     Parses duration/period stamp expressed in a subset of ISO8601 duration
@@ -106,39 +276,77 @@ def parse_duration(string):
     Returns: dictionary with (some of the) fields: ``years``, ``months``,
     ``weeks``, ``days``, ``hours``, ``minutes`` or ``seconds``. If nothing is
     matched, an empty dict is returned.
+    
+    Results are memoized (a fresh copy of the dictionary is returned on each
+    call).
     '''
 
-    string = string.replace(' ', '').upper()
-    
-    # try `PnYnMnDTnHnMnS` form
-    match = re.match(
-        "^P(?:(?:(?P<years>\d+)Y)?(?:(?P<months>\d+)M)?(?:(?P<days>\d+)D)?)?" \
-        "(?:T(?:(?P<hours>\d+)H)?(?:(?P<minutes>\d+)M)?(?:(?P<seconds>\d+)S)?)?$",
-        string
-    )
-    if match:
-        d = match.groupdict(0)
-        return dict(zip(d.keys(), map(int, d.values())))
-    
-    # try `PnW` form
-    match = re.match(
-        "^P(?P<weeks>\d+)W$",
-        string
-    )
-    if match:
-        d = match.groupdict(0)
-        return dict(zip(d.keys(), map(int, d.values())))
-    
-    # try `P<date>T<time>` form, subforms `PYYYYMMDDThhmmss` and `PYYYY-MM-DDThh:mm:ss`
-    match = re.match(
-        "^P(?P<years>\d{4})(-)?(?P<months>\d{2})(?(2)-)(?P<days>\d{2})T(?P<hours>\d{2})(?(2):)(?P<minutes>\d{2})(?(2):)(?P<seconds>\d{2})$",
-        string
-    )
-    if match:
-        d = match.groupdict(0)
-        return dict(zip(d.keys(), map(int, d.values())))
-    
-    return {}
+    result = _durations.get(string)
+    if result is None:
+        result = _parse_duration(string)
+        if len(_durations) >= _DURATIONS_MAX:
+            _durations.clear()
+        _durations[string] = result
+    return dict(result)
+
+
+def parse_durations(strings):
+    """Parses each of `strings` with `parse_duration`. Returns a list of
+    dictionaries."""
+    get = _durations.get
+    return [dict(get(string) or parse_duration(string)) for string in strings]
+
+
+def format_isobasic(dt):
+    """Formats `datetime` `dt` as a basic format ISO8601 timestamp
+    (``YYYYMMDDThhmmss[+hhmm]``), same as ``dt.strftime("%Y%m%dT%H%M%S%z")``,
+    only faster."""
+    tz = dt.tzinfo
+    if tz is None:
+        zone = ''
+    elif tz is UTC:
+        zone = '+0000'
+    else:
+        offset = dt.utcoffset()
+        zone = '' if offset is None else _format_offset(offset)
+    if zone is None or dt.year < 1000:
+        return dt.strftime("%Y%m%dT%H%M%S%z")
+    return '%04d%02d%02dT%02d%02d%02d%s' % (
+        dt.year, dt.month, dt.day, dt.hour, dt.minute, dt.second, zone)
+
+
+def format_isobasic_many(dts):
+    """Formats each of `dts` (`datetime` objects) with `format_isobasic`.
+    Returns a list of strings."""
+    # fixed offset zones: tzinfo -> formatted offset
+    zones = {None: ''}
+    out = []
+    append = out.append
+    for dt in dts:
+        tz = dt.tzinfo
+        zone = zones.get(tz)
+        if zone is None:
+            if isinstance(tz, (tzutc, tzoffset)):
+                zone = zones[tz] = _format_offset(tz.utcoffset(dt))
+            elif dt.utcoffset() is None:
+                zone = ''
+            else:
+                zone = _format_offset(dt.utcoffset())
+        if zone is None or dt.year < 1000:
+            append(dt.strftime("%Y%m%dT%H%M%S%z"))
+        else:
+            append('%04d%02d%02dT%02d%02d%02d%s' % (
+                dt.year, dt.month, dt.day, dt.hour, dt.minute, dt.second, zone))
+    return out
+
+
+def _format_offset(offset):
+    """``+hhmm`` for `timedelta` `offset` (`None` if it has seconds)."""
+    seconds = offset.days * 86400 + offset.seconds
+    if seconds % 60 or offset.microseconds:
+        return None
+    sign = '-' if seconds < 0 else '+'
+    return '%s%02d%02d' % ((sign,) + divmod(abs(seconds) // 60, 60))
 
 
 class ConversionError(TypeError):
@@ -171,37 +379,6 @@ def safeformat(format_string, *args):
     `hex`, `str`, `ident`, `iso`, `isobasic`).
     """
     
-    def hex(x):
-        """Allow hexadecimal digits."""
-        if re.match('^[a-fA-F\d]*$', str(x)):
-            return str(x)
-        raise ValueError("Non-hex digits in hex number.")
-    
-    def identifier(x):
-        """Allow letters, digits, underscore and minus/dash."""
-        if re.match('^[-\w]*$', str(x)):
-            return str(x)
-        raise ValueError("Non-identifier characters in string.")
-    
-    def iso(x):
-        if not isinstance(x, datetime):
-            raise ValueError("Datetime expected.")
-        return x.isoformat()
-    
-    def isobasic(x):
-        if not isinstance(x, datetime):
-            raise ValueError("Datetime expected.")
-        return x.strftime("%Y%m%dT%H%M%S%z")
-    
-    converters = {
-        'int': int,
-        'hex': hex,
-        'str': str,
-        'ident': identifier,
-        'iso': iso,
-        'isobasic': isobasic
-    }
-    
     argidx = count(0)
     
     def replace(match):
@@ -221,7 +398,7 @@ def safeformat(format_string, *args):
             raise ConversionError("Index out of bounds: %d." % idx)
         
         try:
-            conv = converters[typ]
+            conv = _CONVERTERS[typ]
         except:
             raise ConversionError("Invalid converter/type: '%s'." % typ)
         
@@ -232,4 +409,101 @@ def safeformat(format_string, *args):
         
         return str(val)
     
-    return re.sub("{(?:(?P<idx>\d+))?:(?P<typ>\w+)}", replace, format_string)
+    return _FIELD(replace, format_string)
+
+
+_hex = re.compile(r'^[a-fA-F\d]*$').match
+_identifier = re.compile(r'^[-\w]*$').match
+
+def _safe_hex(x):
+    """Allow hexadecimal digits."""
+    if _hex(str(x)):
+        return str(x)
+    raise ValueError("Non-hex digits in hex number.")
+
+def _safe_identifier(x):
+    """Allow letters, digits, underscore and minus/dash."""
+    if _identifier(str(x)):
+        return str(x)
+    raise ValueError("Non-identifier characters in string.")
+
+def _safe_iso(x):
+    if not isinstance(x, datetime):
+        raise ValueError("Datetime expected.")
+    return x.isoformat()
+
+def _safe_isobasic(x):
+    if not isinstance(x, datetime):
+        raise ValueError("Datetime expected.")
+    return format_isobasic(x)
+
+_CONVERTERS = {
+    'int': int,
+    'hex': _safe_hex,
+    'str': str,
+    'ident': _safe_identifier,
+    'iso': _safe_iso,
+    'isobasic': _safe_isobasic
+}
+
+_FIELD = re.compile(r"{(?:(?P<idx>\d+))?:(?P<typ>\w+)}").sub
+
+
+def pmap(func, items, workers=8):
+    """
+    Concurrently applies `func` to each of `items` (any iterable, consumed
+    lazily), using (at most) `workers` threads.
+    
+    Yields ``(item, result, error)`` triples in order of completion, where
+    `error` is the exception raised by ``func(item)`` (and `result` is `None`)
+    if the call failed. Errors do not abort processing of other items.
+    
+    At most ``2 * workers`` items are read ahead of the slowest worker, so
+    arbitrarily long (streamed) inputs are processed in constant memory.
+    
+    If iterating `items` raises, the exception is re-raised (once the items
+    read before have been processed).
+    """
+    tasks = Queue(maxsize=workers * 2)
+    results = Queue()
+    done = object()
+    failed = object()
+    
+    def feed():
+        try:
+            for item in items:
+                tasks.put(item)
+        except Exception as e:
+            results.put((failed, e))
+        finally:
+            for _ in range(workers):
+                tasks.put(done)
+    
+    def work():
+        while True:
+            item = tasks.get()
+            if item is done:
+                results.put(done)
+                return
+            try:
+                results.put((item, func(item), None))
+            except Exception as e:
+                results.put((item, None, e))
+    
+    threads = [threading.Thread(target=feed)]
+    threads += [threading.Thread(target=work) for _ in range(workers)]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    
+    running, error = workers, None
+    while running:
+        result = results.get()
+        if result is done:
+            running -= 1
+        elif result[0] is failed:
+            error = result[1]
+        else:
+            yield result
+    if error is not None:
+        raise error
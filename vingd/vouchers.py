@@ -0,0 +1,205 @@
+"""
+Local voucher state index, for planning (and executing) voucher revocations
+without a `Vingd.get_vouchers` round-trip.
+
+Example::
+
+    from vingd import Vingd
+    from vingd.history import VoucherHistory
+    from vingd.vouchers import VoucherIndex
+
+    v = Vingd(username="...", password="...")
+    history = VoucherHistory('vouchers.db')
+    history.sync(v)
+
+    index = VoucherIndex()
+    index.load(history)
+    index.add_created(v.create_voucher(amount=100, gid='campaign1'))
+
+    plan = index.match(gid='campaign1')    # what would be revoked
+    result = index.revoke(v, plan)         # targeted, parallel revokes
+"""
+import threading
+from collections import defaultdict
+
+from .exceptions import InvalidData
+from .limiter import batch_workers
+from .scheduler import BULK, prioritized
+from .schema import string_types
+from .util import absdatetime, parse_isotime, pmap, timestamp
+
+
+class VoucherIndex(object):
+    """
+    In-memory index of vouchers and their current state (`ACTIVE`, `USED`,
+    `REVOKED` or `EXPIRED`), keyed by ``vid_encoded`` and indexed by
+    ``uid_from``, ``uid_to`` and ``gid``.
+
+    Index is fed with `create_voucher` results (`add_created`) and voucher log
+    entries (`apply`, or `load` from a `VoucherHistory` store). Log entries
+    MUST be applied in order of creation.
+
+    It is safe to share between threads.
+    """
+
+    ACTIVE = 'active'
+    USED = 'used'
+    REVOKED = 'revoked'
+    EXPIRED = 'expired'
+
+    # voucher log action -> resulting voucher state
+    ACTIONS = {
+        'add': ACTIVE,
+        'use': USED,
+        'revoke': REVOKED,
+        'expire': EXPIRED
+    }
+
+    INDEXED = ('uid_from', 'uid_to', 'gid')
+
+    def __init__(self):
+        self._vouchers = {}
+        self._index = dict((name, defaultdict(set)) for name in self.INDEXED)
+        self._seq = 0
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._vouchers)
+
+    def __contains__(self, vid_encoded):
+        return vid_encoded in self._vouchers
+
+    def get(self, vid_encoded):
+        """Returns voucher description dictionary (with voucher ``state``
+        added) for `vid_encoded`, or `None` if not indexed."""
+        entry = self._vouchers.get(vid_encoded)
+        return entry and entry['voucher']
+
+    def add(self, voucher, state=ACTIVE):
+        """Indexes (or updates) a single `voucher` description dictionary (as
+        returned by `Vingd.get_vouchers`), setting its state to `state`."""
+        vid_encoded = voucher['vid_encoded']
+        valid_until = voucher.get('ts_valid_until')
+        with self._lock:
+            old = self._vouchers.get(vid_encoded)
+            if old is not None:
+                self._unindex(vid_encoded, old['voucher'])
+                seq = old['seq']
+            else:
+                self._seq += 1
+                seq = self._seq
+            voucher = dict(voucher, state=state)
+            self._vouchers[vid_encoded] = {
+                'voucher': voucher,
+                'seq': seq,
+                'valid_until': timestamp(parse_isotime(valid_until)) if valid_until else None
+            }
+            for name in self.INDEXED:
+                self._index[name][voucher.get(name)].add(vid_encoded)
+
+    def _unindex(self, vid_encoded, voucher):
+        for name in self.INDEXED:
+            self._index[name][voucher.get(name)].discard(vid_encoded)
+
+    def add_created(self, created):
+        """Indexes a new voucher, as returned by `Vingd.create_voucher`."""
+        self.add(created['raw'])
+
+    def apply(self, entries):
+        """Updates voucher states from voucher log `entries` (as returned by
+        `Vingd.get_vouchers_history`, oldest first)."""
+        for entry in entries:
+            state = self.ACTIONS.get(entry.get('action'))
+            if state is None:
+                continue
+            with self._lock:
+                old = self._vouchers.get(entry['vid_encoded'])
+                voucher = dict(old['voucher'], **entry) if old else entry
+                voucher.pop('action', None)
+                self.add(voucher, state)
+
+    def load(self, history):
+        """Updates voucher states from all entries in `history` store
+        (`vingd.history.VoucherHistory`)."""
+        self.apply(history.query())
+
+    def match(self, vid_encoded=None, uid_from=None, uid_to=None, gid=None,
+              valid_after=None, valid_before=None, last=None, first=None,
+              state=ACTIVE):
+        """
+        Returns a list of indexed vouchers in `state` (any state, if `None`)
+        matching all the filters given. Filters have the same meaning as in
+        `Vingd.get_vouchers` (and `Vingd.revoke_vouchers`); `first` and `last`
+        refer to the order in which vouchers were indexed.
+        """
+        valid_after = absdatetime(valid_after)
+        valid_before = absdatetime(valid_before)
+        after = timestamp(valid_after) if valid_after else None
+        before = timestamp(valid_before) if valid_before else None
+
+        with self._lock:
+            if vid_encoded is not None:
+                candidates = set([vid_encoded]) & set(self._vouchers)
+            else:
+                candidates = None
+            for name, val in (('uid_from', uid_from), ('uid_to', uid_to), ('gid', gid)):
+                if val is None:
+                    continue
+                keys = self._index[name].get(val, set())
+                candidates = set(keys) if candidates is None else candidates & keys
+            if candidates is None:
+                candidates = self._vouchers.keys()
+
+            entries = []
+            for key in candidates:
+                entry = self._vouchers[key]
+                if state is not None and entry['voucher']['state'] != state:
+                    continue
+                until = entry['valid_until']
+                if after is not None and (until is None or until <= after):
+                    continue
+                if before is not None and (until is None or until >= before):
+                    continue
+                entries.append(entry)
+
+        entries.sort(key=lambda entry: entry['seq'])
+        if last is not None:
+            entries = entries[-last:] if last else []
+        elif first is not None:
+            entries = entries[:first]
+        return [entry['voucher'] for entry in entries]
+
+    def revoke(self, vingd, vouchers, workers=None):
+        """
+        Revokes `vouchers` (a list of voucher dictionaries, as returned by
+        `match`, or just their ``vid_encoded`` ids) one by one, via targeted
+        `Vingd.revoke_vouchers` calls issued from (at most) `workers` parallel
+        threads (see `vingd.limiter.batch_workers`), as `BULK` priority class
+        requests. Successfully revoked vouchers are marked `REVOKED`.
+
+        Note: unlike `Vingd.revoke_vouchers`, an empty `vouchers` list revokes
+        nothing. An empty (or non-string) voucher id raises `InvalidData`
+        before any request is sent (it would revoke all vouchers).
+
+        :rtype: ``dict``
+        :returns:
+            ``{'revoked': {<vid_encoded>: <refund_transfer_id>, ...},
+            'errors': {<vid_encoded>: <exception>, ...}}``
+        """
+        vids = [v.get('vid_encoded') if isinstance(v, dict) else v for v in vouchers]
+        for vid in vids:
+            if not vid or not isinstance(vid, string_types):
+                raise InvalidData("Invalid voucher id: %r." % (vid,))
+        revoked, errors = {}, {}
+        revoke = lambda vid: vingd.revoke_vouchers(vid_encoded=vid)
+        revoke = prioritized(revoke, BULK)
+        for vid, result, error in pmap(revoke, vids, batch_workers(vingd, workers)):
+            if error is not None:
+                errors[vid] = error
+                continue
+            revoked.update(result)
+            with self._lock:
+                entry = self._vouchers.get(vid)
+                if entry is not None and vid in result:
+                    entry['voucher']['state'] = self.REVOKED
+        return {'revoked': revoked, 'errors': errors}